@@ -1,177 +1,1009 @@
 from pathlib import Path
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from functools import wraps
+from itertools import islice
+from datetime import date, datetime, timedelta
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import queue
+import re
 import sqlite3
-from flask import Flask, render_template_string, request, g, redirect
+import threading
+import time
+import zlib
+import click
+from flask import (Flask, render_template, request, g, redirect, url_for, jsonify, make_response, send_file,
+                   stream_with_context, before_render_template, template_rendered)
+from jinja2 import DictLoader, FileSystemBytecodeCache
 import csv
+from assets import ENCODINGS, Assets, compress
+from metrics import QUERY_BUCKETS, Registry
+from migrations import (CANCELED_STATUS, FACET_REBUILD_SQL, MIGRATIONS, ORDER_SUMMARY_SQL, PRICE_BUCKETS,
+                        SALES_CATEGORY_REBUILD_SQL, SALES_SUMMARIES, migrate, schema_version)
+from thumbnails import CONTENT_TYPES, PLACEHOLDER_NAME, PLACEHOLDER_SVG, FetchError, ThumbnailStore, fetch, shrink
 
 BASE = Path(__file__).resolve().parent
 DB_PATH = BASE / 'electronics.db'
 
 def init_db():
-    if DB_PATH.exists():
-        return
+    # creates the database on first run and applies pending migrations; a single PRAGMA when up to date
+    fresh = not DB_PATH.exists()
     con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    sql = (BASE / 'schema.sql').read_text(encoding='utf-8')
-    cur.executescript(sql)
-    # load sample data
-    with open(BASE / 'data' / 'categories.csv', encoding='utf-8') as f:
-        dr = csv.DictReader(f)
-        for r in dr:
-            cur.execute('INSERT OR IGNORE INTO categories(id,name) VALUES(?,?)', (r['id'], r['name']))
-    with open(BASE / 'data' / 'products.csv', encoding='utf-8') as f:
-        dr = csv.DictReader(f)
-        for r in dr:
-            cur.execute('''INSERT OR IGNORE INTO products(id,name,brand,model,spec,price,stock,rating,category_id,description,image)
-                           VALUES(?,?,?,?,?,?,?,?,?,?,?)''', (
-                r['id'], r['name'], r['brand'], r.get('model',''), r.get('spec',''), float(r['price']), int(r['stock']), float(r['rating']), int(r['category_id']), r.get('description',''), r.get('image','')
-            ))
-    with open(BASE / 'data' / 'customers.csv', encoding='utf-8') as f:
-        dr = csv.DictReader(f)
-        for r in dr:
-            cur.execute('INSERT OR IGNORE INTO customers(id,first_name,last_name,phone,email) VALUES(?,?,?,?,?)', (
-                r['id'], r['first_name'], r['last_name'], r['phone'], r['email']
-            ))
-    con.commit()
+    if fresh:
+        con.executescript((BASE / 'schema.sql').read_text(encoding='utf-8'))
+    migrate(con)
+    if fresh:
+        # load sample data
+        for table in ('categories', 'products', 'customers'):
+            import_csv(con, table, BASE / 'data' / f'{table}.csv')
     con.close()
 
+# CSV column -> converter for every table the importer can load; id is the upsert key
+IMPORT_TABLES = {
+    'categories': [('id', int), ('name', str)],
+    'products': [
+        ('id', int), ('name', str), ('brand', str), ('model', str), ('spec', str), ('price', float),
+        ('stock', int), ('rating', float), ('category_id', int), ('description', str), ('image', str),
+    ],
+    'customers': [('id', int), ('first_name', str), ('last_name', str), ('phone', str), ('email', str)],
+}
+
+# statements that rebuild derived data after an import ran with deferred indexes and triggers
+IMPORT_REBUILD_SQL = {
+    'products': (["INSERT INTO products_fts(products_fts) VALUES('rebuild')"] + FACET_REBUILD_SQL + [ORDER_SUMMARY_SQL]
+                 + SALES_CATEGORY_REBUILD_SQL),
+    'customers': ["INSERT INTO customers_fts(customers_fts) VALUES('rebuild')"],
+}
+
+def column_defaults(con, table, columns):
+    # schema DEFAULTs of the numeric columns, e.g. stock and rating 0, used for their blank cells
+    converters = dict(columns)
+    defaults = {}
+    for _, name, _, _, default, _ in con.execute(f'PRAGMA table_info({table})'):
+        if converters.get(name, str) is not str and default is not None:
+            try:
+                defaults[name] = converters[name](default)
+            except ValueError:
+                pass
+    return defaults
+
+def convert_row(columns, r, defaults):
+    values = []
+    for col, conv in columns:
+        value = r.get(col)
+        if value is None or (value == '' and conv is not str):
+            values.append(defaults.get(col))
+        else:
+            values.append(conv(value))
+    return values
+
+def import_csv(con, table, path, batch_size=10000, defer_indexes=False, progress=None):
+    columns = IMPORT_TABLES[table]
+    names = [col for col, _ in columns]
+    updates = ', '.join(f'{col}=excluded.{col}' for col in names if col != 'id')
+    sql = (f"INSERT INTO {table}({', '.join(names)}) VALUES({', '.join('?' * len(names))}) "
+           f"ON CONFLICT(id) DO UPDATE SET {updates}")
+    deferred = []
+    if defer_indexes:
+        deferred = con.execute(
+            "SELECT type, name, sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+            (table,)
+        ).fetchall()
+        with con:
+            for kind, name, _ in deferred:
+                con.execute(f'DROP {kind.upper()} {name}')
+    total = 0
+    try:
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            defaults = column_defaults(con, table, columns)
+            rows = (convert_row(columns, r, defaults) for r in csv.DictReader(f))
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                with con:
+                    con.executemany(sql, batch)
+                total += len(batch)
+                if progress:
+                    progress(total)
+    finally:
+        with con:
+            for _, _, ddl in deferred:
+                con.execute(ddl)
+            if deferred:
+                for stmt in IMPORT_REBUILD_SQL.get(table, []):
+                    con.execute(stmt)
+            # covers loads that ran with the version triggers dropped
+            con.execute('UPDATE data_versions SET version = version + 1 WHERE name = ?', (table,))
+        reference_cache.invalidate(table)
+    return total
+
+# table -> (FROM clause, alias, columns); products and customers keep the import column order,
+# so an exported CSV loads back with import-csv
+EXPORT_TABLES = {
+    'products': ('products p', 'p', [col for col, _ in IMPORT_TABLES['products']]),
+    'customers': ('customers c', 'c', [col for col, _ in IMPORT_TABLES['customers']]),
+    'orders': ('orders o', 'o', ['id', 'customer_id', 'created_at', 'total', 'status', 'item_count', 'items_summary']),
+    'order_items': ('order_items i', 'i', ['id', 'order_id', 'product_id', 'quantity', 'price']),
+}
+EXPORT_FORMATS = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson'}
+
+def export_query(table, status='', date_from='', date_to=''):
+    # the /orders filters (status, date_from, date_to) apply to orders and to the items of those orders
+    source, alias, columns = EXPORT_TABLES[table]
+    where, params = [], []
+    if table in ('orders', 'order_items'):
+        where, params = order_filters(status, date_from, date_to)
+        if where and table == 'order_items':
+            source += ' JOIN orders o ON o.id = i.order_id'
+    sql = f"SELECT {', '.join(f'{alias}.{col}' for col in columns)} FROM {source}"
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    return sql + f' ORDER BY {alias}.id', params, columns
+
+def export_chunks(db, query, fmt, batch_size=1000):
+    # one encoded chunk per fetchmany() batch, so memory stays flat however large the table is
+    sql, params, columns = query
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # the BOM lets Excel detect UTF-8; import-csv reads it back with utf-8-sig
+        buffer.write('\ufeff')
+        writer.writerow(columns)
+        yield buffer.getvalue().encode('utf-8')
+    cursor = db.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        if fmt == 'csv':
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(rows)
+            chunk = buffer.getvalue()
+        else:
+            chunk = ''.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in rows)
+        yield chunk.encode('utf-8')
+
+def gzip_chunks(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31: gzip header and trailer
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def rebuild_sales(con, apply=True):
+    # recomputes every sales summary from orders/order_items and returns {table: rows that differed}
+    mismatches = {}
+    con.execute('BEGIN IMMEDIATE')
+    try:
+        for table, (key, aggregates, select) in SALES_SUMMARIES.items():
+            columns = ', '.join((key,) + aggregates)
+            compared = ', '.join((key,) + tuple(f'ROUND({col}, 2)' if col == 'revenue' else col for col in aggregates))
+            nonzero = ' OR '.join(f'{col} != 0' for col in aggregates)
+            con.execute('DROP TABLE IF EXISTS temp.sales_fresh')
+            con.execute(f'CREATE TEMP TABLE sales_fresh ({columns})')
+            con.execute(f'INSERT INTO sales_fresh({columns}) {select}')
+            mismatches[table] = con.execute(f'''
+                SELECT COUNT(DISTINCT {key}) FROM (
+                    SELECT {key} FROM (SELECT {compared} FROM sales_fresh WHERE {nonzero}
+                                       EXCEPT SELECT {compared} FROM {table} WHERE {nonzero})
+                    UNION ALL
+                    SELECT {key} FROM (SELECT {compared} FROM {table} WHERE {nonzero}
+                                       EXCEPT SELECT {compared} FROM sales_fresh WHERE {nonzero})
+                )
+            ''').fetchone()[0]
+            if apply:
+                con.execute(f'DELETE FROM {table}')
+                con.execute(f'INSERT INTO {table}({columns}) SELECT {columns} FROM sales_fresh')
+        con.execute('DROP TABLE temp.sales_fresh')
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    return mismatches
+
+class ConnectionPool:
+    def __init__(self, path, size, timeout, pre_ping, pragmas):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.pre_ping = pre_ping
+        self.pragmas = pragmas
+        self.pid = os.getpid()
+        # LIFO keeps the most recently used connections (and their warm page caches) in rotation
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.in_use = 0
+
+    def connect(self):
+        con = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        con.row_factory = sqlite3.Row
+        for pragma in self.pragmas:
+            con.execute(f'PRAGMA {pragma}')
+        return con
+
+    def healthy(self, con):
+        try:
+            con.execute('SELECT 1').fetchone()
+        except sqlite3.Error:
+            return False
+        return True
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError('connection pool exhausted')
+        try:
+            con = self._checkout()
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.in_use += 1
+        return con
+
+    def _checkout(self):
+        while True:
+            try:
+                con = self._idle.get_nowait()
+            except queue.Empty:
+                return self.connect()
+            if not self.pre_ping or self.healthy(con):
+                return con
+            con.close()
+
+    def release(self, con):
+        try:
+            if con.in_transaction:
+                con.rollback()
+        except sqlite3.Error:
+            con.close()
+        else:
+            self._idle.put(con)
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    pool = _pool
+    # a pool inherited through fork() is never reused: its connections belong to the parent
+    if pool is None or pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                init_db()
+                cfg = app.config
+                _pool = ConnectionPool(
+                    DB_PATH,
+                    size=cfg['DB_POOL_SIZE'],
+                    timeout=cfg['DB_POOL_TIMEOUT'],
+                    pre_ping=cfg['DB_POOL_PRE_PING'],
+                    pragmas=[
+                        'journal_mode = WAL',
+                        'synchronous = NORMAL',
+                        f"mmap_size = {cfg['DB_MMAP_SIZE']}",
+                        f"cache_size = {cfg['DB_CACHE_SIZE']}",
+                        f"busy_timeout = {int(cfg['DB_POOL_TIMEOUT'] * 1000)}",
+                        'foreign_keys = ON',
+                    ],
+                )
+            pool = _pool
+    return pool
+
+class WriteQueue:
+    """The process's single writer: a thread that runs queued write units in shared transactions.
+
+    Each unit runs inside its own savepoint, so a unit that raises is rolled back alone and its exception
+    is handed to the waiting request; the others in the batch still commit. Results are delivered only
+    after the COMMIT, so one fsync covers the whole batch. A unit's statements are recorded in the
+    submitting request's trace or metrics timings, and so are the BEGIN and COMMIT its batch waited for.
+    """
+
+    def __init__(self, connect, flush_interval, max_batch):
+        self.pid = os.getpid()
+        self.connect = connect
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, unit, args, trace=None, timings=None):
+        future = Future()
+        self._queue.put((unit, args, future, (trace, timings)))
+        return future
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        con = None
+        while True:
+            batch = [item for item in self._next_batch() if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                if con is None:
+                    con = self.connect()
+                    con.isolation_level = None  # transactions and savepoints are issued explicitly below
+                self._commit(con, batch)
+            except Exception as e:
+                # the connection is in an unknown state: fail the batch and reconnect for the next one
+                for _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                if con is not None:
+                    con.close()
+                    con = None
+
+    def _commit(self, con, batch):
+        start = time.perf_counter()
+        try:
+            con.execute('BEGIN IMMEDIATE')
+        except sqlite3.Error as e:
+            for _, _, future, _ in batch:
+                future.set_exception(e)
+            return
+        begin_seconds = time.perf_counter() - start
+        outcomes = []
+        for unit, args, future, observers in batch:
+            record_statement(*observers, 'BEGIN IMMEDIATE', begin_seconds)
+            con.execute('SAVEPOINT unit')
+            try:
+                outcomes.append((future, unit(observed(con, *observers), *args), None))
+            except Exception as e:
+                con.execute('ROLLBACK TO unit')
+                outcomes.append((future, None, e))
+            con.execute('RELEASE unit')
+        start = time.perf_counter()
+        try:
+            con.execute('COMMIT')
+        except sqlite3.Error as e:
+            if con.in_transaction:
+                con.execute('ROLLBACK')
+            for future, _, _ in outcomes:
+                future.set_exception(e)
+            return
+        commit_seconds = time.perf_counter() - start
+        if app.config['METRICS_ENABLED']:
+            write_batch_size.observe(len(batch))
+        # recorded before the result is set, so the request's after_request hooks see it
+        for _, _, _, observers in batch:
+            record_statement(*observers, 'COMMIT', commit_seconds)
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_writer():
+    global _writer
+    writer = _writer
+    # the writer thread does not survive fork(), so every worker starts its own
+    if writer is None or writer.pid != os.getpid():
+        with _writer_lock:
+            if _writer is None or _writer.pid != os.getpid():
+                cfg = app.config
+                _writer = WriteQueue(get_pool().connect, cfg['WRITE_FLUSH_INTERVAL'], cfg['WRITE_BATCH_MAX'])
+            writer = _writer
+    return writer
+
+def write(unit, *args):
+    """Run unit(con, *args) in a write transaction and return its result; the unit's exceptions propagate.
+
+    Units must not commit or roll back themselves. Without WRITE_QUEUE_ENABLED the unit runs on the
+    request's own connection in a transaction of its own.
+    """
+    if not app.config['WRITE_QUEUE_ENABLED']:
+        db = get_db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            result = unit(db, *args)
+        except BaseException:
+            db.rollback()
+            raise
+        db.commit()
+        return result
+    future = get_writer().submit(unit, args, g.get('_trace'), g.get('_query_times'))
+    try:
+        return future.result(timeout=app.config['WRITE_TIMEOUT'])
+    except FutureTimeout:
+        if future.cancel():
+            raise sqlite3.OperationalError('write queue busy')
+        # already running: the outcome is moments away and must not be lost
+        return future.result()
+
+class QueryTrace:
+    """Statements one request ran (text, parameters, milliseconds, rows) plus template render time."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []
+        self.render_ms = 0.0
+        self.render_started = None
+
+    def db_ms(self):
+        return sum(q['ms'] for q in self.queries)
+
+class TracedCursor:
+    # times execute and every fetch, so lazily stepped SELECTs are charged in full
+    def __init__(self, cursor, trace):
+        self._cursor = cursor
+        self._trace = trace
+        self._entry = None
+
+    def _run(self, method, sql, params, logged_params):
+        self._entry = {'sql': sql, 'params': logged_params, 'ms': 0.0, 'rows': 0}
+        self._trace.queries.append(self._entry)
+        start = time.perf_counter()
+        try:
+            method(sql, params)
+        finally:
+            self._entry['ms'] += (time.perf_counter() - start) * 1e3
+        if self._cursor.description is None:
+            self._entry['rows'] = max(self._cursor.rowcount, 0)
+        return self
+
+    def execute(self, sql, params=()):
+        return self._run(self._cursor.execute, sql, params, params)
+
+    def executemany(self, sql, seq_of_params):
+        # only the first parameter set is kept, for EXPLAIN QUERY PLAN in the slow-query log
+        seq_of_params = list(seq_of_params)
+        return self._run(self._cursor.executemany, sql, seq_of_params, seq_of_params[0] if seq_of_params else ())
+
+    def _fetch(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._entry['ms'] += (time.perf_counter() - start) * 1e3
+
+    def fetchone(self):
+        row = self._fetch(self._cursor.fetchone)
+        if row is not None:
+            self._entry['rows'] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._fetch(self._cursor.fetchmany, size or self._cursor.arraysize)
+        self._entry['rows'] += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(self._cursor.fetchall)
+        self._entry['rows'] += len(rows)
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class TracedConnection:
+    # what get_db() hands out while DB_TRACE is on; the pool only ever sees the raw connection
+    def __init__(self, con, trace):
+        self._con = con
+        self._trace = trace
+
+    def execute(self, sql, params=()):
+        return TracedCursor(self._con.cursor(), self._trace).execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return TracedCursor(self._con.cursor(), self._trace).executemany(sql, seq_of_params)
+
+    def _end(self, method, sql):
+        entry = {'sql': sql, 'params': (), 'ms': 0.0, 'rows': 0}
+        self._trace.queries.append(entry)
+        start = time.perf_counter()
+        try:
+            method()
+        finally:
+            entry['ms'] = (time.perf_counter() - start) * 1e3
+
+    def commit(self):
+        self._end(self._con.commit, 'COMMIT')
+
+    def rollback(self):
+        self._end(self._con.rollback, 'ROLLBACK')
+
+    def __getattr__(self, name):
+        return getattr(self._con, name)
+
+class TimedConnection:
+    # what get_db() hands out for metrics alone: seconds per statement up to its first row, cursors unwrapped
+    def __init__(self, con, timings):
+        self._con = con
+        self._timings = timings
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._timings.append(time.perf_counter() - start)
+
+    def execute(self, sql, params=()):
+        return self._timed(self._con.execute, sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self._timed(self._con.executemany, sql, seq_of_params)
+
+    def commit(self):
+        self._timed(self._con.commit)
+
+    def rollback(self):
+        self._timed(self._con.rollback)
+
+    def __getattr__(self, name):
+        return getattr(self._con, name)
+
+def observed(con, trace, timings):
+    # con as seen by one request: traced with DB_TRACE, else timed for metrics, else as is
+    if trace is not None:
+        return TracedConnection(con, trace)
+    if timings is not None:
+        return TimedConnection(con, timings)
+    return con
+
+def record_statement(trace, timings, sql, seconds):
+    # a statement run on the request's behalf outside its connection, e.g. the write queue's COMMIT
+    if trace is not None:
+        trace.queries.append({'sql': sql, 'params': (), 'ms': seconds * 1e3, 'rows': 0})
+    elif timings is not None:
+        timings.append(seconds)
+
 def get_db():
-    db = getattr(g, '_db', None)
+    db = getattr(g, '_db_view', None)
     if db is None:
-        db = g._db = sqlite3.connect(DB_PATH)
-        db.row_factory = sqlite3.Row
-        ensure_orders_status_column(db)
-    return db
+        db = g._db = get_pool().acquire()
+        g._db_view = observed(db, g.get('_trace'), g.get('_query_times'))
+    return g._db_view
 
-ORDER_STATUSES = ['Новый', 'В обработке', 'Отправлен', 'Доставлен', 'Отменен']
+def data_version(db, tables):
+    rows = db.execute(
+        f"SELECT name, version FROM data_versions WHERE name IN ({', '.join('?' * len(tables))})",
+        tables
+    ).fetchall()
+    return sorted((row[0], row[1]) for row in rows)
+
+ORDER_STATUSES = ['Новый', 'В обработке', 'Отправлен', 'Доставлен', CANCELED_STATUS]
 ORDER_STATUS_CLASSES = {
     'Новый': 'new',
     'В обработке': 'processing',
     'Отправлен': 'shipped',
     'Доставлен': 'delivered',
-    'Отменен': 'canceled',
+    CANCELED_STATUS: 'canceled',
 }
 
-def ensure_orders_status_column(db):
-    if getattr(g, '_orders_status_checked', False):
-        return
-    cols = [row['name'] for row in db.execute('PRAGMA table_info(orders)').fetchall()]
-    if 'status' not in cols:
-        db.execute("ALTER TABLE orders ADD COLUMN status TEXT DEFAULT 'Новый'")
-        db.execute("UPDATE orders SET status = 'Новый' WHERE status IS NULL")
-        db.commit()
-    g._orders_status_checked = True
-
 app = Flask(__name__)
+app.config.from_mapping(
+    PAGE_SIZE=50,
+    MAX_PAGE_SIZE=200,
+    AUTOCOMPLETE_LIMIT=10,
+    # rendered-page cache for the catalog and listing views, bounded by entry count and body size
+    PAGE_CACHE_ENABLED=os.environ.get('PAGE_CACHE_ENABLED', '1') != '0',
+    PAGE_CACHE_MAX_ENTRIES=int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', 512)),
+    PAGE_CACHE_MAX_BYTES=int(os.environ.get('PAGE_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+    # directory for compiled template bytecode shared between worker processes; None disables it
+    TEMPLATE_CACHE_DIR=os.environ.get('TEMPLATE_CACHE_DIR'),
+    # connection pool: max connections per process, seconds to wait for a free one (also busy_timeout),
+    # and whether to run a cheap health check before handing an idle connection out
+    DB_POOL_SIZE=int(os.environ.get('DB_POOL_SIZE', 8)),
+    DB_POOL_TIMEOUT=float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+    DB_POOL_PRE_PING=os.environ.get('DB_POOL_PRE_PING', '1') != '0',
+    DB_MMAP_SIZE=256 * 1024 * 1024,
+    DB_CACHE_SIZE=-64 * 1024,  # negative means KiB, i.e. 64 MiB per connection
+    # group commit: request writes go to one writer thread per process, which runs everything queued within
+    # WRITE_FLUSH_INTERVAL seconds (at most WRITE_BATCH_MAX units) in one transaction; a request waits up to
+    # WRITE_TIMEOUT seconds for a unit that has not started yet
+    WRITE_QUEUE_ENABLED=os.environ.get('WRITE_QUEUE_ENABLED', '1') != '0',
+    WRITE_FLUSH_INTERVAL=float(os.environ.get('WRITE_FLUSH_INTERVAL', 0.002)),
+    WRITE_BATCH_MAX=int(os.environ.get('WRITE_BATCH_MAX', 100)),
+    WRITE_TIMEOUT=float(os.environ.get('WRITE_TIMEOUT', 10)),
+    # sales dashboard: default number of days shown and rows per top-N table
+    REPORT_DAYS=30,
+    REPORT_TOP_LIMIT=10,
+    # product thumbnails: local directory, longest side in pixels (resized only when Pillow is installed),
+    # download limits, how long a failed source URL is left alone before it is fetched again, how many
+    # URLs each worker's background fetcher may have waiting, and hosts allowed to resolve to private
+    # addresses (comma-separated; every other host must be public)
+    THUMBNAIL_DIR=os.environ.get('THUMBNAIL_DIR', str(BASE / 'thumbnails')),
+    THUMBNAIL_SIZE=192,
+    THUMBNAIL_FETCH_TIMEOUT=float(os.environ.get('THUMBNAIL_FETCH_TIMEOUT', 5)),
+    THUMBNAIL_MAX_BYTES=5 * 1024 * 1024,
+    THUMBNAIL_RETRY_SECONDS=3600,
+    THUMBNAIL_QUEUE_MAX=100,
+    THUMBNAIL_TRUSTED_HOSTS=frozenset(filter(None, os.environ.get('THUMBNAIL_TRUSTED_HOSTS', '').split(','))),
+    # rows fetched per chunk of /export/<table>.<csv|jsonl>
+    EXPORT_BATCH_SIZE=int(os.environ.get('EXPORT_BATCH_SIZE', 1000)),
+    # per-request SQL tracing: Server-Timing header and a log of statements slower than SLOW_QUERY_MS
+    # with their query plans (to SLOW_QUERY_LOG if set, else the app logger); off costs one config lookup
+    DB_TRACE=os.environ.get('DB_TRACE', '0') != '0',
+    SLOW_QUERY_MS=float(os.environ.get('SLOW_QUERY_MS', 100)),
+    SLOW_QUERY_LOG=os.environ.get('SLOW_QUERY_LOG'),
+    # Prometheus metrics at /metrics; with METRICS_DIR every worker process flushes its numbers there
+    # each METRICS_FLUSH_INTERVAL seconds and a scrape of any worker reports the sum of all of them
+    METRICS_ENABLED=os.environ.get('METRICS_ENABLED', '1') != '0',
+    METRICS_DIR=os.environ.get('METRICS_DIR'),
+    METRICS_FLUSH_INTERVAL=float(os.environ.get('METRICS_FLUSH_INTERVAL', 1)),
+    # compression of HTML, JSON and text responses of at least COMPRESS_MIN_SIZE bytes, as the client's
+    # Accept-Encoding allows; COMPRESS_LEVEL is the gzip level, COMPRESS_BROTLI_QUALITY the brotli one
+    COMPRESS_ENABLED=os.environ.get('COMPRESS_ENABLED', '1') != '0',
+    COMPRESS_MIN_SIZE=int(os.environ.get('COMPRESS_MIN_SIZE', 1024)),
+    COMPRESS_LEVEL=int(os.environ.get('COMPRESS_LEVEL', 6)),
+    COMPRESS_BROTLI_QUALITY=int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4)),
+    COMPRESS_MIMETYPES={'text/html', 'text/plain', 'text/css', 'text/javascript', 'application/javascript',
+                        'application/json'},
+)
+
+# sort key -> (order expression, result column used for the page cursor); a nullable column is sorted
+# through COALESCE, since the cursor's row-value comparison is never true for a NULL key
+PRODUCT_SORTS = {
+    'name': ('p.name', 'name'),
+    'price': ('p.price', 'price'),
+    'rating': ('COALESCE(p.rating, 0)', 'rating_key'),
+    'relevance': ('p.rank', 'rank'),
+}
+# bm25 column weights for products_fts: name, brand, model, spec, description
+SEARCH_WEIGHTS = (10.0, 5.0, 5.0, 1.0, 1.0)
+PAGE_SIZE_CHOICES = [25, 50, 100, 200]
+
+# orders sort key -> (orders column, descending); o.id breaks ties for the page cursor
+ORDER_SORTS = {
+    'created_desc': ('created_at', True),
+    'created_asc': ('created_at', False),
+    'total_desc': ('total', True),
+    'total_asc': ('total', False),
+    'status_asc': ('status', False),
+}
+
+Page = namedtuple('Page', 'rows next_cursor prev_cursor')
+
+class LRUCache:
+    def __init__(self, max_entries, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, size=0):
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            self._evict()
+
+    def grow(self, key, value, size):
+        # counts size more bytes against the entry, if key still holds value (data attached to it later)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] is not value:
+                return
+            self._entries[key] = (value, entry[1] + size)
+            self.size += size
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries or (self.max_bytes is not None and self.size > self.max_bytes):
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.size -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+page_cache = LRUCache(app.config['PAGE_CACHE_MAX_ENTRIES'], app.config['PAGE_CACHE_MAX_BYTES'])
+
+class ReferenceCache:
+    # read-through cache for small, slow-changing lookups; each entry is tagged with the write
+    # counters of its tables and reloaded as soon as they move, or right away after invalidate()
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._loaders = {}
+        self._entries = {}
+        # reentrant: a loader may read other entries (facets use the categories entry)
+        self._lock = threading.RLock()
+
+    def register(self, name, tables, loader):
+        self._loaders[name] = (tables, loader)
+
+    def get(self, db, name):
+        # the counters are checked on every read: a stale entry would otherwise be rendered into
+        # pages that the page cache then stores under the new data version
+        tables, loader = self._loaders[name]
+        versions = data_version(db, tables)
+        entry = self._entries.get(name)
+        if entry is not None and entry[0] == versions:
+            self.hits += 1
+            return entry[1]
+        with self._lock:
+            self.misses += 1
+            value = loader(db)
+            self._entries[name] = (versions, value)
+        return value
+
+    def invalidate(self, *tables):
+        # drops every entry that depends on one of `tables`, or everything when called without arguments
+        for name, (deps, _) in self._loaders.items():
+            if not tables or set(deps) & set(tables):
+                self._entries.pop(name, None)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+reference_cache = ReferenceCache()
+reference_cache.register(
+    'categories', ['categories'],
+    lambda db: tuple(db.execute('SELECT * FROM categories ORDER BY id').fetchall())
+)
+
+def price_bucket_label(lo):
+    i = PRICE_BUCKETS.index(lo)
+    if i + 1 < len(PRICE_BUCKETS):
+        return f'{lo}–{PRICE_BUCKETS[i + 1]}'
+    return f'от {lo}'
+
+def load_facets(db):
+    cat_names = {str(c['id']): c['name'] for c in reference_cache.get(db, 'categories')}
+    facets = {'category': [], 'brand': [], 'price': [], 'rating': []}
+    for row in db.execute('SELECT facet, value, count FROM product_facets WHERE count > 0'):
+        facet, value = row['facet'], row['value']
+        if facet == 'category':
+            label = cat_names.get(value, 'Без категории')
+        elif facet == 'brand':
+            label = value or 'Без бренда'
+        elif facet == 'price':
+            label = price_bucket_label(int(value))
+        else:
+            label = f'{value}+'
+        facets[facet].append({'value': value, 'label': label, 'count': row['count']})
+    facets['category'].sort(key=lambda f: f['label'])
+    facets['brand'].sort(key=lambda f: f['label'])
+    facets['price'].sort(key=lambda f: int(f['value']))
+    facets['rating'].sort(key=lambda f: -int(f['value']))
+    # product_facets counts each whole star; "4+" also covers every higher bucket
+    for higher, f in zip(facets['rating'], facets['rating'][1:]):
+        f['count'] += higher['count']
+    return facets
+
+reference_cache.register('facets', ['products', 'categories'], load_facets)
+
+def reference_data(name):
+    return reference_cache.get(get_db(), name)
+
+metrics = Registry()
+metrics.directory = app.config['METRICS_DIR']
+metrics.flush_interval = app.config['METRICS_FLUSH_INTERVAL']
+http_requests = metrics.counter('http_requests_total', 'HTTP requests by endpoint, method and status',
+                                ('endpoint', 'method', 'status'))
+http_duration = metrics.histogram('http_request_duration_seconds', 'Time to produce a response', ('endpoint',))
+db_query_duration = metrics.histogram('db_query_duration_seconds', 'Time per SQL statement',
+                                      buckets=QUERY_BUCKETS)
+write_batch_size = metrics.histogram('db_write_batch_size', 'Write units committed per group commit',
+                                     buckets=(1, 2, 5, 10, 20, 50, 100))
+orders_created = metrics.counter('orders_created_total', 'Orders placed through the site')
+order_value = metrics.histogram('order_value', 'Total of placed orders',
+                                buckets=(1000, 5000, 10000, 50000, 100000, 500000, 1000000))
+
+def current_pool():
+    pool = _pool
+    return pool if pool is not None and pool.pid == os.getpid() else None
+
+metrics.collector('db_pool_connections_in_use', 'gauge', 'Pooled connections checked out', (),
+                  lambda: {(): current_pool().in_use if current_pool() else 0})
+metrics.collector('db_pool_size', 'gauge', 'Connection pool capacity', (),
+                  lambda: {(): app.config['DB_POOL_SIZE']})
+metrics.collector('cache_hits_total', 'counter', 'Cache lookups answered from the cache', ('cache',),
+                  lambda: {('page',): page_cache.hits, ('reference',): reference_cache.hits})
+metrics.collector('cache_misses_total', 'counter', 'Cache lookups that had to load', ('cache',),
+                  lambda: {('page',): page_cache.misses, ('reference',): reference_cache.misses})
+
+def cache_hit_ratios(values):
+    ratios = {}
+    for cache in ('page', 'reference'):
+        hits = values.get(('cache_hits_total', (cache,)), 0)
+        misses = values.get(('cache_misses_total', (cache,)), 0)
+        if hits + misses:
+            ratios[(cache,)] = round(hits / (hits + misses), 4)
+    return ratios
+
+metrics.derived('cache_hit_ratio', 'Share of cache lookups that were hits', ('cache',), cache_hit_ratios)
+
+def not_modified(etag):
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    return response
+
+def compress_response(response, cache=None):
+    """Encodes the body as the client's Accept-Encoding prefers; `cache` keeps the encoded bodies of a cached page."""
+    cfg = app.config
+    if (not cfg['COMPRESS_ENABLED'] or response.status_code != 200 or response.is_streamed
+            or response.direct_passthrough or 'Content-Encoding' in response.headers
+            or response.mimetype not in cfg['COMPRESS_MIMETYPES']):
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    if encoding is None or len(body) < cfg['COMPRESS_MIN_SIZE']:
+        return response
+    encoded = cache.get(encoding) if cache is not None else None
+    if encoded is None:
+        encoded = compress(body, encoding, cfg['COMPRESS_BROTLI_QUALITY'] if encoding == 'br' else cfg['COMPRESS_LEVEL'])
+        if cache is not None:
+            cache[encoding] = encoded
+    response.set_data(encoded)
+    response.content_encoding = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # other bytes, same content: a weak validator still matches If-None-Match of either representation
+        response.set_etag(etag, weak=True)
+    return response
+
+def cached_page(tables, args, resolve=None):
+    # caches the rendered body under (endpoint, build fingerprint, normalized args, write counters of
+    # `tables`); any write to those tables or a new deploy changes the key, so stale entries are simply
+    # never hit again. resolve() adds what else the page depends on, such as defaults taken from the clock
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*view_args, **view_kwargs):
+            if not app.config['PAGE_CACHE_ENABLED']:
+                return view(*view_args, **view_kwargs)
+            versions = data_version(get_db(), tables)
+            normalized = []
+            for name in args:
+                value = request.args.get(name, '').strip()
+                if value:
+                    normalized.append((name, value))
+            key = (request.endpoint, BUILD_FINGERPRINT, tuple(sorted(view_kwargs.items())), tuple(normalized),
+                   tuple(versions), resolve() if resolve else None)
+            etag = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+            if request.if_none_match.contains_weak(etag):
+                return not_modified(etag)
+            entry = page_cache.get(key)
+            if entry is None:
+                response = make_response(view(*view_args, **view_kwargs))
+                if response.status_code != 200:
+                    return response
+                # the last item collects compressed copies of the body as clients ask for them
+                entry = (response.get_data(), response.mimetype, int(time.time()), {})
+                page_cache.set(key, entry, len(entry[0]))
+            body, mimetype, modified, encoded = entry
+            response = app.response_class(body, mimetype=mimetype)
+            response.set_etag(etag)
+            response.last_modified = modified
+            response.cache_control.no_cache = True
+            stored = len(encoded)
+            response = compress_response(response, encoded)
+            if len(encoded) > stored:
+                # compressed copies count towards PAGE_CACHE_MAX_BYTES like the body they were made from
+                page_cache.grow(key, entry, len(encoded[response.content_encoding]))
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(token, size=2):
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except ValueError:
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+def fts_query(q):
+    # every word becomes a quoted prefix term, so user input never hits FTS5 query syntax
+    return ' '.join(f'"{term}"*' for term in re.findall(r'\w+', q))
+
+def get_page_size():
+    try:
+        per_page = int(request.args.get('per_page', app.config['PAGE_SIZE']))
+    except ValueError:
+        per_page = app.config['PAGE_SIZE']
+    return max(1, min(per_page, app.config['MAX_PAGE_SIZE']))
+
+def keyset_page(db, sql, where, params, keys, per_page, after=None, before=None, descending=False):
+    # keys: [(sql expression, row column)], the last one must be unique (normally the id)
+    where = list(where)
+    params = list(params)
+    cursor = before if before is not None else after
+    if cursor is not None:
+        op = '>' if (before is None) != descending else '<'
+        exprs = ', '.join(expr for expr, _ in keys)
+        # SQLite does not seek an index on a row-value comparison over expressions, so a plain bound
+        # on the leading key comes first; the row value then breaks ties
+        if len(keys) > 1:
+            where.append(f'{keys[0][0]} {op}= ?')
+            params.append(cursor[0])
+        where.append(f"({exprs}) {op} ({', '.join('?' * len(keys))})")
+        params += cursor
+    reverse = before is not None
+    direction = 'DESC' if descending != reverse else 'ASC'
+    where_sql = ('WHERE ' + ' AND '.join(where)) if where else ''
+    order_sql = ', '.join(f'{expr} {direction}' for expr, _ in keys)
+    rows = db.execute(f'{sql} {where_sql} ORDER BY {order_sql} LIMIT ?', params + [per_page + 1]).fetchall()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if reverse:
+        rows.reverse()
+    has_next = reverse or has_more
+    has_prev = has_more if reverse else after is not None
+    next_cursor = prev_cursor = None
+    if rows and has_next:
+        next_cursor = encode_cursor(rows[-1][col] for _, col in keys)
+    if rows and has_prev:
+        prev_cursor = encode_cursor(rows[0][col] for _, col in keys)
+    return Page(rows, next_cursor, prev_cursor)
 
 INDEX_HTML = '''
 <!doctype html>
 <html lang="ru">
 <head>
 <title>Electronics Store — Прототип</title>
-<style>
-:root {
-    --bg: #f6f4f1;
-    --paper: #ffffff;
-    --ink: #1f2a37;
-    --muted: #6b7280;
-    --line: #e5e7eb;
-    --accent: #b45309;
-}
-body {
-    font-family: "Trebuchet MS", "Lucida Sans Unicode", "Lucida Grande", sans-serif;
-    background-color: var(--bg);
-    margin: 24px;
-    color: var(--ink);
-}
-h2 {
-    color: var(--ink);
-    text-align: center;
-    letter-spacing: 0.3px;
-}
-form {
-    background-color: var(--paper);
-    padding: 16px;
-    border-radius: 12px;
-    box-shadow: 0 8px 24px rgba(31, 41, 55, 0.08);
-    margin-bottom: 16px;
-    display: flex;
-    flex-wrap: wrap;
-    gap: 12px;
-    align-items: center;
-    border: 1px solid var(--line);
-}
-form input, form select, form button {
-    padding: 8px 10px;
-    border: 1px solid var(--line);
-    border-radius: 8px;
-    background: #fff;
-}
-form input, form select {
-    color: var(--ink);
-}
-form button {
-    background-color: var(--ink);
-    color: #fff;
-    cursor: pointer;
-    border: none;
-}
-form button:hover {
-    background-color: #111827;
-}
-table {
-    width: 100%;
-    border-collapse: separate;
-    border-spacing: 0;
-    background-color: var(--paper);
-    box-shadow: 0 8px 24px rgba(31, 41, 55, 0.08);
-    border-radius: 12px;
-    overflow: hidden;
-    border: 1px solid var(--line);
-}
-nav.actions {
-    display: flex;
-    flex-wrap: wrap;
-    gap: 10px 16px;
-    justify-content: center;
-    margin: 6px 0 18px;
-    font-size: 13px;
-    color: var(--muted);
-}
-nav.actions a {
-    color: var(--ink);
-    text-decoration: none;
-    font-weight: 600;
-    padding: 4px 0;
-    border-bottom: 2px solid transparent;
-}
-nav.actions a:hover {
-    border-bottom-color: var(--accent);
-}
-th, td {
-    padding: 12px 14px;
-    text-align: left;
-    border-bottom: 1px solid var(--line);
-}
-th {
-    background-color: #f3f4f6;
-    color: var(--ink);
-    font-weight: 700;
-    text-transform: uppercase;
-    font-size: 12px;
-    letter-spacing: 0.6px;
-}
-tr:nth-child(even) {
-    background-color: #fafafa;
-}
-tr:hover {
-    background-color: #fef3c7;
-}
-img {
-    max-width: 96px;
-    height: auto;
-    border-radius: 8px;
-}
-</style>
+<link rel="stylesheet" href="{{ asset_url('store.css') }}">
 </head>
 <body>
 <h2>Товары</h2>
@@ -181,18 +1013,23 @@ img {
   <a href="/customers">Просмотр клиентов</a>
   <a href="/add_order">Добавить новый заказ</a>
   <a href="/orders">Просмотр заказов</a>
+  <a href="/reports">Отчёты о продажах</a>
 </nav>
-<form method="get">
-  Поиск: <input name="q" value="{{q}}" placeholder="Поиск по названию, описанию или бренду"> 
-  Категория: <select name="cat"><option value="">Все</option>{% for c in cats %}<option value="{{c.id}}" {% if cat and cat|int == c.id %}selected{% endif %}>{{c.name}}</option>{% endfor %}</select>
-  Сортировка: <select name="sort"><option value="name">Название</option><option value="price">Цена</option><option value="rating">Рейтинг</option></select>
+<form class="panel" method="get">
+  Поиск: <input name="q" value="{{q}}" placeholder="Поиск по названию, бренду, модели или описанию"> 
+  Категория: <select name="cat"><option value="">Все</option>{% for f in facets.category %}<option value="{{f.value}}" {% if cat == f.value %}selected{% endif %}>{{f.label}} ({{f.count}})</option>{% endfor %}</select>
+  Бренд: <select name="brand"><option value="">Все</option>{% for f in facets.brand %}<option value="{{f.value}}" {% if brand == f.value %}selected{% endif %}>{{f.label}} ({{f.count}})</option>{% endfor %}</select>
+  Цена: <select name="price"><option value="">Любая</option>{% for f in facets.price %}<option value="{{f.value}}" {% if price == f.value %}selected{% endif %}>{{f.label}} ({{f.count}})</option>{% endfor %}</select>
+  Рейтинг: <select name="rating"><option value="">Любой</option>{% for f in facets.rating %}<option value="{{f.value}}" {% if rating == f.value %}selected{% endif %}>{{f.label}} ({{f.count}})</option>{% endfor %}</select>
+  Сортировка: <select name="sort">{% if q %}<option value="relevance" {% if sort == 'relevance' %}selected{% endif %}>Релевантность</option>{% endif %}<option value="name" {% if sort == 'name' %}selected{% endif %}>Название</option><option value="price" {% if sort == 'price' %}selected{% endif %}>Цена</option><option value="rating" {% if sort == 'rating' %}selected{% endif %}>Рейтинг</option></select>
+  На странице: <select name="per_page">{% for n in page_sizes %}<option value="{{n}}" {% if n == per_page %}selected{% endif %}>{{n}}</option>{% endfor %}</select>
   <button>Применить</button>
 </form>
 <table>
 <tr><th>Изображение</th><th>Название</th><th>Бренд</th><th>Модель/Спецификация</th><th>Описание</th><th>Цена</th><th>Запас</th><th>Рейтинг</th><th>Категория</th><th>Действия</th></tr>
 {% for p in products %}
 <tr>
-  <td>{% if p.image %}<img src="{{p.image}}" alt="{{p.name}}">{% endif %}</td>
+  <td>{% if p.image %}<img src="{{ '/thumbs/' ~ thumbs[p.image] if p.image in thumbs else '/products/%d/thumbnail' % p.id }}" alt="{{p.name}}" loading="lazy" width="96" height="96">{% endif %}</td>
   <td>{{p.name}}</td>
   <td>{{p.brand}}</td>
   <td>{{p.model}} {{p.spec}}</td>
@@ -205,6 +1042,10 @@ img {
 </tr>
 {% endfor %}
 </table>
+<nav class="pager">
+  {% if prev_url %}<a href="{{prev_url}}">&larr; Назад</a>{% endif %}
+  {% if next_url %}<a href="{{next_url}}">Вперёд &rarr;</a>{% endif %}
+</nav>
 </body>
 </html>
 '''
@@ -214,43 +1055,11 @@ ADD_PRODUCT_HTML = '''
 <html lang="ru">
 <head>
 <title>Add Product — Electronics Store</title>
-<style>
-body { font-family: Arial, sans-serif; background-color: #f4f4f4; margin: 20px; }
-h2 { color: #2c3e50; text-align: center; }
-form { background-color: #fff; padding: 20px; border-radius: 8px; box-shadow: 0 0 10px rgba(0,0,0,0.1); max-width: 600px; margin: 0 auto; }
-form input, form select, form textarea { width: 100%; padding: 8px; margin: 5px 0; border: 1px solid #ddd; border-radius: 4px; }
-form button { background-color: #3498db; color: white; padding: 10px; border: none; border-radius: 4px; cursor: pointer; width: 100%; }
-form button:hover { background-color: #2980b9; }
-.btn-link { display: inline-block; padding: 8px 14px; border-radius: 999px; background: #eef2f7; color: #2c3e50; text-decoration: none; font-weight: 600; }
-.btn-link:hover { background: #e2e8f0; }
-/* Base theme */
-:root { --bg: #f6f4f1; --paper: #ffffff; --ink: #1f2a37; --muted: #6b7280; --line: #e5e7eb; --accent: #b45309; }
-body { font-family: "Trebuchet MS", "Lucida Sans Unicode", "Lucida Grande", sans-serif; background-color: var(--bg); margin: 24px; color: var(--ink); }
-h2 { color: var(--ink); text-align: center; letter-spacing: 0.3px; }
-form { background-color: var(--paper); padding: 16px; border-radius: 12px; box-shadow: 0 8px 24px rgba(31, 41, 55, 0.08); margin-bottom: 16px; border: 1px solid var(--line); }
-form input, form select, form textarea, form button { padding: 8px 10px; border: 1px solid var(--line); border-radius: 8px; background: #fff; color: var(--ink); }
-form button { background-color: var(--ink); color: #fff; cursor: pointer; border: none; }
-form button:hover { background-color: #111827; }
-.btn-link { display: inline-block; padding: 8px 14px; border-radius: 999px; background: #eef2f7; color: #2c3e50; text-decoration: none; font-weight: 600; }
-.btn-link:hover { background: #e2e8f0; }
-/* Base theme */
-:root { --bg: #f6f4f1; --paper: #ffffff; --ink: #1f2a37; --muted: #6b7280; --line: #e5e7eb; --accent: #b45309; }
-body { font-family: "Trebuchet MS", "Lucida Sans Unicode", "Lucida Grande", sans-serif; background-color: var(--bg); margin: 24px; color: var(--ink); }
-h2 { color: var(--ink); text-align: center; letter-spacing: 0.3px; }
-form { background-color: var(--paper); padding: 16px; border-radius: 12px; box-shadow: 0 8px 24px rgba(31, 41, 55, 0.08); margin-bottom: 16px; display: flex; flex-wrap: wrap; gap: 12px; align-items: center; border: 1px solid var(--line); }
-form input, form select, form textarea, form button { padding: 8px 10px; border: 1px solid var(--line); border-radius: 8px; background: #fff; color: var(--ink); }
-form button { background-color: var(--ink); color: #fff; cursor: pointer; border: none; }
-form button:hover { background-color: #111827; }
-table { width: 100%; border-collapse: separate; border-spacing: 0; background-color: var(--paper); box-shadow: 0 8px 24px rgba(31, 41, 55, 0.08); border-radius: 12px; overflow: hidden; border: 1px solid var(--line); }
-th, td { padding: 12px 14px; text-align: left; border-bottom: 1px solid var(--line); }
-th { background-color: #f3f4f6; color: var(--ink); font-weight: 700; text-transform: uppercase; font-size: 12px; letter-spacing: 0.6px; }
-tr:nth-child(even) { background-color: #fafafa; }
-tr:hover { background-color: #fef3c7; }
-</style>
+<link rel="stylesheet" href="{{ asset_url('store.css') }}">
 </head>
 <body>
 <h2>Добавить новый товар</h2>
-<form method="post">
+<form class="editor stack" method="post">
   <input name="name" placeholder="Название товара" required>
   <input name="brand" placeholder="Бренд">
   <input name="model" placeholder="Модель">
@@ -278,30 +1087,11 @@ ADD_CUSTOMER_HTML = '''
 <html lang="ru">
 <head>
 <title>Add Customer — Electronics Store</title>
-<style>
-body { font-family: Arial, sans-serif; background-color: #f4f4f4; margin: 20px; }
-h2 { color: #2c3e50; text-align: center; }
-form { background-color: #fff; padding: 20px; border-radius: 8px; box-shadow: 0 0 10px rgba(0,0,0,0.1); max-width: 600px; margin: 0 auto; }
-form input { width: 100%; padding: 8px; margin: 5px 0; border: 1px solid #ddd; border-radius: 4px; }
-form button { background-color: #3498db; color: white; padding: 10px; border: none; border-radius: 4px; cursor: pointer; width: 100%; }
-form button:hover { background-color: #2980b9; }
-.btn-link { display: inline-block; padding: 8px 14px; border-radius: 999px; background: #eef2f7; color: #2c3e50; text-decoration: none; font-weight: 600; }
-.btn-link:hover { background: #e2e8f0; }
-/* Base theme */
-:root { --bg: #f6f4f1; --paper: #ffffff; --ink: #1f2a37; --muted: #6b7280; --line: #e5e7eb; --accent: #b45309; }
-body { font-family: "Trebuchet MS", "Lucida Sans Unicode", "Lucida Grande", sans-serif; background-color: var(--bg); margin: 24px; color: var(--ink); }
-h2 { color: var(--ink); text-align: center; letter-spacing: 0.3px; }
-form { background-color: var(--paper); padding: 16px; border-radius: 12px; box-shadow: 0 8px 24px rgba(31, 41, 55, 0.08); margin-bottom: 16px; border: 1px solid var(--line); }
-form input, form select, form textarea, form button { padding: 8px 10px; border: 1px solid var(--line); border-radius: 8px; background: #fff; color: var(--ink); }
-form button { background-color: var(--ink); color: #fff; cursor: pointer; border: none; }
-form button:hover { background-color: #111827; }
-.btn-link { display: inline-block; padding: 8px 14px; border-radius: 999px; background: #eef2f7; color: #2c3e50; text-decoration: none; font-weight: 600; }
-.btn-link:hover { background: #e2e8f0; }
-</style>
+<link rel="stylesheet" href="{{ asset_url('store.css') }}">
 </head>
 <body>
 <h2>Добавить нового клиента</h2>
-<form method="post">
+<form class="editor stack" method="post">
   <input name="first_name" placeholder="Имя" required>
   <input name="last_name" placeholder="Фамилия" required>
   <input name="phone" placeholder="Телефон" required>
@@ -318,32 +1108,7 @@ CUSTOMERS_HTML = '''
 <html lang="ru">
 <head>
 <title>Customers — Electronics Store</title>
-<style>
-body { font-family: Arial, sans-serif; background-color: #f4f4f4; margin: 20px; }
-h2 { color: #2c3e50; text-align: center; }
-table { width: 100%; border-collapse: collapse; background-color: #fff; box-shadow: 0 0 10px rgba(0,0,0,0.1); border-radius: 8px; overflow: hidden; }
-th, td { padding: 12px; text-align: left; border-bottom: 1px solid #ddd; }
-th { background-color: #34495e; color: white; }
-tr:nth-child(even) { background-color: #f9f9f9; }
-tr:hover { background-color: #e8f4fd; }
-.btn-link { display: inline-block; padding: 8px 14px; border-radius: 999px; background: #eef2f7; color: #2c3e50; text-decoration: none; font-weight: 600; }
-.btn-link:hover { background: #e2e8f0; }
-/* Base theme */
-:root { --bg: #f6f4f1; --paper: #ffffff; --ink: #1f2a37; --muted: #6b7280; --line: #e5e7eb; --accent: #b45309; }
-body { font-family: "Trebuchet MS", "Lucida Sans Unicode", "Lucida Grande", sans-serif; background-color: var(--bg); margin: 24px; color: var(--ink); }
-h2 { color: var(--ink); text-align: center; letter-spacing: 0.3px; }
-form { background-color: var(--paper); padding: 16px; border-radius: 12px; box-shadow: 0 8px 24px rgba(31, 41, 55, 0.08); margin-bottom: 16px; display: flex; flex-wrap: wrap; gap: 12px; align-items: center; border: 1px solid var(--line); }
-form input, form select, form textarea, form button { padding: 8px 10px; border: 1px solid var(--line); border-radius: 8px; background: #fff; color: var(--ink); }
-form button { background-color: var(--ink); color: #fff; cursor: pointer; border: none; }
-form button:hover { background-color: #111827; }
-table { width: 100%; border-collapse: separate; border-spacing: 0; background-color: var(--paper); box-shadow: 0 8px 24px rgba(31, 41, 55, 0.08); border-radius: 12px; overflow: hidden; border: 1px solid var(--line); }
-th, td { padding: 12px 14px; text-align: left; border-bottom: 1px solid var(--line); }
-th { background-color: #f3f4f6; color: var(--ink); font-weight: 700; text-transform: uppercase; font-size: 12px; letter-spacing: 0.6px; }
-tr:nth-child(even) { background-color: #fafafa; }
-tr:hover { background-color: #fef3c7; }
-.btn-link { display: inline-block; padding: 8px 14px; border-radius: 999px; background: #eef2f7; color: #2c3e50; text-decoration: none; font-weight: 600; }
-.btn-link:hover { background: #e2e8f0; }
-</style>
+<link rel="stylesheet" href="{{ asset_url('store.css') }}">
 </head>
 <body>
 <h2>Клиенты</h2>
@@ -370,60 +1135,16 @@ ADD_ORDER_HTML = '''
 <html lang="ru">
 <head>
 <title>Add Order — Electronics Store</title>
-<style>
-body { font-family: Arial, sans-serif; background-color: #f4f4f4; margin: 20px; }
-h2 { color: #2c3e50; text-align: center; }
-form { background-color: #fff; padding: 20px; border-radius: 8px; box-shadow: 0 0 10px rgba(0,0,0,0.1); max-width: 800px; margin: 0 auto; }
-form select, form input { padding: 8px; margin: 5px 0; border: 1px solid #ddd; border-radius: 4px; }
-.product-row { display: flex; align-items: center; margin: 10px 0; }
-.product-row select, .product-row input { margin-right: 10px; }
-button { background-color: #3498db; color: white; padding: 10px; border: none; border-radius: 4px; cursor: pointer; }
-button:hover { background-color: #2980b9; }
-.add-product { margin-top: 10px; }
-.btn-link { display: inline-block; padding: 8px 14px; border-radius: 999px; background: #eef2f7; color: #2c3e50; text-decoration: none; font-weight: 600; }
-.btn-link:hover { background: #e2e8f0; }
-/* Base theme */
-:root { --bg: #f6f4f1; --paper: #ffffff; --ink: #1f2a37; --muted: #6b7280; --line: #e5e7eb; --accent: #b45309; }
-body { font-family: "Trebuchet MS", "Lucida Sans Unicode", "Lucida Grande", sans-serif; background-color: var(--bg); margin: 24px; color: var(--ink); }
-h2 { color: var(--ink); text-align: center; letter-spacing: 0.3px; }
-form { background-color: var(--paper); padding: 16px; border-radius: 12px; box-shadow: 0 8px 24px rgba(31, 41, 55, 0.08); margin-bottom: 16px; border: 1px solid var(--line); }
-form input, form select, form textarea, form button { padding: 8px 10px; border: 1px solid var(--line); border-radius: 8px; background: #fff; color: var(--ink); }
-form button { background-color: var(--ink); color: #fff; cursor: pointer; border: none; }
-form button:hover { background-color: #111827; }
-.btn-link { display: inline-block; padding: 8px 14px; border-radius: 999px; background: #eef2f7; color: #2c3e50; text-decoration: none; font-weight: 600; }
-.btn-link:hover { background: #e2e8f0; }
-</style>
-<script>
-function addProduct() {
-    const container = document.getElementById('products-container');
-    const row = document.createElement('div');
-    row.className = 'product-row';
-    row.innerHTML = `
-        <select name="product_ids">
-            <option value="">Select Product</option>
-            {% for p in products %}
-            <option value="{{p.id}}">{{p.name}} ({{p.price}})</option>
-            {% endfor %}
-        </select>
-        <input name="quantities" type="number" min="1" placeholder="Quantity" required>
-        <button type="button" onclick="removeProduct(this)">Remove</button>
-    `;
-    container.appendChild(row);
-}
-function removeProduct(btn) {
-    btn.parentElement.remove();
-}
-</script>
+<link rel="stylesheet" href="{{ asset_url('store.css') }}">
+<script src="{{ asset_url('store.js') }}" defer></script>
 </head>
 <body>
 <h2>Добавить новый заказ</h2>
-<form method="post">
-  <select name="customer_id" required>
-    <option value="">Выберите клиента</option>
-    {% for c in customers %}
-    <option value="{{c.id}}">{{c.first_name}} {{c.last_name}} ({{c.email}})</option>
-    {% endfor %}
-  </select>
+<form class="editor wide" method="post">
+  <div class="product-row">
+    <input type="search" class="lookup" data-source="/autocomplete/customers" placeholder="Поиск клиента" autocomplete="off">
+    <select name="customer_id" required><option value="">Выберите клиента</option></select>
+  </div>
   <select name="status" required>
     {% for s in order_statuses %}
     <option value="{{s}}">{{s}}</option>
@@ -431,12 +1152,8 @@ function removeProduct(btn) {
   </select>
   <div id="products-container">
     <div class="product-row">
-      <select name="product_ids" required>
-        <option value="">Выберите товар</option>
-        {% for p in products %}
-        <option value="{{p.id}}">{{p.name}} ({{p.price}})</option>
-        {% endfor %}
-      </select>
+      <input type="search" class="lookup" data-source="/autocomplete/products" placeholder="Поиск товара" autocomplete="off">
+      <select name="product_ids" required><option value="">Выберите товар</option></select>
       <input name="quantities" type="number" min="1" placeholder="Количество" required>
     </div>
   </div>
@@ -454,44 +1171,8 @@ ORDERS_HTML = '''
 <html lang="ru">
 <head>
 <title>Orders — Electronics Store</title>
-<style>
-:root { --bg: #f6f4f1; --paper: #ffffff; --ink: #1f2a37; --muted: #6b7280; --line: #e5e7eb; --accent: #b45309; }
-body { font-family: "Trebuchet MS", "Lucida Sans Unicode", "Lucida Grande", sans-serif; background-color: var(--bg); margin: 24px; color: var(--ink); }
-h2 { color: var(--ink); text-align: center; letter-spacing: 0.3px; }
-form.filter { background-color: var(--paper); padding: 12px; border-radius: 12px; box-shadow: 0 8px 24px rgba(31, 41, 55, 0.08); margin-bottom: 16px; display: flex; gap: 12px; flex-wrap: wrap; align-items: center; border: 1px solid var(--line); }
-form.filter label { font-size: 13px; color: var(--muted); }
-form.filter select, form.filter input { padding: 8px 10px; border: 1px solid var(--line); border-radius: 8px; background: #fff; color: var(--ink); }
-form.filter button { background-color: var(--ink); color: #fff; border: none; border-radius: 8px; padding: 8px 12px; cursor: pointer; }
-form.filter button:hover { background-color: #111827; }
-table { width: 100%; border-collapse: separate; border-spacing: 0; background-color: var(--paper); box-shadow: 0 8px 24px rgba(31, 41, 55, 0.08); border-radius: 12px; overflow: hidden; border: 1px solid var(--line); }
-th, td { padding: 12px 14px; text-align: left; border-bottom: 1px solid var(--line); }
-th { background-color: #f3f4f6; color: var(--ink); font-weight: 700; text-transform: uppercase; font-size: 12px; letter-spacing: 0.6px; }
-tr:nth-child(even) { background-color: #fafafa; }
-tr:hover { background-color: #fef3c7; }
-.status-select { padding: 6px; border-radius: 16px; border: 1px solid #ddd; font-weight: 600; cursor: pointer; }
-.status-new { background: #e3f2fd; color: #1565c0; }
-.status-processing { background: #fff8e1; color: #8d6e63; }
-.status-shipped { background: #ede7f6; color: #5e35b1; }
-.status-delivered { background: #e8f5e9; color: #2e7d32; }
-.status-canceled { background: #ffebee; color: #c62828; }
-.btn-link { display: inline-block; padding: 8px 14px; border-radius: 999px; background: #eef2f7; color: #2c3e50; text-decoration: none; font-weight: 600; }
-.btn-link:hover { background: #e2e8f0; }
-</style>
-<script>
-function updateStatusClass(selectEl) {
-    const option = selectEl.options[selectEl.selectedIndex];
-    const cls = option.getAttribute('data-status-class') || 'new';
-    selectEl.className = 'status-select status-' + cls;
-    if (selectEl.form) {
-        selectEl.form.submit();
-    }
-}
-window.addEventListener('DOMContentLoaded', () => {
-    document.querySelectorAll('.status-select').forEach((selectEl) => {
-        selectEl.addEventListener('change', () => updateStatusClass(selectEl));
-    });
-});
-</script>
+<link rel="stylesheet" href="{{ asset_url('store.css') }}">
+<script src="{{ asset_url('store.js') }}" defer></script>
 </head>
 <body>
 <h2>Заказы</h2>
@@ -521,10 +1202,21 @@ window.addEventListener('DOMContentLoaded', () => {
   </label>
   <button type="submit">Применить</button>
 </form>
+<form class="filter" id="bulk-form" method="post" action="/orders/bulk_status">
+  <label>Выбранным заказам статус:
+    <select name="status">
+      {% for s in order_statuses %}
+      <option value="{{s}}">{{s}}</option>
+      {% endfor %}
+    </select>
+  </label>
+  <button type="submit">Изменить</button>
+</form>
 <table>
-<tr><th>ID</th><th>Клиент</th><th>Дата создания</th><th>Сумма</th><th>Статус</th><th>Товары</th></tr>
+<tr><th><input type="checkbox" id="select-all"></th><th>ID</th><th>Клиент</th><th>Дата создания</th><th>Сумма</th><th>Статус</th><th>Позиций</th><th>Товары</th></tr>
 {% for o in orders %}
 <tr>
+  <td><input type="checkbox" name="order_ids" value="{{o.id}}" form="bulk-form"></td>
   <td><a href="/orders/{{o.id}}">{{o.id}}</a></td>
   <td>{{o.first_name}} {{o.last_name}} ({{o.email}})</td>
   <td>{{o.created_at}}</td>
@@ -539,10 +1231,15 @@ window.addEventListener('DOMContentLoaded', () => {
       </select>
     </form>
   </td>
-  <td>{{o.items or 'Нет товаров'}}</td>
+  <td>{{o.item_count}}</td>
+  <td>{{o.items_summary or 'Нет товаров'}}</td>
 </tr>
 {% endfor %}
 </table>
+<nav class="pager">
+  {% if prev_url %}<a href="{{prev_url}}">&larr; Назад</a>{% endif %}
+  {% if next_url %}<a href="{{next_url}}">Вперёд &rarr;</a>{% endif %}
+</nav>
 <p><a class="btn-link" href="/">Назад к товарам</a></p>
 </body>
 </html>
@@ -553,51 +1250,8 @@ ORDER_DETAIL_HTML = '''
 <html lang="ru">
 <head>
 <title>Order Details — Electronics Store</title>
-<style>
-body { font-family: Arial, sans-serif; background-color: #f4f4f4; margin: 20px; }
-h2 { color: #2c3e50; text-align: center; }
-.card { background-color: #fff; padding: 16px; border-radius: 8px; box-shadow: 0 0 10px rgba(0,0,0,0.1); margin-bottom: 16px; }
-.row { display: flex; flex-wrap: wrap; gap: 16px; }
-table { width: 100%; border-collapse: collapse; background-color: #fff; box-shadow: 0 0 10px rgba(0,0,0,0.1); border-radius: 8px; overflow: hidden; }
-th, td { padding: 12px; text-align: left; border-bottom: 1px solid #ddd; }
-th { background-color: #34495e; color: white; }
-.status-select { padding: 6px; border-radius: 16px; border: 1px solid #ddd; font-weight: 600; cursor: pointer; }
-.status-new { background: #e3f2fd; color: #1565c0; }
-.status-processing { background: #fff8e1; color: #8d6e63; }
-.status-shipped { background: #ede7f6; color: #5e35b1; }
-.status-delivered { background: #e8f5e9; color: #2e7d32; }
-.status-canceled { background: #ffebee; color: #c62828; }
-/* Base theme */
-:root { --bg: #f6f4f1; --paper: #ffffff; --ink: #1f2a37; --muted: #6b7280; --line: #e5e7eb; --accent: #b45309; }
-body { font-family: "Trebuchet MS", "Lucida Sans Unicode", "Lucida Grande", sans-serif; background-color: var(--bg); margin: 24px; color: var(--ink); }
-h2 { color: var(--ink); text-align: center; letter-spacing: 0.3px; }
-form { background-color: var(--paper); padding: 16px; border-radius: 12px; box-shadow: 0 8px 24px rgba(31, 41, 55, 0.08); margin-bottom: 16px; display: flex; flex-wrap: wrap; gap: 12px; align-items: center; border: 1px solid var(--line); }
-form input, form select, form textarea, form button { padding: 8px 10px; border: 1px solid var(--line); border-radius: 8px; background: #fff; color: var(--ink); }
-form button { background-color: var(--ink); color: #fff; cursor: pointer; border: none; }
-form button:hover { background-color: #111827; }
-table { width: 100%; border-collapse: separate; border-spacing: 0; background-color: var(--paper); box-shadow: 0 8px 24px rgba(31, 41, 55, 0.08); border-radius: 12px; overflow: hidden; border: 1px solid var(--line); }
-th, td { padding: 12px 14px; text-align: left; border-bottom: 1px solid var(--line); }
-th { background-color: #f3f4f6; color: var(--ink); font-weight: 700; text-transform: uppercase; font-size: 12px; letter-spacing: 0.6px; }
-tr:nth-child(even) { background-color: #fafafa; }
-tr:hover { background-color: #fef3c7; }
-.btn-link { display: inline-block; padding: 8px 14px; border-radius: 999px; background: #eef2f7; color: #2c3e50; text-decoration: none; font-weight: 600; }
-.btn-link:hover { background: #e2e8f0; }
-</style>
-<script>
-function updateStatusClass(selectEl) {
-    const option = selectEl.options[selectEl.selectedIndex];
-    const cls = option.getAttribute('data-status-class') || 'new';
-    selectEl.className = 'status-select status-' + cls;
-    if (selectEl.form) {
-        selectEl.form.submit();
-    }
-}
-window.addEventListener('DOMContentLoaded', () => {
-    document.querySelectorAll('.status-select').forEach((selectEl) => {
-        selectEl.addEventListener('change', () => updateStatusClass(selectEl));
-    });
-});
-</script>
+<link rel="stylesheet" href="{{ asset_url('store.css') }}">
+<script src="{{ asset_url('store.js') }}" defer></script>
 </head>
 <body>
 <h2>Заказ #{{order.id}}</h2>
@@ -608,7 +1262,7 @@ window.addEventListener('DOMContentLoaded', () => {
     <div>Сумма: {{order.total}}</div>
   </div>
   <div style="margin-top: 10px;">
-    <form method="post" action="/orders/update_status">
+    <form class="panel" method="post" action="/orders/update_status">
       <input type="hidden" name="order_id" value="{{order.id}}">
       <select name="status" class="status-select status-{{ status_classes.get(order.status, 'new') }}">
         {% for s in order_statuses %}
@@ -629,7 +1283,10 @@ window.addEventListener('DOMContentLoaded', () => {
   </tr>
   {% endfor %}
 </table>
-<p><a class="btn-link" href="/orders">Назад к заказам</a></p>
+<p>
+  <a class="btn-link" href="/orders">Назад к заказам</a>
+  <a class="btn-link" href="/delete_order/{{order.id}}" onclick="return confirm('Удалить заказ?')">Удалить заказ</a>
+</p>
 </body>
 </html>
 '''
@@ -639,30 +1296,11 @@ EDIT_PRODUCT_HTML = '''
 <html lang="ru">
 <head>
 <title>Edit Product — Electronics Store</title>
-<style>
-body { font-family: Arial, sans-serif; background-color: #f4f4f4; margin: 20px; }
-h2 { color: #2c3e50; text-align: center; }
-form { background-color: #fff; padding: 20px; border-radius: 8px; box-shadow: 0 0 10px rgba(0,0,0,0.1); max-width: 600px; margin: 0 auto; }
-form input, form select, form textarea { width: 100%; padding: 8px; margin: 5px 0; border: 1px solid #ddd; border-radius: 4px; }
-form button { background-color: #3498db; color: white; padding: 10px; border: none; border-radius: 4px; cursor: pointer; width: 100%; }
-form button:hover { background-color: #2980b9; }
-.btn-link { display: inline-block; padding: 8px 14px; border-radius: 999px; background: #eef2f7; color: #2c3e50; text-decoration: none; font-weight: 600; }
-.btn-link:hover { background: #e2e8f0; }
-/* Base theme */
-:root { --bg: #f6f4f1; --paper: #ffffff; --ink: #1f2a37; --muted: #6b7280; --line: #e5e7eb; --accent: #b45309; }
-body { font-family: "Trebuchet MS", "Lucida Sans Unicode", "Lucida Grande", sans-serif; background-color: var(--bg); margin: 24px; color: var(--ink); }
-h2 { color: var(--ink); text-align: center; letter-spacing: 0.3px; }
-form { background-color: var(--paper); padding: 16px; border-radius: 12px; box-shadow: 0 8px 24px rgba(31, 41, 55, 0.08); margin-bottom: 16px; border: 1px solid var(--line); }
-form input, form select, form textarea, form button { padding: 8px 10px; border: 1px solid var(--line); border-radius: 8px; background: #fff; color: var(--ink); }
-form button { background-color: var(--ink); color: #fff; cursor: pointer; border: none; }
-form button:hover { background-color: #111827; }
-.btn-link { display: inline-block; padding: 8px 14px; border-radius: 999px; background: #eef2f7; color: #2c3e50; text-decoration: none; font-weight: 600; }
-.btn-link:hover { background: #e2e8f0; }
-</style>
+<link rel="stylesheet" href="{{ asset_url('store.css') }}">
 </head>
 <body>
 <h2>Редактировать товар</h2>
-<form method="post">
+<form class="editor stack" method="post">
   <input name="name" value="{{product.name}}" placeholder="Название товара" required>
   <input name="brand" value="{{product.brand}}" placeholder="Бренд">
   <input name="model" value="{{product.model}}" placeholder="Модель">
@@ -690,28 +1328,11 @@ EDIT_CUSTOMER_HTML = '''
 <html lang="ru">
 <head>
 <title>Edit Customer — Electronics Store</title>
-<style>
-body { font-family: Arial, sans-serif; background-color: #f4f4f4; margin: 20px; }
-h2 { color: #2c3e50; text-align: center; }
-form { background-color: #fff; padding: 20px; border-radius: 8px; box-shadow: 0 0 10px rgba(0,0,0,0.1); max-width: 600px; margin: 0 auto; }
-form input { width: 100%; padding: 8px; margin: 5px 0; border: 1px solid #ddd; border-radius: 4px; }
-form button { background-color: #3498db; color: white; padding: 10px; border: none; border-radius: 4px; cursor: pointer; width: 100%; }
-form button:hover { background-color: #2980b9; }
-/* Base theme */
-:root { --bg: #f6f4f1; --paper: #ffffff; --ink: #1f2a37; --muted: #6b7280; --line: #e5e7eb; --accent: #b45309; }
-body { font-family: "Trebuchet MS", "Lucida Sans Unicode", "Lucida Grande", sans-serif; background-color: var(--bg); margin: 24px; color: var(--ink); }
-h2 { color: var(--ink); text-align: center; letter-spacing: 0.3px; }
-form { background-color: var(--paper); padding: 16px; border-radius: 12px; box-shadow: 0 8px 24px rgba(31, 41, 55, 0.08); margin-bottom: 16px; border: 1px solid var(--line); }
-form input, form select, form textarea, form button { padding: 8px 10px; border: 1px solid var(--line); border-radius: 8px; background: #fff; color: var(--ink); }
-form button { background-color: var(--ink); color: #fff; cursor: pointer; border: none; }
-form button:hover { background-color: #111827; }
-.btn-link { display: inline-block; padding: 8px 14px; border-radius: 999px; background: #eef2f7; color: #2c3e50; text-decoration: none; font-weight: 600; }
-.btn-link:hover { background: #e2e8f0; }
-</style>
+<link rel="stylesheet" href="{{ asset_url('store.css') }}">
 </head>
 <body>
 <h2>Редактировать клиента</h2>
-<form method="post">
+<form class="editor stack" method="post">
   <input name="first_name" value="{{customer.first_name}}" placeholder="Имя" required>
   <input name="last_name" value="{{customer.last_name}}" placeholder="Фамилия" required>
   <input name="phone" value="{{customer.phone}}" placeholder="Телефон" required>
@@ -723,33 +1344,403 @@ form button:hover { background-color: #111827; }
 </html>
 '''
 
+REPORTS_HTML = '''
+<!doctype html>
+<html lang="ru">
+<head>
+<title>Sales Reports — Electronics Store</title>
+<link rel="stylesheet" href="{{ asset_url('store.css') }}">
+</head>
+<body>
+<h2>Отчёты о продажах</h2>
+<form class="filter" method="get">
+  <label>Дата с:
+    <input type="date" name="date_from" value="{{date_from}}">
+  </label>
+  <label>Дата по:
+    <input type="date" name="date_to" value="{{date_to}}">
+  </label>
+  <button type="submit">Применить</button>
+</form>
+<div class="totals">
+  <span>Заказов: {{totals.orders}}</span>
+  <span>Единиц: {{totals.units}}</span>
+  <span>Выручка: {{'%.2f' % totals.revenue}}</span>
+</div>
+<h3>По дням</h3>
+<table class="compact">
+  <tr><th>Дата</th><th>Заказов</th><th>Единиц</th><th>Выручка</th></tr>
+  {% for d in daily %}
+  <tr><td>{{d.day}}</td><td>{{d.orders}}</td><td>{{d.units}}</td><td>{{'%.2f' % d.revenue}}</td></tr>
+  {% else %}
+  <tr><td colspan="4">Нет продаж за период</td></tr>
+  {% endfor %}
+</table>
+<div class="grid">
+  <div>
+    <h3>Категории (за всё время)</h3>
+    <table class="compact">
+      <tr><th>Категория</th><th>Единиц</th><th>Выручка</th></tr>
+      {% for c in categories %}
+      <tr><td>{{c.name or 'Без категории'}}</td><td>{{c.units}}</td><td>{{'%.2f' % c.revenue}}</td></tr>
+      {% endfor %}
+    </table>
+  </div>
+  <div>
+    <h3>Товары (за всё время)</h3>
+    <table class="compact">
+      <tr><th>Товар</th><th>Единиц</th><th>Выручка</th></tr>
+      {% for p in products %}
+      <tr><td>{{p.name}}</td><td>{{p.units}}</td><td>{{'%.2f' % p.revenue}}</td></tr>
+      {% endfor %}
+    </table>
+  </div>
+  <div>
+    <h3>Клиенты (за всё время)</h3>
+    <table class="compact">
+      <tr><th>Клиент</th><th>Заказов</th><th>Выручка</th></tr>
+      {% for c in customers %}
+      <tr><td>{{c.first_name}} {{c.last_name}}</td><td>{{c.orders}}</td><td>{{'%.2f' % c.revenue}}</td></tr>
+      {% endfor %}
+    </table>
+  </div>
+</div>
+<p><a class="btn-link" href="/orders">Назад к заказам</a></p>
+</body>
+</html>
+'''
+
+TEMPLATES = {
+    'index.html': INDEX_HTML,
+    'add_product.html': ADD_PRODUCT_HTML,
+    'add_customer.html': ADD_CUSTOMER_HTML,
+    'customers.html': CUSTOMERS_HTML,
+    'add_order.html': ADD_ORDER_HTML,
+    'orders.html': ORDERS_HTML,
+    'order_detail.html': ORDER_DETAIL_HTML,
+    'edit_product.html': EDIT_PRODUCT_HTML,
+    'edit_customer.html': EDIT_CUSTOMER_HTML,
+    'reports.html': REPORTS_HTML,
+}
+app.jinja_loader = DictLoader(TEMPLATES)
+
+# stylesheet and scripts shared by the templates, read and compressed once per process
+assets = Assets(BASE / 'static')
+app.jinja_env.globals['asset_url'] = assets.url
+
+# changes whenever a deploy changes a template or an asset, and with it every cached page's key and ETag,
+# so browsers never revalidate HTML that points at assets that are gone
+BUILD_FINGERPRINT = hashlib.sha256(
+    json.dumps([sorted(TEMPLATES.items()), sorted(asset.name for asset in assets.by_file.values())]).encode('utf-8')
+).hexdigest()[:16]
+
+def compile_templates():
+    # the jinja environment keeps compiled templates in memory, so each one is parsed once per process
+    cache_dir = app.config['TEMPLATE_CACHE_DIR']
+    if cache_dir:
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    for name in TEMPLATES:
+        app.jinja_env.get_template(name)
+
+compile_templates()
+
+@app.cli.command('import-csv')
+@click.argument('table', type=click.Choice(sorted(IMPORT_TABLES)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=10000, show_default=True, help='Rows per executemany/transaction.')
+@click.option('--defer-indexes', is_flag=True, help='Drop the table indexes and triggers and rebuild them after the load.')
+def import_csv_command(table, path, batch_size, defer_indexes):
+    """Stream a CSV file into TABLE, upserting rows by id."""
+    init_db()
+    con = sqlite3.connect(DB_PATH)
+    start = last_report = time.perf_counter()
+
+    def progress(done):
+        nonlocal last_report
+        now = time.perf_counter()
+        if now - last_report >= 1:
+            last_report = now
+            click.echo(f'{table}: {done} rows, {done / (now - start):.0f} rows/s', err=True)
+
+    try:
+        total = import_csv(con, table, path, batch_size, defer_indexes, progress)
+    finally:
+        con.close()
+    elapsed = time.perf_counter() - start
+    click.echo(f'Imported {total} rows into {table} in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} rows/s)')
+
+@app.cli.command('export')
+@click.argument('table', type=click.Choice(sorted(EXPORT_TABLES)))
+@click.option('--format', 'fmt', type=click.Choice(sorted(EXPORT_FORMATS)), default='csv', show_default=True)
+@click.option('--status', default='', help='Orders and order_items only: order status.')
+@click.option('--date-from', default='', help='Orders and order_items only: first order date, YYYY-MM-DD.')
+@click.option('--date-to', default='', help='Orders and order_items only: last order date, YYYY-MM-DD.')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='File to write instead of stdout.')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows per fetchmany.')
+def export_command(table, fmt, status, date_from, date_to, compress, output, batch_size):
+    """Stream TABLE as CSV or JSON Lines in constant memory."""
+    if table not in ('orders', 'order_items') and (status or date_from or date_to):
+        raise click.UsageError('--status, --date-from and --date-to apply to orders and order_items only')
+    init_db()
+    con = sqlite3.connect(DB_PATH)
+    out = open(output, 'wb') if output else click.get_binary_stream('stdout')
+    start = time.perf_counter()
+    size = 0
+    try:
+        chunks = export_chunks(con, export_query(table, status, date_from, date_to), fmt, batch_size)
+        if compress:
+            chunks = gzip_chunks(chunks)
+        for chunk in chunks:
+            out.write(chunk)
+            size += len(chunk)
+    finally:
+        con.close()
+        if output:
+            out.close()
+    if output:
+        click.echo(f'Exported {table} to {output}: {size} bytes in {time.perf_counter() - start:.1f}s', err=True)
+
+@app.cli.command('fetch-thumbnails')
+@click.option('--retry-failed', is_flag=True, help='Also fetch URLs whose last attempt failed.')
+@click.option('--workers', default=8, show_default=True, help='Parallel downloads.')
+def fetch_thumbnails_command(retry_failed, workers):
+    """Fetch and store thumbnails of every product image not stored yet."""
+    init_db()
+    con = sqlite3.connect(DB_PATH)
+    try:
+        urls = [row[0] for row in con.execute('''
+            SELECT DISTINCT p.image FROM products p LEFT JOIN product_images i ON i.url = p.image
+            WHERE p.image IS NOT NULL AND p.image != '' AND (i.url IS NULL OR (i.file IS NULL AND ?))
+        ''', (retry_failed,))]
+        stored = failed = 0
+        with ThreadPoolExecutor(workers) as pool:
+            for url, (name, error) in zip(urls, pool.map(make_thumbnail, urls)):
+                with con:
+                    record_thumbnail(con, url, name, error)
+                if name:
+                    stored += 1
+                else:
+                    failed += 1
+                    click.echo(f'{url}: {error}', err=True)
+    finally:
+        con.close()
+    click.echo(f'Stored {stored} thumbnails, {failed} failed')
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Create the database if needed and apply pending schema migrations."""
+    init_db()
+    con = sqlite3.connect(DB_PATH)
+    try:
+        click.echo(f'Schema version {schema_version(con)} of {len(MIGRATIONS)}')
+    finally:
+        con.close()
+
+@app.cli.command('rebuild-sales')
+@click.option('--check', is_flag=True, help='Only compare the summaries with the live tables, do not rewrite them.')
+def rebuild_sales_command(check):
+    """Recompute the sales summary tables from orders and verify the stored ones."""
+    init_db()
+    con = sqlite3.connect(DB_PATH, isolation_level=None)
+    try:
+        mismatches = rebuild_sales(con, apply=not check)
+    finally:
+        con.close()
+    for table, count in mismatches.items():
+        click.echo(f'{table}: {count} mismatched rows')
+    if check and any(mismatches.values()):
+        raise click.ClickException('Sales summaries differ from orders; run rebuild-sales to fix them')
+
 @app.teardown_appcontext
 def close_connection(exception):
-    db = getattr(g, '_db', None)
+    g.pop('_db_view', None)
+    db = g.pop('_db', None)
     if db is not None:
-        db.close()
+        get_pool().release(db)
+
+@app.before_request
+def start_trace():
+    if app.config['DB_TRACE']:
+        g._trace = QueryTrace()
+    if app.config['METRICS_ENABLED']:
+        g._request_started = time.perf_counter()
+        g._query_times = []
+
+@before_render_template.connect_via(app)
+def render_started(sender, template, context, **extra):
+    trace = g.get('_trace')
+    if trace is not None:
+        trace.render_started = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def render_finished(sender, template, context, **extra):
+    trace = g.get('_trace')
+    if trace is not None and trace.render_started is not None:
+        trace.render_ms += (time.perf_counter() - trace.render_started) * 1e3
+        trace.render_started = None
+
+_slow_query_logger = None
+
+def slow_query_logger():
+    global _slow_query_logger
+    if _slow_query_logger is None:
+        logger = logging.getLogger(f'{app.name}.slow_queries')
+        path = app.config['SLOW_QUERY_LOG']
+        if path:
+            handler = logging.FileHandler(path, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(asctime)s pid=%(process)d %(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+        else:
+            logger = app.logger
+        _slow_query_logger = logger
+    return _slow_query_logger
+
+def log_slow_queries(trace):
+    threshold = app.config['SLOW_QUERY_MS']
+    slow = [q for q in trace.queries if q['ms'] >= threshold]
+    if not slow:
+        return
+    con = g.get('_db')
+    for q in slow:
+        plan = ''
+        if con is not None and q['sql'].lstrip().split(None, 1)[0].upper() not in ('BEGIN', 'COMMIT', 'ROLLBACK', 'PRAGMA'):
+            try:
+                plan = '\n'.join(f'  {row[3]}' for row in con.execute(f"EXPLAIN QUERY PLAN {q['sql']}", q['params']))
+            except sqlite3.Error as e:
+                plan = f'  (no plan: {e})'
+        slow_query_logger().warning(
+            'slow query %.1f ms, %d rows, %s %s\n%s\nparams: %r\n%s',
+            q['ms'], q['rows'], request.method, request.full_path, ' '.join(q['sql'].split()), q['params'], plan
+        )
+
+@app.after_request
+def finish_trace(response):
+    trace = g.get('_trace')
+    if trace is None:
+        return response
+    response.headers['Server-Timing'] = (
+        f'db;dur={trace.db_ms():.2f};desc="{len(trace.queries)} queries", '
+        f'render;dur={trace.render_ms:.2f}, '
+        f'total;dur={(time.perf_counter() - trace.started) * 1e3:.2f}'
+    )
+    log_slow_queries(trace)
+    return response
+
+@app.after_request
+def record_metrics(response):
+    started = g.get('_request_started')
+    if started is None:
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    http_requests.inc(endpoint, request.method, str(response.status_code))
+    http_duration.observe(time.perf_counter() - started, endpoint)
+    trace = g.get('_trace')
+    # with DB_TRACE on the traced connection measured the statements, fetches included
+    timings = [q['ms'] / 1e3 for q in trace.queries] if trace is not None else g._query_times
+    for seconds in timings:
+        db_query_duration.observe(seconds)
+    return response
+
+# registered last, so it runs first and the metrics above see the compressed response
+app.after_request(compress_response)
+
+@app.errorhandler(sqlite3.OperationalError)
+def database_busy(e):
+    # a lock wait that outlasted busy_timeout, a full write queue or an exhausted pool is transient, so ask
+    # the client to retry; the body tells which one it was
+    message = str(e)
+    if 'write queue busy' in message:
+        reason = 'Write queue busy'
+    elif 'pool exhausted' in message:
+        reason = 'Connection pool exhausted'
+    elif 'locked' in message or 'busy' in message:
+        reason = 'Database is locked'
+    else:
+        raise e
+    return f"Error: {reason}, retry later", 503, {'Retry-After': '1'}
 
 @app.route('/')
+@cached_page(['products', 'categories'], ('q', 'cat', 'brand', 'price', 'rating', 'sort', 'per_page', 'after', 'before'))
 def index():
     q = request.args.get('q','').strip()
     cat = request.args.get('cat','')
-    sort = request.args.get('sort','name')
+    match = fts_query(q)
+    sort = request.args.get('sort', '')
+    if sort not in PRODUCT_SORTS or (sort == 'relevance' and not match):
+        sort = 'relevance' if match else 'name'
+    brand = request.args.get('brand', '')
+    price = request.args.get('price', '')
+    rating = request.args.get('rating', '')
     db = get_db()
-    cats = db.execute('SELECT * FROM categories').fetchall()
+    facets = reference_data('facets')
     params = []
     where = []
-    if q:
-        where.append("(p.name LIKE ? OR p.description LIKE ? OR p.brand LIKE ?)")
-        params += [f'%{q}%']*3
+    if match:
+        weights = ', '.join(str(w) for w in SEARCH_WEIGHTS)
+        sql = f'''SELECT * FROM (
+                      SELECT p.*, c.name as category, COALESCE(p.rating, 0) AS rating_key,
+                             bm25(products_fts, {weights}) AS rank
+                      FROM products_fts
+                      JOIN products p ON p.id = products_fts.rowid
+                      LEFT JOIN categories c ON p.category_id=c.id
+                      WHERE products_fts MATCH ?
+                  ) p'''
+        params.append(match)
+    else:
+        sql = ('SELECT p.*, c.name as category, COALESCE(p.rating, 0) AS rating_key '
+               'FROM products p LEFT JOIN categories c ON p.category_id=c.id')
     if cat:
         where.append('p.category_id = ?')
         params.append(cat)
-    where_sql = ('WHERE ' + ' AND '.join(where)) if where else ''
-    if sort not in ('name','price','rating'):
-        sort = 'name'
-    sql = f"SELECT p.*, c.name as category FROM products p LEFT JOIN categories c ON p.category_id=c.id {where_sql} ORDER BY p.{sort}"
-    products = db.execute(sql, params).fetchall()
-    return render_template_string(INDEX_HTML, products=products, cats=cats, q=q, cat=cat)
+    if brand:
+        where.append('p.brand = ?')
+        params.append(brand)
+    if price.isdigit() and int(price) in PRICE_BUCKETS:
+        lo = int(price)
+        where.append('p.price >= ?')
+        params.append(lo)
+        if lo != PRICE_BUCKETS[-1]:
+            where.append('p.price < ?')
+            params.append(PRICE_BUCKETS[PRICE_BUCKETS.index(lo) + 1])
+    else:
+        price = ''
+    if rating.isdigit():
+        where.append('COALESCE(p.rating, 0) >= ?')
+        params.append(int(rating))
+    else:
+        rating = ''
+    per_page = get_page_size()
+    page = keyset_page(
+        db, sql, where, params,
+        [PRODUCT_SORTS[sort], ('p.id', 'id')],
+        per_page,
+        after=decode_cursor(request.args.get('after')),
+        before=decode_cursor(request.args.get('before')),
+    )
+    link_args = {k: v for k, v in (('q', q), ('cat', cat), ('brand', brand), ('price', price), ('rating', rating),
+                                   ('sort', sort), ('per_page', per_page)) if v}
+    next_url = url_for('index', after=page.next_cursor, **link_args) if page.next_cursor else None
+    prev_url = url_for('index', before=page.prev_cursor, **link_args) if page.prev_cursor else None
+    return render_template(
+        'index.html',
+        products=page.rows,
+        thumbs=thumbnail_files(db, [p['image'] for p in page.rows]),
+        facets=facets,
+        q=q,
+        cat=cat,
+        brand=brand,
+        price=price,
+        rating=rating,
+        sort=sort,
+        per_page=per_page,
+        page_sizes=PAGE_SIZE_CHOICES,
+        next_url=next_url,
+        prev_url=prev_url
+    )
 
 @app.route('/add_product', methods=['GET', 'POST'])
 def add_product():
@@ -764,15 +1755,14 @@ def add_product():
         category_id = int(request.form.get('category_id', 0))
         description = request.form.get('description')
         image = request.form.get('image')
-        db = get_db()
-        db.execute('''INSERT INTO products (name, brand, model, spec, price, stock, rating, category_id, description, image)
-                      VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', 
-                   (name, brand, model, spec, price, stock, rating, category_id, description, image))
-        db.commit()
+        write(lambda db: db.execute(
+            '''INSERT INTO products (name, brand, model, spec, price, stock, rating, category_id, description, image)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            (name, brand, model, spec, price, stock, rating, category_id, description, image)
+        ))
         return redirect('/')
-    db = get_db()
-    cats = db.execute('SELECT * FROM categories').fetchall()
-    return render_template_string(ADD_PRODUCT_HTML, cats=cats)
+    cats = reference_data('categories')
+    return render_template('add_product.html', cats=cats)
 
 @app.route('/add_customer', methods=['GET', 'POST'])
 def add_customer():
@@ -781,25 +1771,75 @@ def add_customer():
         last_name = request.form.get('last_name')
         phone = request.form.get('phone')
         email = request.form.get('email')
-        db = get_db()
-        db.execute('''INSERT INTO customers (first_name, last_name, phone, email)
-                      VALUES (?, ?, ?, ?)''', 
-                   (first_name, last_name, phone, email))
-        db.commit()
+        write(lambda db: db.execute(
+            'INSERT INTO customers (first_name, last_name, phone, email) VALUES (?, ?, ?, ?)',
+            (first_name, last_name, phone, email)
+        ))
         return redirect('/')
-    return render_template_string(ADD_CUSTOMER_HTML)
+    return render_template('add_customer.html')
 
 @app.route('/customers')
+@cached_page(['customers'], ())
 def customers():
     db = get_db()
     customers_list = db.execute('SELECT * FROM customers').fetchall()
-    return render_template_string(CUSTOMERS_HTML, customers=customers_list)
+    return render_template('customers.html', customers=customers_list)
+
+class InsufficientStock(Exception):
+    def __init__(self, products):
+        super().__init__(', '.join(f"{p['name']} ({p['stock']} in stock)" for p in products))
+        self.products = products
+
+def parse_order_lines(product_ids, quantities):
+    lines = {}
+    for pid_str, qty_str in zip(product_ids, quantities):
+        if not pid_str or not qty_str:
+            continue
+        try:
+            pid = int(pid_str)
+            qty = int(qty_str)
+        except ValueError:
+            continue
+        if qty > 0:
+            lines[pid] = lines.get(pid, 0) + qty
+    return lines
+
+def create_order(db, customer_id, status, lines):
+    # a write unit (see write()); stock is checked and reserved with a guarded UPDATE
+    products = {}
+    if lines:
+        products = {row['id']: row for row in db.execute(
+            f"SELECT id, name, price, stock FROM products WHERE id IN ({', '.join('?' * len(lines))})",
+            list(lines)
+        )}
+    lines = {pid: qty for pid, qty in lines.items() if pid in products}
+    short = [products[pid] for pid, qty in lines.items() if (products[pid]['stock'] or 0) < qty]
+    if short:
+        raise InsufficientStock(short)
+    total = sum(products[pid]['price'] * qty for pid, qty in lines.items())
+    summary = '; '.join(f"{products[pid]['name']} (x{qty})" for pid, qty in lines.items()) or None
+    order_id = db.execute(
+        '''INSERT INTO orders (customer_id, created_at, total, status, items_summary, item_count)
+           VALUES (?, datetime('now'), ?, ?, ?, ?)''',
+        (customer_id, total, status, summary, len(lines))
+    ).lastrowid
+    db.executemany(
+        'INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (?, ?, ?, ?)',
+        [(order_id, pid, qty, products[pid]['price']) for pid, qty in lines.items()]
+    )
+    if status == CANCELED_STATUS:
+        # a canceled order holds no stock; the order_stock_returns triggers take it if the order is restored
+        return order_id, total
+    reserved = db.executemany(
+        'UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ?',
+        [(qty, pid, qty) for pid, qty in lines.items()]
+    ).rowcount
+    if lines and reserved != len(lines):
+        raise InsufficientStock([products[pid] for pid in lines])
+    return order_id, total
 
 @app.route('/add_order', methods=['GET', 'POST'])
 def add_order():
-    db = get_db()
-    customers_list = db.execute('SELECT * FROM customers').fetchall()
-    products_list = db.execute('SELECT * FROM products').fetchall()
     if request.method == 'POST':
         customer_id = request.form.get('customer_id')
         if not customer_id:
@@ -812,84 +1852,119 @@ def add_order():
         quantities = request.form.getlist('quantities')
         if len(product_ids) != len(quantities):
             return "Error: Mismatch in products and quantities", 400
-        total = 0
-        cursor = db.execute(
-            'INSERT INTO orders (customer_id, created_at, total, status) VALUES (?, datetime("now"), 0, ?)',
-            (customer_id, status)
-        )
-        order_id = cursor.lastrowid
-        for pid_str, qty_str in zip(product_ids, quantities):
-            if not pid_str or not qty_str:
-                continue
-            try:
-                pid = int(pid_str)
-                qty = int(qty_str)
-                if qty <= 0:
-                    continue
-            except ValueError:
-                continue
-            product = db.execute('SELECT price FROM products WHERE id = ?', (pid,)).fetchone()
-            if product:
-                price = product[0]
-                db.execute('INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (?, ?, ?, ?)', (order_id, pid, qty, price))
-                total += price * qty
-        db.execute('UPDATE orders SET total = ? WHERE id = ?', (total, order_id))
-        db.commit()
+        lines = parse_order_lines(product_ids, quantities)
+        try:
+            _, total = write(create_order, customer_id, status, lines)
+        except InsufficientStock as e:
+            return f"Error: Insufficient stock: {e}", 409
+        except sqlite3.IntegrityError:
+            return "Error: Unknown customer", 400
+        if app.config['METRICS_ENABLED']:
+            orders_created.inc()
+            order_value.observe(total)
         return redirect('/orders')
-    return render_template_string(
-        ADD_ORDER_HTML,
-        customers=customers_list,
-        products=products_list,
-        order_statuses=ORDER_STATUSES
-    )
+    return render_template('add_order.html', order_statuses=ORDER_STATUSES)
+
+@app.route('/autocomplete/products')
+def autocomplete_products():
+    match = fts_query(request.args.get('q', ''))
+    if not match:
+        return jsonify([])
+    rows = get_db().execute('''
+        SELECT p.id, p.name, p.price, p.stock
+        FROM products_fts
+        JOIN products p ON p.id = products_fts.rowid
+        WHERE products_fts MATCH ?
+        ORDER BY products_fts.rank
+        LIMIT ?
+    ''', (match, app.config['AUTOCOMPLETE_LIMIT'])).fetchall()
+    return jsonify([
+        {'id': r['id'], 'label': f"{r['name']} ({r['price']})", 'price': r['price'], 'stock': r['stock']}
+        for r in rows
+    ])
+
+@app.route('/autocomplete/customers')
+def autocomplete_customers():
+    match = fts_query(request.args.get('q', ''))
+    if not match:
+        return jsonify([])
+    rows = get_db().execute('''
+        SELECT c.id, c.first_name, c.last_name, c.email
+        FROM customers_fts
+        JOIN customers c ON c.id = customers_fts.rowid
+        WHERE customers_fts MATCH ?
+        ORDER BY customers_fts.rank
+        LIMIT ?
+    ''', (match, app.config['AUTOCOMPLETE_LIMIT'])).fetchall()
+    return jsonify([
+        {'id': r['id'], 'label': f"{r['first_name']} {r['last_name']} ({r['email']})"}
+        for r in rows
+    ])
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        return None
+
+def order_filters(status, date_from, date_to):
+    # created_at is stored as 'YYYY-MM-DD HH:MM:SS', so half-open string ranges stay index-friendly
+    where = []
+    params = []
+    if status:
+        where.append('o.status = ?')
+        params.append(status)
+    start = parse_date(date_from)
+    if start:
+        where.append('o.created_at >= ?')
+        params.append(start.isoformat())
+    end = parse_date(date_to)
+    if end:
+        where.append('o.created_at < ?')
+        params.append((end + timedelta(days=1)).isoformat())
+    return where, params
 
 @app.route('/orders')
+@cached_page(['orders', 'customers'], ('status', 'date_from', 'date_to', 'sort', 'per_page', 'after', 'before'))
 def orders():
     db = get_db()
     status = request.args.get('status', '')
     date_from = request.args.get('date_from', '')
     date_to = request.args.get('date_to', '')
     sort = request.args.get('sort', 'created_desc')
-    sort_map = {
-        'created_desc': 'o.created_at DESC',
-        'created_asc': 'o.created_at ASC',
-        'total_desc': 'o.total DESC',
-        'total_asc': 'o.total ASC',
-        'status_asc': 'o.status ASC',
-    }
-    sort_sql = sort_map.get(sort, sort_map['created_desc'])
-    where = []
-    params = []
-    if status:
-        where.append('o.status = ?')
-        params.append(status)
-    if date_from:
-        where.append('date(o.created_at) >= date(?)')
-        params.append(date_from)
-    if date_to:
-        where.append('date(o.created_at) <= date(?)')
-        params.append(date_to)
-    where_sql = ('WHERE ' + ' AND '.join(where)) if where else ''
-    orders_list = db.execute(f'''
-        SELECT o.id, o.created_at, o.total, o.status, c.first_name, c.last_name, c.email,
-               GROUP_CONCAT(p.name || ' (x' || oi.quantity || ')', '; ') as items
-        FROM orders o
-        LEFT JOIN customers c ON o.customer_id = c.id
-        LEFT JOIN order_items oi ON o.id = oi.order_id
-        LEFT JOIN products p ON oi.product_id = p.id
-        {where_sql}
-        GROUP BY o.id
-        ORDER BY {sort_sql}
-    ''', params).fetchall()
-    return render_template_string(
-        ORDERS_HTML,
-        orders=orders_list,
+    if sort not in ORDER_SORTS:
+        sort = 'created_desc'
+    column, descending = ORDER_SORTS[sort]
+    where, params = order_filters(status, date_from, date_to)
+    per_page = get_page_size()
+    page = keyset_page(
+        db,
+        '''SELECT o.id, o.created_at, o.total, o.status, o.items_summary, o.item_count,
+                  c.first_name, c.last_name, c.email
+           FROM orders o
+           LEFT JOIN customers c ON o.customer_id = c.id''',
+        where, params,
+        [(f'o.{column}', column), ('o.id', 'id')],
+        per_page,
+        after=decode_cursor(request.args.get('after')),
+        before=decode_cursor(request.args.get('before')),
+        descending=descending,
+    )
+    link_args = {k: v for k, v in (('status', status), ('date_from', date_from), ('date_to', date_to),
+                                   ('sort', sort), ('per_page', per_page)) if v}
+    next_url = url_for('orders', after=page.next_cursor, **link_args) if page.next_cursor else None
+    prev_url = url_for('orders', before=page.prev_cursor, **link_args) if page.prev_cursor else None
+    return render_template(
+        'orders.html',
+        orders=page.rows,
         order_statuses=ORDER_STATUSES,
         status_classes=ORDER_STATUS_CLASSES,
         status=status,
         date_from=date_from,
         date_to=date_to,
-        sort=sort
+        sort=sort,
+        next_url=next_url,
+        prev_url=prev_url
     )
 
 @app.route('/orders/<int:order_id>')
@@ -909,8 +1984,8 @@ def order_detail(order_id):
         LEFT JOIN products p ON oi.product_id = p.id
         WHERE oi.order_id = ?
     ''', (order_id,)).fetchall()
-    return render_template_string(
-        ORDER_DETAIL_HTML,
+    return render_template(
+        'order_detail.html',
         order=order,
         items=items,
         order_statuses=ORDER_STATUSES,
@@ -927,14 +2002,106 @@ def update_order_status():
         order_id = int(order_id)
     except (TypeError, ValueError):
         return "Error: Invalid order id", 400
-    db = get_db()
-    db.execute('UPDATE orders SET status = ? WHERE id = ?', (status, order_id))
-    db.commit()
+    try:
+        write(lambda db: db.execute('UPDATE orders SET status = ? WHERE id = ?', (status, order_id)))
+    except sqlite3.IntegrityError:
+        return "Error: Insufficient stock to restore the order", 409
+    return redirect(request.referrer or '/orders')
+
+@app.route('/orders/bulk_status', methods=['POST'])
+def bulk_order_status():
+    # form post from the orders page, or JSON {"order_ids": [...], "status": "..."} from scripts
+    data = request.get_json(silent=True) if request.is_json else None
+    if data is not None:
+        order_ids = data.get('order_ids') if isinstance(data, dict) else None
+        status = data.get('status', '') if isinstance(data, dict) else ''
+    else:
+        order_ids = request.form.getlist('order_ids')
+        status = request.form.get('status', '')
+    if status not in ORDER_STATUSES:
+        return "Error: Invalid status", 400
+    try:
+        order_ids = sorted({int(i) for i in order_ids or []})
+    except (TypeError, ValueError):
+        return "Error: Invalid order id", 400
+    if not order_ids:
+        return "Error: Select orders", 400
+    # one statement however many orders are selected; the history, sales and stock triggers run per changed row
+    try:
+        updated = write(lambda db: db.execute(
+            'UPDATE orders SET status = ? WHERE id IN (SELECT value FROM json_each(?)) AND status IS NOT ?',
+            (status, json.dumps(order_ids), status)
+        ).rowcount)
+    except sqlite3.IntegrityError:
+        # the stock trigger refused to restore one of the canceled orders; none of them changed
+        return "Error: Insufficient stock to restore the orders", 409
+    if data is not None:
+        return jsonify({'updated': updated})
     return redirect(request.referrer or '/orders')
 
+def remove_order(db, order_id):
+    # items go first for the foreign key; the sales and stock triggers account for them while the order
+    # still exists
+    db.execute('DELETE FROM order_items WHERE order_id = ?', (order_id,))
+    db.execute('DELETE FROM orders WHERE id = ?', (order_id,))
+
+@app.route('/delete_order/<int:order_id>')
+def delete_order(order_id):
+    write(remove_order, order_id)
+    return redirect('/orders')
+
+def report_window():
+    # (start, end) of the dashboard; without dates, the last REPORT_DAYS days up to today
+    end = parse_date(request.args.get('date_to', '')) or date.today()
+    start = parse_date(request.args.get('date_from', '')) or end - timedelta(days=app.config['REPORT_DAYS'] - 1)
+    return start, end
+
+@app.route('/reports')
+@cached_page(['orders', 'order_items', 'products', 'categories', 'customers'], ('date_from', 'date_to'),
+             resolve=report_window)
+def reports():
+    # reads only the trigger-maintained sales_* summaries, plus names for the top rows
+    db = get_db()
+    start, end = report_window()
+    limit = app.config['REPORT_TOP_LIMIT']
+    daily = db.execute('''
+        SELECT day, orders, units, revenue FROM sales_daily
+        WHERE day >= ? AND day <= ? AND (orders != 0 OR units != 0) ORDER BY day DESC
+    ''', (start.isoformat(), end.isoformat())).fetchall()
+    totals = {
+        'orders': sum(d['orders'] for d in daily),
+        'units': sum(d['units'] for d in daily),
+        'revenue': sum(d['revenue'] for d in daily),
+    }
+    category_names = {c['id']: c['name'] for c in reference_data('categories')}
+    categories = [
+        dict(c, name=category_names.get(c['category_id']))
+        for c in db.execute('SELECT category_id, units, revenue FROM sales_by_category WHERE units > 0 '
+                            'ORDER BY revenue DESC LIMIT ?', (limit,))
+    ]
+    products = db.execute('''
+        SELECT p.name, s.units, s.revenue FROM sales_by_product s
+        JOIN products p ON p.id = s.product_id
+        WHERE s.units > 0 ORDER BY s.revenue DESC LIMIT ?
+    ''', (limit,)).fetchall()
+    customers = db.execute('''
+        SELECT c.first_name, c.last_name, s.orders, s.revenue FROM sales_by_customer s
+        JOIN customers c ON c.id = s.customer_id
+        WHERE s.orders > 0 ORDER BY s.revenue DESC LIMIT ?
+    ''', (limit,)).fetchall()
+    return render_template(
+        'reports.html',
+        daily=daily,
+        totals=totals,
+        categories=categories,
+        products=products,
+        customers=customers,
+        date_from=start.isoformat(),
+        date_to=end.isoformat()
+    )
+
 @app.route('/edit_product/<int:product_id>', methods=['GET', 'POST'])
 def edit_product(product_id):
-    db = get_db()
     if request.method == 'POST':
         name = request.form.get('name')
         brand = request.form.get('brand')
@@ -946,43 +2113,356 @@ def edit_product(product_id):
         category_id = int(request.form.get('category_id', 0))
         description = request.form.get('description')
         image = request.form.get('image')
-        db.execute('''UPDATE products SET name=?, brand=?, model=?, spec=?, price=?, stock=?, rating=?, category_id=?, description=?, image=? WHERE id=?''',
-                   (name, brand, model, spec, price, stock, rating, category_id, description, image, product_id))
-        db.commit()
+        write(lambda db: db.execute(
+            '''UPDATE products SET name=?, brand=?, model=?, spec=?, price=?, stock=?, rating=?, category_id=?, description=?, image=? WHERE id=?''',
+            (name, brand, model, spec, price, stock, rating, category_id, description, image, product_id)
+        ))
         return redirect('/')
+    db = get_db()
     product = db.execute('SELECT * FROM products WHERE id = ?', (product_id,)).fetchone()
-    cats = db.execute('SELECT * FROM categories').fetchall()
-    return render_template_string(EDIT_PRODUCT_HTML, product=product, cats=cats)
+    cats = reference_data('categories')
+    return render_template('edit_product.html', product=product, cats=cats)
 
 @app.route('/delete_product/<int:product_id>')
 def delete_product(product_id):
-    db = get_db()
-    db.execute('DELETE FROM products WHERE id = ?', (product_id,))
-    db.commit()
+    try:
+        write(lambda db: db.execute('DELETE FROM products WHERE id = ?', (product_id,)))
+    except sqlite3.IntegrityError:
+        return "Error: Product is used in orders", 409
     return redirect('/')
 
 @app.route('/edit_customer/<int:customer_id>', methods=['GET', 'POST'])
 def edit_customer(customer_id):
-    db = get_db()
     if request.method == 'POST':
         first_name = request.form.get('first_name')
         last_name = request.form.get('last_name')
         phone = request.form.get('phone')
         email = request.form.get('email')
-        db.execute('UPDATE customers SET first_name=?, last_name=?, phone=?, email=? WHERE id=?',
-                   (first_name, last_name, phone, email, customer_id))
-        db.commit()
+        write(lambda db: db.execute('UPDATE customers SET first_name=?, last_name=?, phone=?, email=? WHERE id=?',
+                                    (first_name, last_name, phone, email, customer_id)))
         return redirect('/customers')
-    customer = db.execute('SELECT * FROM customers WHERE id = ?', (customer_id,)).fetchone()
-    return render_template_string(EDIT_CUSTOMER_HTML, customer=customer)
+    customer = get_db().execute('SELECT * FROM customers WHERE id = ?', (customer_id,)).fetchone()
+    return render_template('edit_customer.html', customer=customer)
 
 @app.route('/delete_customer/<int:customer_id>')
 def delete_customer(customer_id):
-    db = get_db()
-    db.execute('DELETE FROM customers WHERE id = ?', (customer_id,))
-    db.commit()
+    try:
+        write(lambda db: db.execute('DELETE FROM customers WHERE id = ?', (customer_id,)))
+    except sqlite3.IntegrityError:
+        return "Error: Customer has orders", 409
     return redirect('/customers')
 
+@app.route('/api/facets')
+def api_facets():
+    return jsonify(reference_data('facets'))
+
+# resource -> (table, alias, selectable fields, tables whose writes change it)
+API_RESOURCES = {
+    'products': ('products', 'p', ['id', 'name', 'brand', 'model', 'spec', 'price', 'stock', 'rating',
+                                   'category_id', 'description', 'image'], ['products']),
+    'customers': ('customers', 'c', ['id', 'first_name', 'last_name', 'phone', 'email'], ['customers']),
+    'orders': ('orders', 'o', ['id', 'customer_id', 'created_at', 'total', 'status', 'item_count', 'items_summary', 'items'],
+               ['orders', 'order_items']),
+}
+
+def api_error(message, code):
+    return jsonify({'error': message}), code
+
+def api_etag(db, tables):
+    # derived from the request and the tables' write counters only, so a match needs no data query
+    versions = data_version(db, tables)
+    key = json.dumps([request.path, sorted(request.args.items(multi=True)), versions])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def api_fields(resource):
+    allowed = API_RESOURCES[resource][2]
+    fields = [f for f in request.args.get('fields', '').split(',') if f] or allowed
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+def api_rows(db, resource, fields, where, params, per_page, after):
+    table, alias, _, _ = API_RESOURCES[resource]
+    columns = [f for f in fields if f != 'items']
+    select = ', '.join(f'{alias}.{col}' for col in dict.fromkeys(['id'] + columns))
+    page = keyset_page(db, f'SELECT {select} FROM {table} {alias}', where, params,
+                       [(f'{alias}.id', 'id')], per_page, after=after)
+    rows = [{col: row[col] for col in columns} for row in page.rows]
+    if 'items' in fields:
+        ids = [row['id'] for row in page.rows]
+        items = {}
+        if ids:
+            for item in db.execute(f'''
+                SELECT order_id, product_id, quantity, price FROM order_items
+                WHERE order_id IN ({', '.join('?' * len(ids))}) ORDER BY id
+            ''', ids):
+                items.setdefault(item['order_id'], []).append(
+                    {'product_id': item['product_id'], 'quantity': item['quantity'], 'price': item['price']}
+                )
+        for row, order_id in zip(rows, ids):
+            row['items'] = items.get(order_id, [])
+    return rows, page.next_cursor
+
+@app.route('/api/<any(products, customers, orders):resource>')
+def api_list(resource):
+    db = get_db()
+    etag = api_etag(db, API_RESOURCES[resource][3])
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+    try:
+        fields = api_fields(resource)
+        ids = [int(i) for i in request.args.get('ids', '').split(',') if i]
+    except ValueError as e:
+        return api_error(str(e), 400)
+    alias = API_RESOURCES[resource][1]
+    where, params = [], []
+    if ids:
+        if len(ids) > app.config['MAX_PAGE_SIZE']:
+            return api_error(f"At most {app.config['MAX_PAGE_SIZE']} ids per request", 400)
+        where.append(f"{alias}.id IN ({', '.join('?' * len(ids))})")
+        params += ids
+    if resource == 'orders':
+        order_where, order_params = order_filters(
+            request.args.get('status', ''), request.args.get('date_from', ''), request.args.get('date_to', '')
+        )
+        where += order_where
+        params += order_params
+    rows, next_cursor = api_rows(db, resource, fields, where, params, get_page_size(),
+                                 decode_cursor(request.args.get('after'), size=1))
+    response = jsonify({'data': rows, 'next': next_cursor})
+    response.set_etag(etag)
+    return response
+
+@app.route('/api/<any(products, customers, orders):resource>/<int:item_id>')
+def api_detail(resource, item_id):
+    db = get_db()
+    etag = api_etag(db, API_RESOURCES[resource][3])
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+    try:
+        fields = api_fields(resource)
+    except ValueError as e:
+        return api_error(str(e), 400)
+    alias = API_RESOURCES[resource][1]
+    rows, _ = api_rows(db, resource, fields, [f'{alias}.id = ?'], [item_id], 1, None)
+    if not rows:
+        return api_error('Not found', 404)
+    response = jsonify(rows[0])
+    response.set_etag(etag)
+    return response
+
+@app.route('/api/order_status_history')
+def api_order_status_history():
+    # "what changed since X": ?since=2024-05-01 or ?since=2024-05-01T12:00:00, then ?after=<cursor>
+    db = get_db()
+    etag = api_etag(db, ['orders'])
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+    where, params = [], []
+    since = request.args.get('since', '')
+    if since:
+        try:
+            since = datetime.fromisoformat(since)
+        except ValueError:
+            return api_error('Invalid since, expected an ISO date or datetime', 400)
+        where.append('h.changed_at >= ?')
+        params.append(since.strftime('%Y-%m-%d %H:%M:%S'))
+    order_id = request.args.get('order_id', '')
+    if order_id:
+        if not order_id.isdigit():
+            return api_error('Invalid order_id', 400)
+        where.append('h.order_id = ?')
+        params.append(int(order_id))
+    page = keyset_page(
+        db,
+        'SELECT h.id, h.order_id, h.old_status, h.new_status, h.changed_at FROM order_status_history h',
+        where, params,
+        [('h.changed_at', 'changed_at'), ('h.id', 'id')],
+        get_page_size(),
+        after=decode_cursor(request.args.get('after')),
+    )
+    response = jsonify({'data': [dict(row) for row in page.rows], 'next': page.next_cursor})
+    response.set_etag(etag)
+    return response
+
+@app.route('/export/<any(products, customers, orders, order_items):table>.<any(csv, jsonl):fmt>')
+def export(table, fmt):
+    args = request.args
+    if table not in ('orders', 'order_items') and any(args.get(k) for k in ('status', 'date_from', 'date_to')):
+        return "Error: Filters apply to orders and order_items only", 400
+    query = export_query(table, args.get('status', ''), args.get('date_from', ''), args.get('date_to', ''))
+    # stream_with_context keeps the request (and its pooled connection) alive until the last chunk
+    chunks = export_chunks(get_db(), query, fmt, app.config['EXPORT_BATCH_SIZE'])
+    filename, content_type = f'{table}.{fmt}', EXPORT_FORMATS[fmt]
+    if args.get('gzip') == '1':
+        chunks = gzip_chunks(chunks)
+        filename, content_type = filename + '.gz', 'application/gzip'
+    response = app.response_class(stream_with_context(chunks), content_type=content_type)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+def thumbnail_store():
+    return ThumbnailStore(app.config['THUMBNAIL_DIR'])
+
+def make_thumbnail(url):
+    """Fetch, shrink and store the image at url; returns (file name, None) or (None, error)."""
+    cfg = app.config
+    try:
+        data, ext = fetch(url, cfg['THUMBNAIL_FETCH_TIMEOUT'], cfg['THUMBNAIL_MAX_BYTES'], cfg['THUMBNAIL_TRUSTED_HOSTS'])
+        return thumbnail_store().save(*shrink(data, ext, cfg['THUMBNAIL_SIZE'])), None
+    except FetchError as e:
+        return None, str(e)[:200]
+
+def record_thumbnail(db, url, name, error):
+    db.execute(
+        '''INSERT INTO product_images(url, file, error, fetched_at) VALUES (?, ?, ?, ?)
+           ON CONFLICT(url) DO UPDATE SET file=excluded.file, error=excluded.error, fetched_at=excluded.fetched_at''',
+        (url, name, error, int(time.time()))
+    )
+
+class ThumbnailFetcher:
+    """A worker's background thread that fetches product images the catalog asked for.
+
+    Requests only queue a URL and move on; a URL already waiting is not queued twice, and when the
+    queue is full the URL is dropped until a later view asks for it again.
+    """
+
+    def __init__(self, max_pending):
+        self.pid = os.getpid()
+        self._queue = queue.Queue(max_pending)
+        self._pending = set()
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, name='thumbnail-fetcher', daemon=True).start()
+
+    def request(self, url):
+        with self._lock:
+            if url in self._pending:
+                return
+            try:
+                self._queue.put_nowait(url)
+            except queue.Full:
+                return
+            self._pending.add(url)
+
+    def _run(self):
+        while True:
+            url = self._queue.get()
+            try:
+                name, error = make_thumbnail(url)
+                self._record(url, name, error)
+            except Exception:
+                app.logger.exception('storing the thumbnail of %s failed', url)
+            finally:
+                with self._lock:
+                    self._pending.discard(url)
+
+    def _record(self, url, name, error):
+        if app.config['WRITE_QUEUE_ENABLED']:
+            get_writer().submit(record_thumbnail, (url, name, error)).result()
+            return
+        pool = get_pool()
+        con = pool.acquire()
+        try:
+            con.execute('BEGIN IMMEDIATE')
+            record_thumbnail(con, url, name, error)
+            con.commit()
+        finally:
+            pool.release(con)
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+def get_fetcher():
+    global _fetcher
+    fetcher = _fetcher
+    # like the writer, the fetcher thread does not survive fork()
+    if fetcher is None or fetcher.pid != os.getpid():
+        with _fetcher_lock:
+            if _fetcher is None or _fetcher.pid != os.getpid():
+                _fetcher = ThumbnailFetcher(app.config['THUMBNAIL_QUEUE_MAX'])
+            fetcher = _fetcher
+    return fetcher
+
+def thumbnail_files(db, urls):
+    # stored thumbnails of one page's images in a single lookup; the rest go through the proxy route
+    urls = list({url for url in urls if url})
+    if not urls:
+        return {}
+    return {row['url']: row['file'] for row in db.execute(
+        f"SELECT url, file FROM product_images WHERE file IS NOT NULL AND url IN ({', '.join('?' * len(urls))})", urls
+    )}
+
+@app.route('/thumbs/<name>')
+def thumbnail(name):
+    if not re.fullmatch(r'[0-9a-f]{64}\.(jpg|png|gif|webp|svg)', name):
+        return "Error: Not found", 404
+    path = thumbnail_store().path(name)
+    if name == PLACEHOLDER_NAME and not path.exists():
+        thumbnail_store().save(PLACEHOLDER_SVG, 'svg')
+    if not path.exists():
+        return "Error: Not found", 404
+    # the name is the content's hash, so the file behind it never changes
+    response = send_file(path, mimetype=CONTENT_TYPES[name.rsplit('.', 1)[1]], max_age=365 * 86400)
+    response.cache_control.immutable = True
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+@app.route('/products/<int:product_id>/thumbnail')
+def product_thumbnail(product_id):
+    # redirects to the product's stored thumbnail; until there is one, to the placeholder, while the
+    # image is fetched in the background (never in this request)
+    row = get_db().execute('''
+        SELECT p.image, i.file, i.fetched_at FROM products p LEFT JOIN product_images i ON i.url = p.image
+        WHERE p.id = ?
+    ''', (product_id,)).fetchone()
+    if row is None:
+        return "Error: Product not found", 404
+    name = row['file']
+    if name is None and row['image'] and (row['fetched_at'] or 0) < time.time() - app.config['THUMBNAIL_RETRY_SECONDS']:
+        get_fetcher().request(row['image'])
+    response = redirect(f'/thumbs/{name or PLACEHOLDER_NAME}')
+    # the product's image URL can change, so only the target of the redirect is cached for good;
+    # the placeholder only briefly, so the real thumbnail shows up once it is fetched
+    response.cache_control.max_age = 300 if name else 10
+    return response
+
+@app.route('/assets/<name>')
+def asset(name):
+    item = assets.get(name)
+    if item is None:
+        return "Error: Not found", 404
+    encoding = request.accept_encodings.best_match(list(item.encoded))
+    response = app.response_class(item.encoded[encoding] if encoding else item.data, content_type=item.content_type)
+    if encoding:
+        response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+    response.set_etag(f'{item.digest}-{encoding or "identity"}')
+    # the name carries the content's hash, so a changed file gets a new URL
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 86400
+    response.cache_control.immutable = True
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response.make_conditional(request)
+
+# set in a worker that received SIGTERM (see server.py), so the readiness check takes it out of rotation
+draining = threading.Event()
+
+@app.route('/ready')
+def ready():
+    if draining.is_set():
+        return jsonify({'ready': False, 'reason': 'shutting down'}), 503
+    version = schema_version(get_db())
+    if version < len(MIGRATIONS):
+        return jsonify({'ready': False, 'reason': f'schema version {version} of {len(MIGRATIONS)}'}), 503
+    return jsonify({'ready': True, 'pid': os.getpid(), 'schema_version': version})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    if not app.config['METRICS_ENABLED']:
+        return "Error: Metrics are disabled", 404
+    return app.response_class(metrics.render(metrics.collect_all()), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     init_db()
     app.run(debug=True)
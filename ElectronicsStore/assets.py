@@ -0,0 +1,51 @@
+# Shared CSS and JS, served under names that carry a hash of their content so browsers can cache them
+# for good, and response compression. Every asset is read and compressed once, when the app is imported;
+# brotli is used when the brotli module is installed, gzip always.
+import hashlib
+import mimetypes
+import zlib
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+# in order of preference when the client accepts several equally
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+def compress(data, encoding, level):
+    """gzip level is 1-9, brotli quality 0-11."""
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    # zlib writes the gzip header with a zero timestamp, so equal input gives equal bytes
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+class Asset:
+    def __init__(self, path):
+        self.data = path.read_bytes()
+        self.digest = hashlib.sha256(self.data).hexdigest()[:16]
+        self.name = f'{path.stem}.{self.digest}{path.suffix}'
+        self.content_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/') or self.content_type == 'application/javascript':
+            self.content_type += '; charset=utf-8'
+        # served only when smaller than the original
+        self.encoded = {}
+        for encoding in ENCODINGS:
+            body = compress(self.data, encoding, 11 if encoding == 'br' else 9)
+            if len(body) < len(self.data):
+                self.encoded[encoding] = body
+
+class Assets:
+    """Files of one directory, by their plain name and by their fingerprinted name."""
+
+    def __init__(self, directory):
+        self.by_file = {path.name: Asset(path) for path in sorted(Path(directory).iterdir()) if path.is_file()}
+        self.by_name = {asset.name: asset for asset in self.by_file.values()}
+
+    def url(self, filename):
+        return f'/assets/{self.by_file[filename].name}'
+
+    def get(self, name):
+        return self.by_name.get(name)
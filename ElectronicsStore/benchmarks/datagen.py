@@ -0,0 +1,179 @@
+# Deterministic synthetic store database at a configurable scale.
+#
+# The same arguments and seed always produce the same rows. Run from the ElectronicsStore directory:
+#
+#     python -m benchmarks.datagen /tmp/store-small.db --scale small
+#     python -m benchmarks.datagen /tmp/store-large.db --scale large   # 1M products, ~10M order_items
+import argparse
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+from pathlib import Path
+import app as store
+from migrations import ORDER_HISTORY_BACKFILL_SQL, migrate
+
+# scale -> (products, customers, orders); orders carry 1-5 items, about 3 on average
+SCALES = {
+    'tiny': (1_000, 500, 2_000),
+    'small': (10_000, 10_000, 50_000),
+    'medium': (100_000, 100_000, 1_000_000),
+    'large': (1_000_000, 100_000, 3_300_000),
+}
+
+CATEGORIES = [
+    'Computers & Laptops', 'Smartphones', 'TV & Video', 'Audio', 'Home Appliances', 'Cameras',
+    'Gaming', 'Wearables', 'Networking', 'Accessories',
+]
+BRANDS = ['Samsung', 'Apple', 'Lenovo', 'Asus', 'Sony', 'LG', 'Xiaomi', 'Philips', 'Bosch', 'Huawei',
+          'Acer', 'Dell', 'HP', 'Canon', 'Nikon', 'JBL', 'Redmond', 'Polaris', 'Vitek', 'Dexp']
+NOUNS = ['Ноутбук', 'Смартфон', 'Телевизор', 'Наушники', 'Холодильник', 'Камера', 'Приставка', 'Часы',
+         'Роутер', 'Зарядка', 'Laptop', 'Phone', 'Monitor', 'Speaker', 'Tablet']
+ADJECTIVES = ['Pro', 'Max', 'Lite', 'Ultra', 'Mini', 'Plus', 'Air', 'Neo', 'X', 'S']
+SPECS = ['8GB', '16GB', '32GB', '128GB', '256GB', '512GB', '1TB', '4K', 'OLED', 'Wi-Fi 6', 'Bluetooth 5.3', '120Hz']
+WORDS = ['быстрый', 'тихий', 'лёгкий', 'надёжный', 'компактный', 'мощный', 'экономичный', 'стильный',
+         'fast', 'quiet', 'light', 'reliable', 'compact', 'powerful', 'wireless', 'smart']
+FIRST_NAMES = ['Иван', 'Мария', 'Алексей', 'Ольга', 'Дмитрий', 'Анна', 'Сергей', 'Елена', 'Павел', 'Наталья',
+               'John', 'Emma', 'Liam', 'Olivia']
+LAST_NAMES = ['Иванов', 'Петрова', 'Смирнов', 'Кузнецова', 'Попов', 'Соколова', 'Лебедев', 'Козлова',
+              'Новиков', 'Морозова', 'Smith', 'Brown', 'Taylor']
+# weights for the statuses of generated orders, in ORDER_STATUSES order
+STATUS_WEIGHTS = [10, 10, 20, 55, 5]
+
+def products(rng, count, categories):
+    for i in range(1, count + 1):
+        brand = rng.choice(BRANDS)
+        noun = rng.choice(NOUNS)
+        model = f'{rng.choice(ADJECTIVES)}-{rng.randint(100, 9999)}'
+        yield (
+            i, f'{noun} {brand} {model}', brand, model,
+            ';'.join(rng.sample(SPECS, 3)),
+            round(rng.lognormvariate(9.5, 1.1), 2),
+            rng.randint(1000, 100000),
+            round(rng.uniform(1, 5), 1),
+            rng.randint(1, categories),
+            ' '.join(rng.choices(WORDS, k=12)),
+            f'https://via.placeholder.com/150?text=P{i}',
+        )
+
+def customers(rng, count):
+    for i in range(1, count + 1):
+        yield (
+            i, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES),
+            f'+7-{rng.randint(900, 999)}-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}',
+            f'customer{i}@example.com',
+        )
+
+def orders(rng, count, product_count, customer_count, end, days):
+    # yields (order row, item rows); a product always sells at its product_price()
+    start = end - timedelta(days=days)
+    item_id = 0
+    for i in range(1, count + 1):
+        created = start + timedelta(seconds=rng.randrange(days * 86400))
+        items = []
+        for product_id in {rng.randint(1, product_count) for _ in range(rng.randint(1, 5))}:
+            item_id += 1
+            items.append((item_id, i, product_id, rng.randint(1, 3), product_price(product_id)))
+        total = sum(quantity * price for _, _, _, quantity, price in items)
+        status = rng.choices(store.ORDER_STATUSES, STATUS_WEIGHTS)[0]
+        yield (i, rng.randint(1, customer_count), created.strftime('%Y-%m-%d %H:%M:%S'), total, status), items
+
+def product_price(product_id):
+    # item prices only need to be stable per product, not equal to the catalog price
+    return float(100 + product_id * 7919 % 200000)
+
+def batched(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+def insert(con, sql, rows, batch_size):
+    total = 0
+    for batch in batched(rows, batch_size):
+        con.execute('BEGIN')
+        con.executemany(sql, batch)
+        con.execute('COMMIT')
+        total += len(batch)
+    return total
+
+def generate(path, products_count, customers_count, orders_count, seed=1, end='2024-12-31', days=365,
+             batch_size=20000, log=print):
+    """Create a new database at path; returns row counts per table."""
+    path = Path(path)
+    if path.exists():
+        raise FileExistsError(f'{path} already exists')
+    rng = random.Random(seed)
+    con = sqlite3.connect(path, isolation_level=None)
+    con.execute('PRAGMA journal_mode = WAL')
+    con.execute('PRAGMA synchronous = OFF')
+    con.executescript((store.BASE / 'schema.sql').read_text(encoding='utf-8'))
+    con.execute('PRAGMA foreign_keys = OFF')
+    migrate(con)
+
+    # load with every index and trigger dropped, then rebuild the derived tables (search indexes, facets,
+    # order summaries, status history, sales summaries) in one pass each
+    deferred = con.execute(
+        "SELECT type, name, sql FROM sqlite_master WHERE type IN ('index', 'trigger') AND sql IS NOT NULL"
+    ).fetchall()
+    for kind, name, _ in deferred:
+        con.execute(f'DROP {kind.upper()} {name}')
+
+    counts = {}
+    started = time.perf_counter()
+    counts['categories'] = insert(con, 'INSERT INTO categories(id, name) VALUES (?, ?)',
+                                  enumerate(CATEGORIES, 1), batch_size)
+    counts['products'] = insert(
+        con, '''INSERT INTO products(id, name, brand, model, spec, price, stock, rating, category_id, description, image)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+        products(rng, products_count, len(CATEGORIES)), batch_size,
+    )
+    log(f'products: {counts["products"]} rows')
+    counts['customers'] = insert(con, 'INSERT INTO customers(id, first_name, last_name, phone, email) VALUES (?, ?, ?, ?, ?)',
+                                 customers(rng, customers_count), batch_size)
+    log(f'customers: {counts["customers"]} rows')
+    counts['orders'] = counts['order_items'] = 0
+    for batch in batched(orders(rng, orders_count, products_count, customers_count,
+                                datetime.fromisoformat(end), days), batch_size):
+        con.execute('BEGIN')
+        con.executemany('INSERT INTO orders(id, customer_id, created_at, total, status) VALUES (?, ?, ?, ?, ?)',
+                        [order for order, _ in batch])
+        items = [item for _, order_items in batch for item in order_items]
+        con.executemany('INSERT INTO order_items(id, order_id, product_id, quantity, price) VALUES (?, ?, ?, ?, ?)', items)
+        con.execute('COMMIT')
+        counts['orders'] += len(batch)
+        counts['order_items'] += len(items)
+    log(f'orders: {counts["orders"]} rows, order_items: {counts["order_items"]} rows')
+
+    con.execute('BEGIN')
+    for _, _, ddl in deferred:
+        con.execute(ddl)
+    for statements in store.IMPORT_REBUILD_SQL.values():
+        for stmt in statements:
+            con.execute(stmt)
+    con.execute(ORDER_HISTORY_BACKFILL_SQL)
+    con.execute('COMMIT')
+    store.rebuild_sales(con)
+    con.close()
+    log(f'generated {path} in {time.perf_counter() - started:.1f}s')
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description='Deterministic synthetic store database')
+    parser.add_argument('path', help='database file to create')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--products', type=int, help='override the product count of --scale')
+    parser.add_argument('--customers', type=int, help='override the customer count of --scale')
+    parser.add_argument('--orders', type=int, help='override the order count of --scale')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    products_count, customers_count, orders_count = SCALES[args.scale]
+    generate(args.path, args.products or products_count, args.customers or customers_count,
+             args.orders or orders_count, seed=args.seed)
+
+if __name__ == '__main__':
+    main()
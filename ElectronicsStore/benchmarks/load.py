@@ -0,0 +1,262 @@
+# Concurrent mixed read/write load against a real WSGI server on localhost.
+#
+# Starts the app under server.py in a separate process, pre-forked into worker processes with a thread
+# pool each, and drives it with concurrent clients. Each client draws a mix of
+# catalog browsing, search, order creation and status updates. Run from the ElectronicsStore directory:
+#
+#     python -m benchmarks.load --db /tmp/store-small.db --workers 4 --threads 8 --clients 32 --duration 30
+#     python -m benchmarks.load --scale tiny --mix browse=40,search=20,order=30,status=10 --output load.json
+#
+# The app answers a lock wait that outlasted busy_timeout, a write queue that did not take the write in
+# time and an exhausted pool with 503 and Retry-After. Clients retry those up to --retries times and the
+# report counts them by the cause the response body names.
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from urllib.parse import quote, urlencode
+from benchmarks import datagen
+from benchmarks.routes import percentile
+
+DEFAULT_MIX = 'browse=50,search=20,order=20,status=10'
+SEARCH_TERMS = ['ноутбук', 'samsung', 'смартфон', 'pro', 'телевизор', 'apple', 'наушники', 'ultra']
+
+def serve(db_path, port, workers, threads):
+    """Server process: the production server (server.py) on a copy of the dataset."""
+    import server
+    import app as store
+
+    store.DB_PATH = Path(db_path)
+    server.prepare()
+    server.serve(server.listen('127.0.0.1', port), workers, threads, graceful_timeout=5, log=lambda line: None)
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in OPERATIONS:
+            raise SystemExit(f'unknown operation in --mix: {name}')
+        mix[name] = float(weight)
+    return mix
+
+def browse(rng, ids):
+    return 'GET', rng.choice([
+        '/',
+        f'/?cat={rng.randint(1, ids["categories"])}&sort=price',
+        f'/?sort=rating&per_page={rng.choice([25, 50, 100])}',
+        '/orders',
+        f'/orders/{rng.randint(1, ids["orders"])}',
+        '/api/products?per_page=100',
+    ]), None
+
+def search(rng, ids):
+    term = rng.choice(SEARCH_TERMS)
+    return 'GET', rng.choice([f'/?q={quote(term)}', f'/autocomplete/products?q={quote(term[:3])}']), None
+
+def order(rng, ids):
+    lines = rng.sample(range(1, ids['products'] + 1), rng.randint(1, 3))
+    body = [('customer_id', rng.randint(1, ids['customers'])), ('status', 'Новый')]
+    body += [('product_ids', pid) for pid in lines] + [('quantities', 1) for _ in lines]
+    return 'POST', '/add_order', urlencode(body)
+
+def status(rng, ids):
+    body = {'order_id': rng.randint(1, ids['orders']),
+            'status': rng.choice(['Новый', 'В обработке', 'Отправлен', 'Доставлен'])}
+    return 'POST', '/orders/update_status', urlencode(body)
+
+OPERATIONS = {'browse': browse, 'search': search, 'order': order, 'status': status}
+
+# 503 bodies of the app's database_busy handler -> report counter; any other 503 counts as 'other'
+UNAVAILABLE = {
+    b'Error: Database is locked': 'database_locked',
+    b'Error: Write queue busy': 'write_queue_busy',
+    b'Error: Connection pool exhausted': 'pool_exhausted',
+}
+
+def send(port, method, path, body):
+    con = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'} if body else {}
+        con.request(method, path, body=body, headers=headers)
+        response = con.getresponse()
+        return response.status, response.read()
+    finally:
+        con.close()
+
+def unavailable_cause(body):
+    return next((cause for prefix, cause in UNAVAILABLE.items() if body.startswith(prefix)), 'other')
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.unavailable = Counter()
+        self.retries = 0
+        self.failed = 0
+
+    def record(self, op, latency, code, unavailable, retries):
+        with self.lock:
+            self.latencies[op].append(latency)
+            self.statuses[op][code] += 1
+            self.unavailable.update(unavailable)
+            self.retries += retries
+            self.failed += code >= 500
+
+def client(port, seed, mix, ids, deadline, max_retries, stats):
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    while time.monotonic() < deadline:
+        op = rng.choices(names, weights)[0]
+        method, path, body = OPERATIONS[op](rng, ids)
+        start = time.perf_counter()
+        unavailable = Counter()
+        retries = 0
+        while True:
+            try:
+                code, text = send(port, method, path, body)
+            except OSError:
+                code = 599
+            if code != 503:
+                break
+            unavailable[unavailable_cause(text)] += 1
+            if retries == max_retries:
+                break
+            retries += 1
+            time.sleep(min(0.05 * 2 ** retries, 1) * rng.random())
+        # latency includes the retries, which is what the user waited for
+        stats.record(op, (time.perf_counter() - start) * 1e3, code, unavailable, retries)
+
+def wait_ready(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'server exited with {process.returncode}')
+        try:
+            if send(port, 'GET', '/ready', None)[0] == 200:
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit('server did not become ready')
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def dataset_ids(db_path):
+    con = sqlite3.connect(db_path)
+    try:
+        return {table: con.execute(f'SELECT MAX(id) FROM {table}').fetchone()[0] or 1
+                for table in ('categories', 'products', 'customers', 'orders')}
+    finally:
+        con.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent mixed read/write load against the production server')
+    parser.add_argument('--db', help='dataset from benchmarks.datagen; generated (and kept) if it does not exist')
+    parser.add_argument('--scale', choices=sorted(datagen.SCALES), default='small')
+    parser.add_argument('--workers', type=int, default=1, help='server processes sharing the listening socket')
+    parser.add_argument('--threads', type=int, default=1, help='request threads per server process')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent client threads')
+    parser.add_argument('--duration', type=float, default=20, help='seconds of load')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='operation weights, e.g. ' + DEFAULT_MIX)
+    parser.add_argument('--retries', type=int, default=3, help='retries of a 503 (database busy) response')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-page-cache', action='store_true', help='run the server with PAGE_CACHE_ENABLED=0')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.db, args.port, args.workers, args.threads)
+        return
+
+    mix = parse_mix(args.mix)
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(args.db or Path(tmp) / 'dataset.db')
+        if not source.exists():
+            datagen.generate(source, *datagen.SCALES[args.scale], seed=args.seed,
+                             log=lambda line: print(line, file=sys.stderr))
+        db_path = Path(tmp) / 'run.db'
+        src, dst = sqlite3.connect(source), sqlite3.connect(db_path)
+        src.backup(dst)
+        src.close()
+        dst.close()
+        ids = dataset_ids(db_path)
+
+        port = free_port()
+        env = dict(os.environ)
+        if args.no_page_cache:
+            env['PAGE_CACHE_ENABLED'] = '0'
+        command = [sys.executable, '-m', 'benchmarks.load', '--serve', '--db', str(db_path), '--port', str(port),
+                   '--workers', str(args.workers), '--threads', str(args.threads)]
+        server = subprocess.Popen(command, cwd=Path(__file__).resolve().parent.parent, env=env,
+                                  stderr=subprocess.DEVNULL)
+        try:
+            wait_ready(port, server)
+            stats = Stats()
+            started = time.monotonic()
+            deadline = started + args.duration
+            clients = [threading.Thread(target=client,
+                                        args=(port, args.seed * 1000 + n, mix, ids, deadline, args.retries, stats))
+                       for n in range(args.clients)]
+            for thread in clients:
+                thread.start()
+            for thread in clients:
+                thread.join()
+            elapsed = time.monotonic() - started
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+
+    total = sum(len(values) for values in stats.latencies.values())
+    operations = {}
+    for op, values in sorted(stats.latencies.items()):
+        values.sort()
+        operations[op] = {
+            'requests': len(values),
+            'throughput_rps': round(len(values) / elapsed, 1),
+            'p50_ms': round(percentile(values, 50), 2),
+            'p99_ms': round(percentile(values, 99), 2),
+            'max_ms': round(values[-1], 2),
+            'status': {str(code): n for code, n in sorted(stats.statuses[op].items())},
+        }
+    report = {
+        'meta': {
+            'dataset': str(args.db) if args.db else f'{args.scale} (seed {args.seed})',
+            'workers': args.workers,
+            'threads': args.threads,
+            'clients': args.clients,
+            'duration_s': round(elapsed, 1),
+            'mix': mix,
+            'page_cache': not args.no_page_cache,
+        },
+        'requests': total,
+        'throughput_rps': round(total / elapsed, 1),
+        # 503 responses by cause, retried ones included
+        'unavailable': {cause: stats.unavailable[cause] for cause in [*UNAVAILABLE.values(), 'other']},
+        'retries': stats.retries,
+        'failed': stats.failed,
+        'operations': operations,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(text + '\n', encoding='utf-8')
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+# Latency, SQL statement count, peak memory and response size for every route, as JSON.
+#
+# Runs each scenario through the Flask test client against a copy of a synthetic database (see
+# benchmarks.datagen) and fails when a route has no scenario. Run from the ElectronicsStore directory:
+#
+#     python -m benchmarks.routes --scale small --output run.json
+#     python -m benchmarks.routes --db /tmp/store-small.db --baseline run.json --tolerance 0.25
+#
+# With --baseline the exit status is 1 when any route got slower than the tolerance allows or runs
+# more SQL statements than before.
+import argparse
+import json
+import math
+import platform
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter, namedtuple
+from pathlib import Path
+import app as store
+from benchmarks import datagen
+
+# name -> endpoint, method, url(i), test client arguments(i) (form/json body, headers) or None; i is the iteration number
+Scenario = namedtuple('Scenario', 'name endpoint method url body')
+
+def form(**values):
+    return {'data': values}
+
+def scenarios(con, iterations):
+    """Scenarios for every route, with ids taken from the dataset so each iteration hits real rows."""
+    def one(sql, *args):
+        return con.execute(sql, args).fetchone()[0]
+
+    product_id = one('SELECT id FROM products ORDER BY id LIMIT 1 OFFSET (SELECT COUNT(*) / 2 FROM products)')
+    customer_id = one('SELECT id FROM customers ORDER BY id LIMIT 1 OFFSET (SELECT COUNT(*) / 2 FROM customers)')
+    order_id = one('SELECT id FROM orders ORDER BY id LIMIT 1 OFFSET (SELECT COUNT(*) / 2 FROM orders)')
+    order_ids = [row[0] for row in con.execute('SELECT id FROM orders ORDER BY id LIMIT 100')]
+    brand = one('SELECT brand FROM products WHERE id = ?', product_id)
+    deep_name, deep_id = con.execute(
+        'SELECT name, id FROM products ORDER BY name, id LIMIT 1 OFFSET (SELECT COUNT(*) * 9 / 10 FROM products)'
+    ).fetchone()
+    deep_cursor = store.encode_cursor([deep_name, deep_id])
+    last_day = one('SELECT MAX(day) FROM sales_daily')
+    # a stored thumbnail for product_id's image, so the proxy scenario never goes to the network
+    con.execute("INSERT OR REPLACE INTO product_images(url, file, fetched_at) SELECT image, ?, 0 FROM products WHERE id = ?",
+                (store.PLACEHOLDER_NAME, product_id))
+    # rows that the delete scenarios consume, one per iteration
+    spare = spare_rows(con, iterations + 2, customer_id)
+    statuses = store.ORDER_STATUSES
+    return [
+        Scenario('catalog', 'index', 'GET', lambda i: '/', None),
+        Scenario('catalog_gzip', 'index', 'GET', lambda i: '/', lambda i: {'headers': {'Accept-Encoding': 'gzip'}}),
+        Scenario('catalog_deep_page', 'index', 'GET', lambda i: f'/?after={deep_cursor}', None),
+        Scenario('catalog_filtered', 'index', 'GET', lambda i: f'/?cat=3&brand={brand}&sort=price', None),
+        Scenario('catalog_search', 'index', 'GET', lambda i: '/?q=ноутбук', None),
+        Scenario('add_product_form', 'add_product', 'GET', lambda i: '/add_product', None),
+        Scenario('add_product', 'add_product', 'POST', lambda i: '/add_product', lambda i: form(
+            name=f'Bench product {i}', brand='Bench', model=f'B{i}', spec='8GB', price='999', stock='10',
+            rating='4', category_id='1', description='benchmark', image='')),
+        Scenario('add_customer_form', 'add_customer', 'GET', lambda i: '/add_customer', None),
+        Scenario('add_customer', 'add_customer', 'POST', lambda i: '/add_customer', lambda i: form(
+            first_name='Bench', last_name=f'Customer {i}', phone='+7-000', email=f'bench{i}@example.com')),
+        Scenario('customers', 'customers', 'GET', lambda i: '/customers', None),
+        Scenario('add_order_form', 'add_order', 'GET', lambda i: '/add_order', None),
+        Scenario('add_order', 'add_order', 'POST', lambda i: '/add_order', lambda i: form(
+            customer_id=str(customer_id), status=statuses[0],
+            product_ids=[str(product_id), str(product_id + 1)], quantities=['1', '2'])),
+        Scenario('autocomplete_products', 'autocomplete_products', 'GET', lambda i: '/autocomplete/products?q=sam', None),
+        Scenario('autocomplete_customers', 'autocomplete_customers', 'GET', lambda i: '/autocomplete/customers?q=ива', None),
+        Scenario('orders', 'orders', 'GET', lambda i: '/orders', None),
+        Scenario('orders_filtered', 'orders', 'GET',
+                 lambda i: f'/orders?status={statuses[3]}&date_from={last_day[:8]}01&date_to={last_day}&sort=total_desc', None),
+        Scenario('order_detail', 'order_detail', 'GET', lambda i: f'/orders/{order_id}', None),
+        Scenario('update_order_status', 'update_order_status', 'POST', lambda i: '/orders/update_status',
+                 lambda i: form(order_id=str(order_id), status=statuses[i % len(statuses)])),
+        Scenario('bulk_order_status', 'bulk_order_status', 'POST', lambda i: '/orders/bulk_status',
+                 lambda i: {'json': {'order_ids': order_ids, 'status': statuses[i % len(statuses)]}}),
+        Scenario('delete_order', 'delete_order', 'GET', lambda i: f"/delete_order/{spare['orders'][i]}", None),
+        Scenario('reports', 'reports', 'GET', lambda i: f'/reports?date_to={last_day}', None),
+        Scenario('edit_product_form', 'edit_product', 'GET', lambda i: f'/edit_product/{product_id}', None),
+        Scenario('edit_product', 'edit_product', 'POST', lambda i: f'/edit_product/{product_id}', lambda i: form(
+            name=f'Renamed product {i % 2}', brand=brand, model='M', spec='8GB', price='999', stock='100000',
+            rating='4', category_id='1', description='benchmark', image='')),
+        Scenario('delete_product', 'delete_product', 'GET', lambda i: f"/delete_product/{spare['products'][i]}", None),
+        Scenario('edit_customer_form', 'edit_customer', 'GET', lambda i: f'/edit_customer/{customer_id}', None),
+        Scenario('edit_customer', 'edit_customer', 'POST', lambda i: f'/edit_customer/{customer_id}', lambda i: form(
+            first_name='Bench', last_name=f'Edited {i % 2}', phone='+7-000', email='bench@example.com')),
+        Scenario('delete_customer', 'delete_customer', 'GET', lambda i: f"/delete_customer/{spare['customers'][i]}", None),
+        Scenario('api_facets', 'api_facets', 'GET', lambda i: '/api/facets', None),
+        Scenario('api_products', 'api_list', 'GET', lambda i: '/api/products?per_page=100', None),
+        Scenario('api_orders_items', 'api_list', 'GET', lambda i: '/api/orders?per_page=100&fields=id,total,items', None),
+        Scenario('api_products_batch', 'api_list', 'GET',
+                 lambda i: '/api/products?ids=' + ','.join(str(product_id + k) for k in range(50)), None),
+        Scenario('api_product', 'api_detail', 'GET', lambda i: f'/api/products/{product_id}', None),
+        Scenario('api_order_status_history', 'api_order_status_history', 'GET',
+                 lambda i: f'/api/order_status_history?since={last_day}', None),
+        Scenario('export_orders_csv', 'export', 'GET', lambda i: f'/export/orders.csv?date_from={last_day}', None),
+        Scenario('export_customers_jsonl_gzip', 'export', 'GET', lambda i: '/export/customers.jsonl?gzip=1', None),
+        Scenario('thumbnail', 'thumbnail', 'GET', lambda i: f'/thumbs/{store.PLACEHOLDER_NAME}', None),
+        Scenario('product_thumbnail', 'product_thumbnail', 'GET', lambda i: f'/products/{product_id}/thumbnail', None),
+        Scenario('asset', 'asset', 'GET', lambda i: store.assets.url('store.css'),
+                 lambda i: {'headers': {'Accept-Encoding': 'gzip'}}),
+        Scenario('ready', 'ready', 'GET', lambda i: '/ready', None),
+        Scenario('metrics', 'metrics_endpoint', 'GET', lambda i: '/metrics', None),
+    ]
+
+def spare_rows(con, count, customer_id):
+    # unreferenced rows for the delete scenarios, appended to the copied database
+    con.execute('BEGIN')
+    products = [con.execute("INSERT INTO products(name, price, stock, category_id) VALUES ('Spare', 1, 0, 1)").lastrowid
+                for _ in range(count)]
+    customers = [con.execute("INSERT INTO customers(first_name, last_name) VALUES ('Spare', 'Customer')").lastrowid
+                 for _ in range(count)]
+    orders = [con.execute("INSERT INTO orders(customer_id, created_at, total, status) VALUES (?, datetime('now'), 0, ?)",
+                          (customer_id, store.ORDER_STATUSES[0])).lastrowid
+              for _ in range(count)]
+    con.execute('COMMIT')
+    return {'products': products, 'customers': customers, 'orders': orders}
+
+def percentile(sorted_values, pct):
+    # nearest-rank percentile
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+class StatementCounter:
+    # counts SQL statements run on pooled connections; statements that FTS5 runs internally arrive prefixed
+    # with '--' and are skipped, each trigger program arrives as a repeat of the statement that fired it
+    # and is counted
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, sql):
+        if not sql.startswith('--'):
+            self.count += 1
+
+    def install(self, pool):
+        connect = pool.connect
+
+        def traced():
+            con = connect()
+            con.set_trace_callback(self)
+            return con
+
+        pool.connect = traced
+
+def request(client, scenario, i):
+    kwargs = scenario.body(i) if scenario.body else {}
+    response = client.open(scenario.url(i), method=scenario.method, **kwargs)
+    # a streamed body is produced only as it is read, and closing ends it inside its request context
+    response.get_data()
+    response.close()
+    return response
+
+def run(db_path, iterations, page_cache=False):
+    store.DB_PATH = Path(db_path)
+    store.app.config['PAGE_CACHE_ENABLED'] = page_cache
+    store.app.config['THUMBNAIL_DIR'] = str(Path(db_path).parent / 'thumbnails')
+    store._pool = None
+    store._writer = None
+    # a dataset generated by an older version gets the pending migrations before scenarios read it
+    store.init_db()
+    con = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        cases = scenarios(con, iterations)
+    finally:
+        con.close()
+
+    covered = {(case.endpoint, case.method) for case in cases}
+    missing = sorted(
+        f'{method} {rule.rule}'
+        for rule in store.app.url_map.iter_rules() if rule.endpoint != 'static'
+        for method in rule.methods - {'HEAD', 'OPTIONS'} if (rule.endpoint, method) not in covered
+    )
+    if missing:
+        raise SystemExit('no benchmark scenario for: ' + ', '.join(missing))
+
+    counter = StatementCounter()
+    counter.install(store.get_pool())
+    client = store.app.test_client()
+    results = {}
+    for case in cases:
+        # iteration 0 warms the connection and the template, and is not recorded
+        request(client, case, 0)
+        timings = []
+        statements = []
+        codes = Counter()
+        for i in range(1, iterations + 1):
+            counter.count = 0
+            start = time.perf_counter()
+            response = request(client, case, i)
+            timings.append((time.perf_counter() - start) * 1e3)
+            statements.append(counter.count)
+            codes[response.status_code] += 1
+        tracemalloc.start()
+        body = request(client, case, iterations + 1).get_data()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        timings.sort()
+        results[case.name] = {
+            'endpoint': case.endpoint,
+            'method': case.method,
+            'requests': iterations,
+            'status': {str(code): n for code, n in sorted(codes.items())},
+            'mean_ms': round(sum(timings) / len(timings), 3),
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p90_ms': round(percentile(timings, 90), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'max_ms': round(timings[-1], 3),
+            'statements': max(statements),
+            'peak_kib': round(peak / 1024, 1),
+            # as sent, i.e. compressed when the scenario asks for it
+            'response_bytes': len(body),
+        }
+    return results
+
+def compare(baseline, current, tolerance, min_delta_ms):
+    """Returns human-readable regressions of current against baseline."""
+    regressions = []
+    for name, now in current['routes'].items():
+        before = baseline['routes'].get(name)
+        if before is None:
+            continue
+        for key in ('p50_ms', 'p99_ms'):
+            if now[key] > before[key] * (1 + tolerance) and now[key] - before[key] > min_delta_ms:
+                regressions.append(f'{name}: {key} {before[key]} -> {now[key]}')
+        if now['statements'] > before['statements']:
+            regressions.append(f"{name}: statements {before['statements']} -> {now['statements']}")
+        errors = sum(n for code, n in now['status'].items() if code.startswith('5'))
+        if errors:
+            regressions.append(f'{name}: {errors} server errors')
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Latency, SQL statements, memory and response size of every route')
+    parser.add_argument('--db', help='dataset from benchmarks.datagen; generated (and kept) if it does not exist')
+    parser.add_argument('--scale', choices=sorted(datagen.SCALES), default='small',
+                        help='dataset scale when the database has to be generated')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--page-cache', action='store_true', help='leave the rendered-page cache on')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--baseline', help='JSON report of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative latency increase')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='ignore latency increases below this')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(args.db or Path(tmp) / 'dataset.db')
+        if not source.exists():
+            datagen.generate(source, *datagen.SCALES[args.scale], seed=args.seed,
+                             log=lambda line: print(line, file=sys.stderr))
+        # write scenarios change the data, so every run starts from a pristine copy
+        db_path = Path(tmp) / 'run.db'
+        src = sqlite3.connect(source)
+        dst = sqlite3.connect(db_path)
+        src.backup(dst)
+        src.close()
+        dst.close()
+        counts = {}
+        con = sqlite3.connect(db_path)
+        for table in ('products', 'customers', 'orders', 'order_items'):
+            counts[table] = con.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        con.close()
+        routes = run(db_path, args.iterations, args.page_cache)
+        store.get_pool().close()
+
+    report = {
+        'meta': {
+            'dataset': str(args.db) if args.db else f'{args.scale} (seed {args.seed})',
+            'rows': counts,
+            'iterations': args.iterations,
+            'page_cache': args.page_cache,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            # ru_maxrss is KiB on Linux
+            'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        },
+        'routes': routes,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(text + '\n', encoding='utf-8')
+    else:
+        print(text)
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8'))
+        regressions = compare(baseline, report, args.tolerance, args.min_delta_ms)
+        for line in regressions:
+            print(f'REGRESSION {line}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# Per-request template render cost: render_template_string vs the precompiled registry.
+#
+# Run from the ElectronicsStore directory:
+#
+#     python -m benchmarks.templates --rows 50 --iterations 2000
+import argparse
+import tempfile
+import time
+from flask import render_template, render_template_string
+from jinja2 import FileSystemBytecodeCache
+import app as store
+
+def sample_context(rows):
+    products = [
+        {
+            'id': i, 'name': f'Product {i}', 'brand': 'Brand', 'model': f'M{i}', 'spec': '8GB;256GB',
+            'description': 'Sample description', 'price': 999.0 + i, 'stock': 5, 'rating': 4.5,
+            'category': 'Category', 'category_id': 1, 'image': '',
+        }
+        for i in range(rows)
+    ]
+    customers = [
+        {'id': i, 'first_name': 'Иван', 'last_name': 'Иванов', 'phone': '+7-000', 'email': f'c{i}@example.com'}
+        for i in range(rows)
+    ]
+    orders = [
+        {
+            'id': i, 'first_name': 'Иван', 'last_name': 'Иванов', 'email': 'ivan@example.com',
+            'created_at': '2024-01-01 10:00:00', 'total': 1000.0, 'status': 'Новый', 'items_summary': 'Product (x1)',
+            'item_count': 1,
+        }
+        for i in range(rows)
+    ]
+    cats = [{'id': 1, 'name': 'Category'}]
+    facets = {
+        'category': [{'value': '1', 'label': 'Category', 'count': rows}],
+        'brand': [{'value': 'Brand', 'label': 'Brand', 'count': rows}],
+        'price': [{'value': '0', 'label': '0–1000', 'count': rows}],
+        'rating': [{'value': '4', 'label': '4+', 'count': rows}],
+    }
+    statuses = {'order_statuses': store.ORDER_STATUSES, 'status_classes': store.ORDER_STATUS_CLASSES}
+    return {
+        'index.html': dict(products=products, thumbs={}, facets=facets, q='', cat='', brand='', price='', rating='', sort='name', per_page=rows,
+                           page_sizes=store.PAGE_SIZE_CHOICES, next_url='/?after=x', prev_url=None),
+        'add_product.html': dict(cats=cats),
+        'add_customer.html': {},
+        'customers.html': dict(customers=customers),
+        'add_order.html': dict(**statuses),
+        'orders.html': dict(orders=orders, status='', date_from='', date_to='', sort='created_desc', **statuses),
+        'order_detail.html': dict(order=orders[0], items=products, **statuses),
+        'edit_product.html': dict(product=products[0], cats=cats),
+        'edit_customer.html': dict(customer=customers[0]),
+        'reports.html': dict(
+            daily=[{'day': '2024-01-01', 'orders': 3, 'units': 5, 'revenue': 1000.0}] * rows,
+            totals={'orders': 3 * rows, 'units': 5 * rows, 'revenue': 1000.0 * rows},
+            categories=[{'name': 'Category', 'units': 5, 'revenue': 1000.0}] * 10,
+            products=[{'name': 'Product', 'units': 5, 'revenue': 1000.0}] * 10,
+            customers=[{'first_name': 'Иван', 'last_name': 'Иванов', 'orders': 3, 'revenue': 1000.0}] * 10,
+            date_from='2024-01-01', date_to='2024-01-31',
+        ),
+    }
+
+def per_call(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-request template render cost')
+    parser.add_argument('--rows', type=int, default=50, help='rows rendered into list pages')
+    parser.add_argument('--iterations', type=int, default=1000)
+    args = parser.parse_args()
+
+    contexts = sample_context(args.rows)
+    print(f'{"template":<20}{"string us":>12}{"registry us":>14}{"speedup":>10}')
+    with store.app.test_request_context():
+        for name, source in store.TEMPLATES.items():
+            ctx = contexts[name]
+            before = per_call(lambda: render_template_string(source, **ctx), args.iterations)
+            after = per_call(lambda: render_template(name, **ctx), args.iterations)
+            print(f'{name:<20}{before:>12.1f}{after:>14.1f}{before / after:>9.1f}x')
+
+    # FileSystemBytecodeCache keys on the template name, which from_string does not have,
+    # so measure worker start-up through a loader-backed environment instead
+    with tempfile.TemporaryDirectory() as cache_dir:
+        def startup(bytecode_dir):
+            env = store.app.create_jinja_environment()
+            if bytecode_dir:
+                env.bytecode_cache = FileSystemBytecodeCache(bytecode_dir)
+            start = time.perf_counter()
+            for name in store.TEMPLATES:
+                env.get_template(name)
+            return (time.perf_counter() - start) * 1e3
+
+        no_cache = startup(None)
+        startup(cache_dir)
+        warm = startup(cache_dir)
+    print(f'startup compile, no bytecode cache: {no_cache:.1f} ms')
+    print(f'startup compile, warm bytecode cache: {warm:.1f} ms')
+
+if __name__ == '__main__':
+    main()
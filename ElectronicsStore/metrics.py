@@ -0,0 +1,221 @@
+# Prometheus-style metrics without a client library. Every thread writes to its own shard, so
+# recording takes no lock; a scrape merges the shards. With a metrics directory each process also
+# flushes a snapshot there periodically and a scrape merges every process's snapshot.
+import json
+import math
+from bisect import bisect_left
+from itertools import accumulate
+import os
+import threading
+import time
+from pathlib import Path
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+class Metric:
+    def __init__(self, registry, name, kind, help, labels, buckets=None):
+        self.registry = registry
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+
+class Counter(Metric):
+    def inc(self, *labels, value=1):
+        shard = self.registry.shard()
+        key = (self.name, labels)
+        shard[key] = shard.get(key, 0) + value
+
+class Histogram(Metric):
+    def observe(self, value, *labels):
+        shard = self.registry.shard()
+        key = (self.name, labels)
+        data = shard.get(key)
+        if data is None:
+            # a count per bucket and one past the last bound, then sum and count; cumulated when rendered
+            data = shard[key] = [0] * (len(self.buckets) + 3)
+        data[bisect_left(self.buckets, value)] += 1
+        data[-2] += value
+        data[-1] += 1
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self.derivations = []
+        self.directory = None
+        self.flush_interval = 1.0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = {}
+        self._flusher = None
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(self, name, 'counter', help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(self, name, 'histogram', help, labels, buckets))
+
+    def collector(self, name, kind, help, labels, collect):
+        # values read at snapshot time from state the app already keeps; collect() -> {labels: value}
+        metric = self._add(Metric(self, name, kind, help, labels))
+        self.collectors.append((metric, collect))
+        return metric
+
+    def derived(self, name, help, labels, compute):
+        # gauges computed from the merged values of all processes, e.g. ratios that cannot be summed
+        metric = self._add(Metric(self, name, 'gauge', help, labels))
+        self.derivations.append((metric, compute))
+        return metric
+
+    def _add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+                if len(self._shards) > 64:
+                    # servers that spawn a thread per request would otherwise grow this list forever
+                    self._retire_dead()
+            if self.directory and self._flusher is None:
+                self._start_flusher()
+        return shard
+
+    def _retire_dead(self):
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                merge(self._retired, dict(shard))
+        self._shards = live
+
+    def _after_fork(self):
+        # a worker starts from zero; the parent's numbers stay in the parent's file
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = {}
+        self._flusher = None
+
+    def snapshot(self):
+        """Merged values of this process: {(name, labels): value or histogram list}."""
+        with self._lock:
+            self._retire_dead()
+            values = {}
+            merge(values, self._retired)
+            for _, shard in self._shards:
+                # dict() copies under the GIL, so a writer thread cannot change it mid-copy
+                merge(values, dict(shard))
+        for metric, collect in self.collectors:
+            for labels, value in collect().items():
+                values[(metric.name, labels)] = value
+        return values
+
+    def _start_flusher(self):
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        if not self.directory:
+            return
+        path = Path(self.directory) / f'{os.getpid()}.json'
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(encode(self.snapshot())), encoding='utf-8')
+        os.replace(tmp, path)
+
+    def collect_all(self):
+        """This process live, plus the last flushed snapshot of every other process in the directory."""
+        values = self.snapshot()
+        if self.directory:
+            self._merge_processes(values)
+        for metric, compute in self.derivations:
+            for labels, value in compute(values).items():
+                values[(metric.name, labels)] = value
+        return values
+
+    def _merge_processes(self, values):
+        own = os.getpid()
+        for path in Path(self.directory).glob('*.json'):
+            pid = int(path.stem)
+            if pid == own:
+                continue
+            try:
+                other = decode(json.loads(path.read_text(encoding='utf-8')))
+            except (OSError, ValueError):
+                continue
+            if not alive(pid):
+                # counters and histograms of an exited worker still count; its gauges do not
+                other = {key: value for key, value in other.items()
+                         if key[0] not in self.metrics or self.metrics[key[0]].kind != 'gauge'}
+            merge(values, other)
+
+    def render(self, values):
+        lines = []
+        for name, metric in self.metrics.items():
+            samples = sorted((labels, value) for (key, labels), value in values.items() if key == name)
+            if not samples:
+                continue
+            lines.append(f'# HELP {name} {metric.help}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for labels, value in samples:
+                pairs = list(zip(metric.labels, labels))
+                if metric.kind == 'histogram':
+                    for bound, count in zip(metric.buckets + (math.inf,), accumulate(value[:-2])):
+                        lines.append(f'{name}_bucket{label_text(pairs + [("le", format_bound(bound))])} {count}')
+                    lines.append(f'{name}_sum{label_text(pairs)} {value[-2]}')
+                    lines.append(f'{name}_count{label_text(pairs)} {value[-1]}')
+                else:
+                    lines.append(f'{name}{label_text(pairs)} {value}')
+        return '\n'.join(lines) + '\n'
+
+def merge(into, values):
+    for key, value in values.items():
+        current = into.get(key)
+        if current is None:
+            into[key] = list(value) if isinstance(value, list) else value
+        elif isinstance(value, list):
+            for i, v in enumerate(value):
+                current[i] += v
+        else:
+            into[key] = current + value
+
+def encode(values):
+    return [[name, list(labels), value] for (name, labels), value in values.items()]
+
+def decode(rows):
+    return {(name, tuple(labels)): value for name, labels, value in rows}
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def format_bound(bound):
+    return '+Inf' if bound == math.inf else repr(float(bound))
+
+def label_text(pairs):
+    if not pairs:
+        return ''
+    escaped = (k + '="' + str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"' for k, v in pairs)
+    return '{' + ','.join(escaped) + '}'
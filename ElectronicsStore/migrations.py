@@ -0,0 +1,396 @@
+# Numbered schema migrations on top of schema.sql. PRAGMA user_version holds the number of
+# migrations applied; append new ones to MIGRATIONS and never edit or reorder applied ones.
+
+def orders_status_column(con):
+    cols = [row[1] for row in con.execute('PRAGMA table_info(orders)')]
+    if 'status' not in cols:
+        con.execute("ALTER TABLE orders ADD COLUMN status TEXT DEFAULT 'Новый'")
+        con.execute("UPDATE orders SET status = 'Новый' WHERE status IS NULL")
+
+def catalog_sort_indexes(con):
+    con.execute('CREATE INDEX IF NOT EXISTS idx_products_name ON products(name, id)')
+    con.execute('CREATE INDEX IF NOT EXISTS idx_products_price ON products(price, id)')
+    con.execute('CREATE INDEX IF NOT EXISTS idx_products_rating ON products(rating, id)')
+
+def products_search_index(con):
+    con.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, brand, model, spec, description,
+        content='products',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )''')
+    con.execute('''CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, name, brand, model, spec, description)
+        VALUES (new.id, new.name, new.brand, new.model, new.spec, new.description);
+    END''')
+    con.execute('''CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, brand, model, spec, description)
+        VALUES ('delete', old.id, old.name, old.brand, old.model, old.spec, old.description);
+    END''')
+    con.execute('''CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, brand, model, spec, description ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, brand, model, spec, description)
+        VALUES ('delete', old.id, old.name, old.brand, old.model, old.spec, old.description);
+        INSERT INTO products_fts(rowid, name, brand, model, spec, description)
+        VALUES (new.id, new.name, new.brand, new.model, new.spec, new.description);
+    END''')
+    con.execute("INSERT INTO products_fts(products_fts) VALUES('rebuild')")
+
+def foreign_key_indexes(con):
+    con.execute('CREATE INDEX IF NOT EXISTS idx_products_category ON products(category_id)')
+    con.execute('CREATE INDEX IF NOT EXISTS idx_orders_customer ON orders(customer_id)')
+    con.execute('CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id)')
+    con.execute('CREATE INDEX IF NOT EXISTS idx_order_items_product ON order_items(product_id)')
+
+def orders_listing_indexes(con):
+    con.execute('CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders(status, created_at)')
+    con.execute('CREATE INDEX IF NOT EXISTS idx_orders_created ON orders(created_at)')
+    con.execute('CREATE INDEX IF NOT EXISTS idx_orders_total ON orders(total)')
+
+def create_fts(con, name, content, columns, prefix):
+    # external-content FTS5 table over `content` plus the triggers that keep it in sync
+    cols = ', '.join(columns)
+    new = ', '.join(f'new.{c}' for c in columns)
+    old = ', '.join(f'old.{c}' for c in columns)
+    con.execute(f'''CREATE VIRTUAL TABLE {name} USING fts5(
+        {cols},
+        content='{content}',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='{prefix}'
+    )''')
+    con.execute(f'''CREATE TRIGGER {name}_ai AFTER INSERT ON {content} BEGIN
+        INSERT INTO {name}(rowid, {cols}) VALUES (new.id, {new});
+    END''')
+    con.execute(f'''CREATE TRIGGER {name}_ad AFTER DELETE ON {content} BEGIN
+        INSERT INTO {name}({name}, rowid, {cols}) VALUES ('delete', old.id, {old});
+    END''')
+    con.execute(f'''CREATE TRIGGER {name}_au AFTER UPDATE OF {cols} ON {content} BEGIN
+        INSERT INTO {name}({name}, rowid, {cols}) VALUES ('delete', old.id, {old});
+        INSERT INTO {name}(rowid, {cols}) VALUES (new.id, {new});
+    END''')
+    con.execute(f"INSERT INTO {name}({name}) VALUES('rebuild')")
+
+def typeahead_prefix_indexes(con):
+    # prefix indexes make the short "abc*" queries typed into the order form cheap
+    for trigger in ('products_fts_ai', 'products_fts_ad', 'products_fts_au'):
+        con.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    con.execute('DROP TABLE IF EXISTS products_fts')
+    create_fts(con, 'products_fts', 'products', ['name', 'brand', 'model', 'spec', 'description'], '2 3')
+    create_fts(con, 'customers_fts', 'customers', ['first_name', 'last_name', 'phone', 'email'], '2 3')
+
+def data_versions(con):
+    # per-table write counters, bumped by triggers on every row change; used for ETags and caches
+    con.execute('CREATE TABLE IF NOT EXISTS data_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)')
+    for table in ('categories', 'products', 'customers', 'orders', 'order_items'):
+        con.execute('INSERT OR IGNORE INTO data_versions(name) VALUES (?)', (table,))
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            con.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()} AFTER {event} ON {table} BEGIN
+                UPDATE data_versions SET version = version + 1 WHERE name = '{table}';
+            END''')
+
+# lower bounds of the catalog price facet buckets; the last bucket is open-ended
+PRICE_BUCKETS = [0, 1000, 5000, 10000, 50000, 100000]
+
+def price_bucket_sql(column):
+    cases = ' '.join(f'WHEN {column} >= {lo} THEN {lo}' for lo in reversed(PRICE_BUCKETS[1:]))
+    return f'CASE {cases} ELSE {PRICE_BUCKETS[0]} END'
+
+def facet_values(row):
+    # (facet, value expression) pairs for a products row reference such as new/old/products
+    return [
+        ('category', f"COALESCE({row}.category_id, '')"),
+        ('brand', f"COALESCE({row}.brand, '')"),
+        ('price', price_bucket_sql(f'{row}.price')),
+        ('rating', f'CAST(COALESCE({row}.rating, 0) AS INTEGER)'),
+    ]
+
+FACET_REBUILD_SQL = ['DELETE FROM product_facets'] + [
+    f"INSERT INTO product_facets(facet, value, count) SELECT '{facet}', {expr}, COUNT(*) FROM products GROUP BY 2"
+    for facet, expr in facet_values('products')
+]
+
+def product_facets(con):
+    con.execute('''CREATE TABLE IF NOT EXISTS product_facets (
+        facet TEXT NOT NULL,
+        value TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (facet, value)
+    ) WITHOUT ROWID''')
+    con.execute('CREATE INDEX IF NOT EXISTS idx_products_brand ON products(brand)')
+
+    def bump(row, delta):
+        return '\n'.join(
+            f"INSERT INTO product_facets(facet, value, count) VALUES ('{facet}', {expr}, {delta}) "
+            f"ON CONFLICT(facet, value) DO UPDATE SET count = count + {delta};"
+            for facet, expr in facet_values(row)
+        )
+
+    con.execute(f'''CREATE TRIGGER IF NOT EXISTS product_facets_ai AFTER INSERT ON products BEGIN
+        {bump('new', 1)}
+    END''')
+    con.execute(f'''CREATE TRIGGER IF NOT EXISTS product_facets_ad AFTER DELETE ON products BEGIN
+        {bump('old', -1)}
+    END''')
+    con.execute(f'''CREATE TRIGGER IF NOT EXISTS product_facets_au AFTER UPDATE OF category_id, brand, price, rating ON products BEGIN
+        {bump('old', -1)}
+        {bump('new', 1)}
+    END''')
+    for stmt in FACET_REBUILD_SQL:
+        con.execute(stmt)
+
+CANCELED_STATUS = 'Отменен'
+
+# sales summary table -> (key column, aggregate columns, SELECT that computes it from the live tables)
+SALES_SUMMARIES = {
+    'sales_daily': ('day', ('orders', 'units', 'revenue'), f'''
+        SELECT COALESCE(date(o.created_at), ''), COUNT(DISTINCT o.id),
+               COALESCE(SUM(oi.quantity), 0), COALESCE(SUM(oi.price * oi.quantity), 0)
+        FROM orders o LEFT JOIN order_items oi ON oi.order_id = o.id
+        WHERE o.status IS NOT '{CANCELED_STATUS}' GROUP BY 1'''),
+    'sales_by_category': ('category_id', ('units', 'revenue'), f'''
+        SELECT COALESCE(p.category_id, 0), SUM(oi.quantity), SUM(oi.price * oi.quantity)
+        FROM order_items oi JOIN orders o ON o.id = oi.order_id LEFT JOIN products p ON p.id = oi.product_id
+        WHERE o.status IS NOT '{CANCELED_STATUS}' GROUP BY 1'''),
+    'sales_by_product': ('product_id', ('units', 'revenue'), f'''
+        SELECT oi.product_id, SUM(oi.quantity), SUM(oi.price * oi.quantity)
+        FROM order_items oi JOIN orders o ON o.id = oi.order_id
+        WHERE o.status IS NOT '{CANCELED_STATUS}' GROUP BY 1'''),
+    'sales_by_customer': ('customer_id', ('orders', 'units', 'revenue'), f'''
+        SELECT COALESCE(o.customer_id, 0), COUNT(DISTINCT o.id),
+               COALESCE(SUM(oi.quantity), 0), COALESCE(SUM(oi.price * oi.quantity), 0)
+        FROM orders o LEFT JOIN order_items oi ON oi.order_id = o.id
+        WHERE o.status IS NOT '{CANCELED_STATUS}' GROUP BY 1'''),
+}
+
+def upsert_sales(table, select):
+    key, aggregates, _ = SALES_SUMMARIES[table]
+    cols = ', '.join(aggregates)
+    updates = ', '.join(f'{col} = {col} + excluded.{col}' for col in aggregates)
+    return f'INSERT INTO {table}({key}, {cols}) {select} ON CONFLICT({key}) DO UPDATE SET {updates};'
+
+def item_sales_sql(row, sign):
+    # applies one order_items row to every summary, unless its order is canceled
+    live = f"FROM orders o WHERE o.id = {row}.order_id AND o.status IS NOT '{CANCELED_STATUS}'"
+    units = f'{sign} * {row}.quantity'
+    revenue = f'{sign} * {row}.price * {row}.quantity'
+    return '\n'.join([
+        upsert_sales('sales_daily', f"SELECT COALESCE(date(o.created_at), ''), 0, {units}, {revenue} {live}"),
+        upsert_sales('sales_by_category', f'SELECT COALESCE((SELECT category_id FROM products WHERE id = {row}.product_id), 0), '
+                                          f'{units}, {revenue} {live}'),
+        upsert_sales('sales_by_product', f'SELECT {row}.product_id, {units}, {revenue} {live}'),
+        upsert_sales('sales_by_customer', f'SELECT COALESCE(o.customer_id, 0), 0, {units}, {revenue} {live}'),
+    ])
+
+def order_sales_sql(row, sign):
+    # applies a whole order (its count and all of its items) to every summary
+    items = f'FROM order_items oi WHERE oi.order_id = {row}.id'
+    return '\n'.join([
+        upsert_sales('sales_daily', f"SELECT COALESCE(date({row}.created_at), ''), {sign}, "
+                                    f'{sign} * COALESCE(SUM(oi.quantity), 0), {sign} * COALESCE(SUM(oi.price * oi.quantity), 0) {items}'),
+        upsert_sales('sales_by_category', f'SELECT COALESCE(p.category_id, 0), {sign} * SUM(oi.quantity), {sign} * SUM(oi.price * oi.quantity) '
+                                          f'FROM order_items oi LEFT JOIN products p ON p.id = oi.product_id '
+                                          f'WHERE oi.order_id = {row}.id GROUP BY 1'),
+        upsert_sales('sales_by_product', f'SELECT oi.product_id, {sign} * SUM(oi.quantity), {sign} * SUM(oi.price * oi.quantity) '
+                                         f'{items} GROUP BY 1'),
+        upsert_sales('sales_by_customer', f'SELECT COALESCE({row}.customer_id, 0), {sign}, '
+                                          f'{sign} * COALESCE(SUM(oi.quantity), 0), {sign} * COALESCE(SUM(oi.price * oi.quantity), 0) {items}'),
+    ])
+
+def order_count_sql(row, sign):
+    return '\n'.join([
+        upsert_sales('sales_daily', f"SELECT COALESCE(date({row}.created_at), ''), {sign}, 0, 0 WHERE {row}.status IS NOT '{CANCELED_STATUS}'"),
+        upsert_sales('sales_by_customer', f"SELECT COALESCE({row}.customer_id, 0), {sign}, 0, 0 WHERE {row}.status IS NOT '{CANCELED_STATUS}'"),
+    ])
+
+def sales_summaries(con):
+    for table, (key, aggregates, select) in SALES_SUMMARIES.items():
+        key_type = 'TEXT' if key == 'day' else 'INTEGER'
+        cols = ', '.join(f'{col} {"REAL" if col == "revenue" else "INTEGER"} NOT NULL DEFAULT 0' for col in aggregates)
+        con.execute(f'CREATE TABLE IF NOT EXISTS {table} ({key} {key_type} PRIMARY KEY, {cols}) WITHOUT ROWID')
+        con.execute(f'INSERT INTO {table}({key}, {", ".join(aggregates)}) {select}')
+    con.execute('CREATE INDEX IF NOT EXISTS idx_sales_by_product_revenue ON sales_by_product(revenue)')
+    con.execute('CREATE INDEX IF NOT EXISTS idx_sales_by_customer_revenue ON sales_by_customer(revenue)')
+    # order_items rows are inserted after their order and deleted before it (foreign keys), so item
+    # triggers carry the amounts and order triggers carry the order counts
+    con.execute(f'''CREATE TRIGGER IF NOT EXISTS order_items_sales_ai AFTER INSERT ON order_items BEGIN
+        {item_sales_sql('new', 1)}
+    END''')
+    con.execute(f'''CREATE TRIGGER IF NOT EXISTS order_items_sales_ad AFTER DELETE ON order_items BEGIN
+        {item_sales_sql('old', -1)}
+    END''')
+    con.execute(f'''CREATE TRIGGER IF NOT EXISTS orders_sales_ai AFTER INSERT ON orders BEGIN
+        {order_count_sql('new', 1)}
+    END''')
+    con.execute(f'''CREATE TRIGGER IF NOT EXISTS orders_sales_ad AFTER DELETE ON orders BEGIN
+        {order_count_sql('old', -1)}
+    END''')
+    con.execute(f'''CREATE TRIGGER IF NOT EXISTS orders_sales_cancel AFTER UPDATE OF status ON orders
+        WHEN old.status IS NOT '{CANCELED_STATUS}' AND new.status IS '{CANCELED_STATUS}' BEGIN
+        {order_sales_sql('new', -1)}
+    END''')
+    con.execute(f'''CREATE TRIGGER IF NOT EXISTS orders_sales_restore AFTER UPDATE OF status ON orders
+        WHEN old.status IS '{CANCELED_STATUS}' AND new.status IS NOT '{CANCELED_STATUS}' BEGIN
+        {order_sales_sql('new', 1)}
+    END''')
+
+# recomputes the denormalized items summary of orders; append a WHERE to limit it
+ORDER_SUMMARY_SQL = '''UPDATE orders SET
+    items_summary = (SELECT GROUP_CONCAT(p.name || ' (x' || oi.quantity || ')', '; ')
+                     FROM order_items oi LEFT JOIN products p ON p.id = oi.product_id
+                     WHERE oi.order_id = orders.id),
+    item_count = (SELECT COUNT(*) FROM order_items oi WHERE oi.order_id = orders.id)'''
+
+def order_items_summary(con):
+    cols = [row[1] for row in con.execute('PRAGMA table_info(orders)')]
+    if 'items_summary' not in cols:
+        con.execute('ALTER TABLE orders ADD COLUMN items_summary TEXT')
+    if 'item_count' not in cols:
+        con.execute('ALTER TABLE orders ADD COLUMN item_count INTEGER NOT NULL DEFAULT 0')
+    con.execute(ORDER_SUMMARY_SQL)
+    # new orders get their summary from create_order; renames are fanned out to the orders that list the product
+    con.execute(f'''CREATE TRIGGER IF NOT EXISTS products_order_summary_au AFTER UPDATE OF name ON products
+        WHEN old.name IS NOT new.name BEGIN
+        {ORDER_SUMMARY_SQL} WHERE id IN (SELECT order_id FROM order_items WHERE product_id = new.id);
+    END''')
+
+# one initial-status row per existing order, for orders loaded while the history triggers were absent
+ORDER_HISTORY_BACKFILL_SQL = '''INSERT INTO order_status_history(order_id, old_status, new_status, changed_at)
+    SELECT id, NULL, status, COALESCE(created_at, datetime('now')) FROM orders'''
+
+def order_status_history(con):
+    # append-only log of status changes (including the initial status); no foreign key, so deleted
+    # orders keep their history
+    con.execute('''CREATE TABLE IF NOT EXISTS order_status_history (
+        id INTEGER PRIMARY KEY,
+        order_id INTEGER NOT NULL,
+        old_status TEXT,
+        new_status TEXT,
+        changed_at TEXT NOT NULL
+    )''')
+    con.execute('CREATE INDEX IF NOT EXISTS idx_order_status_history_changed ON order_status_history(changed_at)')
+    con.execute('CREATE INDEX IF NOT EXISTS idx_order_status_history_order ON order_status_history(order_id)')
+    con.execute('''CREATE TRIGGER IF NOT EXISTS orders_status_history_ai AFTER INSERT ON orders BEGIN
+        INSERT INTO order_status_history(order_id, old_status, new_status, changed_at)
+        VALUES (new.id, NULL, new.status, datetime('now'));
+    END''')
+    con.execute('''CREATE TRIGGER IF NOT EXISTS orders_status_history_au AFTER UPDATE OF status ON orders
+        WHEN old.status IS NOT new.status BEGIN
+        INSERT INTO order_status_history(order_id, old_status, new_status, changed_at)
+        VALUES (new.id, old.status, new.status, datetime('now'));
+    END''')
+    for event in ('UPDATE', 'DELETE'):
+        con.execute(f'''CREATE TRIGGER IF NOT EXISTS order_status_history_no_{event.lower()}
+            BEFORE {event} ON order_status_history BEGIN
+            SELECT RAISE(ABORT, 'order_status_history is append-only');
+        END''')
+    con.execute(ORDER_HISTORY_BACKFILL_SQL)
+
+def product_images(con):
+    # source image URL -> content-addressed thumbnail file; a failed fetch keeps its error and time,
+    # so a broken URL is not fetched again on every page view
+    con.execute('''CREATE TABLE IF NOT EXISTS product_images (
+        url TEXT PRIMARY KEY,
+        file TEXT,
+        error TEXT,
+        fetched_at INTEGER NOT NULL
+    ) WITHOUT ROWID''')
+
+def rating_sort_index(con):
+    # the catalog sorts by COALESCE(rating, 0) so that products without a rating can be paged past
+    con.execute('DROP INDEX IF EXISTS idx_products_rating')
+    con.execute('CREATE INDEX IF NOT EXISTS idx_products_rating_key ON products(COALESCE(rating, 0), id)')
+
+def product_blank_defaults(con):
+    # the CSV importer used to store blank stock and rating cells as NULL instead of their DEFAULT 0
+    con.execute('UPDATE products SET stock = 0 WHERE stock IS NULL')
+    con.execute('UPDATE products SET rating = 0 WHERE rating IS NULL')
+
+# recomputes sales_by_category from the live tables, i.e. under the products' current categories
+SALES_CATEGORY_REBUILD_SQL = ['DELETE FROM sales_by_category',
+                              f"INSERT INTO sales_by_category(category_id, units, revenue) {SALES_SUMMARIES['sales_by_category'][2]}"]
+
+def sales_category_moves(con):
+    # the sales triggers file an item under its product's current category, so a product that changes
+    # category takes its sales so far (its sales_by_product row) along, or a later cancel debits the new one
+    con.execute(f'''CREATE TRIGGER IF NOT EXISTS products_sales_category_au AFTER UPDATE OF category_id ON products
+        WHEN old.category_id IS NOT new.category_id BEGIN
+        {upsert_sales('sales_by_category', 'SELECT COALESCE(old.category_id, 0), -units, -revenue FROM sales_by_product WHERE product_id = new.id')}
+        {upsert_sales('sales_by_category', 'SELECT COALESCE(new.category_id, 0), units, revenue FROM sales_by_product WHERE product_id = new.id')}
+    END''')
+    # summaries of databases where products already changed category
+    for stmt in SALES_CATEGORY_REBUILD_SQL:
+        con.execute(stmt)
+
+# gives back (sign 1) or takes again (sign -1) the quantities of order {row}'s items
+def order_stock_sql(row, sign):
+    return f'''UPDATE products SET stock = stock {'+' if sign > 0 else '-'} (
+            SELECT SUM(oi.quantity) FROM order_items oi WHERE oi.order_id = {row}.id AND oi.product_id = products.id)
+        WHERE id IN (SELECT product_id FROM order_items WHERE order_id = {row}.id);'''
+
+def order_stock_returns(con):
+    # creating an order takes stock (the guarded UPDATE in create_order); canceling or deleting it gives
+    # the stock back and restoring a canceled order takes it again, refused if there is not enough left
+    con.execute(f'''CREATE TRIGGER IF NOT EXISTS order_items_stock_ad AFTER DELETE ON order_items
+        WHEN EXISTS (SELECT 1 FROM orders WHERE id = old.order_id AND status IS NOT '{CANCELED_STATUS}') BEGIN
+        UPDATE products SET stock = stock + old.quantity WHERE id = old.product_id;
+    END''')
+    con.execute(f'''CREATE TRIGGER IF NOT EXISTS orders_stock_cancel AFTER UPDATE OF status ON orders
+        WHEN old.status IS NOT '{CANCELED_STATUS}' AND new.status IS '{CANCELED_STATUS}' BEGIN
+        {order_stock_sql('new', 1)}
+    END''')
+    con.execute(f'''CREATE TRIGGER IF NOT EXISTS orders_stock_restore AFTER UPDATE OF status ON orders
+        WHEN old.status IS '{CANCELED_STATUS}' AND new.status IS NOT '{CANCELED_STATUS}' BEGIN
+        SELECT RAISE(ABORT, 'insufficient stock') WHERE EXISTS (
+            SELECT 1 FROM order_items oi JOIN products p ON p.id = oi.product_id WHERE oi.order_id = new.id
+            GROUP BY p.id HAVING MAX(p.stock) < SUM(oi.quantity));
+        {order_stock_sql('new', -1)}
+    END''')
+
+def orders_sort_indexes(con):
+    # the /orders status sort and the status-filtered total sort read pages straight off these,
+    # where idx_orders_status_created left a temp b-tree sort of every matching row
+    con.execute('CREATE INDEX IF NOT EXISTS idx_orders_status_id ON orders(status, id)')
+    con.execute('CREATE INDEX IF NOT EXISTS idx_orders_status_total ON orders(status, total, id)')
+
+MIGRATIONS = [
+    orders_status_column,
+    catalog_sort_indexes,
+    products_search_index,
+    foreign_key_indexes,
+    orders_listing_indexes,
+    typeahead_prefix_indexes,
+    data_versions,
+    product_facets,
+    sales_summaries,
+    order_items_summary,
+    order_status_history,
+    product_images,
+    rating_sort_index,
+    product_blank_defaults,
+    sales_category_moves,
+    order_stock_returns,
+    orders_sort_indexes,
+]
+
+def schema_version(con):
+    return con.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(con):
+    # one transaction per migration; the version is re-read under the write lock so that
+    # several processes starting at once apply each migration exactly once
+    applied = []
+    while True:
+        con.execute('BEGIN IMMEDIATE')
+        try:
+            version = schema_version(con)
+            if version >= len(MIGRATIONS):
+                con.commit()
+                return applied
+            migration = MIGRATIONS[version]
+            migration(con)
+            con.execute(f'PRAGMA user_version = {version + 1}')
+        except Exception:
+            con.rollback()
+            raise
+        con.commit()
+        applied.append(migration.__name__)
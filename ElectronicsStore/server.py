@@ -0,0 +1,173 @@
+# Production server: pre-forked worker processes, each with a bounded thread pool, on one listening socket.
+#
+#     python server.py --host 0.0.0.0 --port 8000 --workers 4 --threads 8
+#
+# The parent creates or migrates the database and compiles the templates once, then forks; every worker
+# opens its own connection pool on its first request. SIGTERM or SIGINT makes the workers stop accepting,
+# finish the requests in flight (up to --graceful-timeout seconds) and exit. A worker that dies is replaced,
+# after a growing delay when workers keep dying right after they start.
+import argparse
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+import app as store
+
+class RequestHandler(WSGIRequestHandler):
+    # an idle keep-alive connection gives its pool thread back after this many seconds
+    timeout = 5
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Hands each connection to one of `threads` pool threads; more connections wait in the queue."""
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads, fd):
+        super().__init__(host, port, app, handler=RequestHandler, fd=fd)
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='request')
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        if hasattr(self, 'executor'):
+            self.executor.shutdown(wait=True)
+        super().server_close()
+
+def listen(host, port, backlog=1024):
+    sock = socket.create_server((host, port), backlog=backlog)
+    sock.set_inheritable(True)
+    return sock
+
+def prepare():
+    # once in the parent: schema, migrations and a clean metrics directory; importing app has already
+    # compiled the templates and compressed the static assets, so workers inherit them ready to serve
+    store.init_db()
+    directory = store.app.config['METRICS_DIR']
+    if directory:
+        # snapshots of a previous run would be merged into this one's counters
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        for path in Path(directory).glob('*.json'):
+            path.unlink()
+
+def run_worker(sock, threads):
+    server = PooledWSGIServer(*sock.getsockname()[:2], store.app, threads, sock.fileno())
+
+    def stop(signum, frame):
+        store.draining.set()
+        # shutdown() waits for serve_forever() to return, so it cannot run on this (the serving) thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        store.metrics.flush()
+
+# a worker that exits sooner than this after starting is crashing at startup; its replacement waits,
+# doubling the wait for every such crash in a row up to the maximum
+STARTUP_SECONDS = 5
+RESPAWN_BACKOFF_MAX = 30
+
+def spawn(sock, threads):
+    pid = os.fork()
+    if pid == 0:
+        # the parent's handlers would signal the siblings in the inherited `children`; run_worker()
+        # installs the worker's own
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        try:
+            run_worker(sock, threads)
+        except BaseException:
+            traceback.print_exc()
+            os._exit(1)
+        os._exit(0)
+    return pid
+
+def serve(sock, workers, threads, graceful_timeout=30, log=print):
+    """Fork `workers` processes serving on `sock` and supervise them until SIGTERM or SIGINT."""
+    stopping = threading.Event()
+    children = set()
+
+    def stop(signum, frame):
+        stopping.set()
+        for pid in list(children):
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    started = {}
+    backoff = 0
+    waiting = 0
+    respawn_at = 0
+
+    def start():
+        pid = spawn(sock, threads)
+        children.add(pid)
+        started[pid] = time.monotonic()
+
+    for _ in range(workers):
+        start()
+    host, port = sock.getsockname()[:2]
+    log(f'serving on {host}:{port} with {workers} workers x {threads} threads')
+    deadline = None
+    while children or (waiting and not stopping.is_set()):
+        pid, status = os.waitpid(-1, os.WNOHANG) if children else (0, 0)
+        if pid:
+            children.discard(pid)
+            now = time.monotonic()
+            crashed_at_startup = now - started.pop(pid) < STARTUP_SECONDS
+            if not stopping.is_set():
+                backoff = min(backoff * 2 or 0.5, RESPAWN_BACKOFF_MAX) if crashed_at_startup else 0
+                waiting += 1
+                respawn_at = now + backoff
+                log(f'worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, '
+                    f'starting a new one in {backoff:g}s')
+            continue
+        if waiting and not stopping.is_set() and time.monotonic() >= respawn_at:
+            waiting -= 1
+            start()
+            continue
+        if stopping.is_set():
+            if deadline is None:
+                deadline = time.monotonic() + graceful_timeout
+            elif time.monotonic() > deadline:
+                log(f'killing {len(children)} workers still busy after {graceful_timeout}s')
+                for pid in children:
+                    os.kill(pid, signal.SIGKILL)
+                deadline = float('inf')
+        time.sleep(0.1)
+    sock.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-forked production server for the store')
+    parser.add_argument('--host', default=os.environ.get('HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 8000)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_WORKERS', os.cpu_count() or 1)),
+                        help='worker processes')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('WEB_THREADS', 4)),
+                        help='request threads per worker; keep it at or below DB_POOL_SIZE')
+    parser.add_argument('--graceful-timeout', type=float, default=30,
+                        help='seconds workers get to finish requests in flight after SIGTERM')
+    args = parser.parse_args()
+
+    prepare()
+    serve(listen(args.host, args.port), args.workers, args.threads, args.graceful_timeout)
+
+if __name__ == '__main__':
+    main()
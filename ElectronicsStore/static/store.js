@@ -0,0 +1,56 @@
+function bindLookup(input) {
+    const select = input.parentElement.querySelector('select');
+    let timer = null;
+    input.addEventListener('input', () => {
+        clearTimeout(timer);
+        timer = setTimeout(async () => {
+            const q = input.value.trim();
+            if (!q) {
+                return;
+            }
+            const resp = await fetch(input.dataset.source + '?q=' + encodeURIComponent(q));
+            const results = await resp.json();
+            select.length = 1;
+            results.forEach((r) => select.add(new Option(r.label, r.id)));
+            if (results.length) {
+                select.selectedIndex = 1;
+            }
+        }, 200);
+    });
+}
+function addProduct() {
+    const container = document.getElementById('products-container');
+    const row = document.createElement('div');
+    row.className = 'product-row';
+    row.innerHTML = `
+        <input type="search" class="lookup" data-source="/autocomplete/products" placeholder="Поиск товара" autocomplete="off">
+        <select name="product_ids" required><option value="">Выберите товар</option></select>
+        <input name="quantities" type="number" min="1" placeholder="Количество" required>
+        <button type="button" onclick="removeProduct(this)">Удалить</button>
+    `;
+    container.appendChild(row);
+    bindLookup(row.querySelector('.lookup'));
+}
+function removeProduct(btn) {
+    btn.parentElement.remove();
+}
+function updateStatusClass(selectEl) {
+    const option = selectEl.options[selectEl.selectedIndex];
+    const cls = option.getAttribute('data-status-class') || 'new';
+    selectEl.className = 'status-select status-' + cls;
+    if (selectEl.form) {
+        selectEl.form.submit();
+    }
+}
+window.addEventListener('DOMContentLoaded', () => {
+    document.querySelectorAll('.lookup').forEach(bindLookup);
+    document.querySelectorAll('.status-select').forEach((selectEl) => {
+        selectEl.addEventListener('change', () => updateStatusClass(selectEl));
+    });
+    const selectAll = document.getElementById('select-all');
+    if (selectAll) {
+        selectAll.addEventListener('change', () => {
+            document.querySelectorAll('input[name="order_ids"]').forEach((box) => { box.checked = selectAll.checked; });
+        });
+    }
+});
@@ -0,0 +1,60 @@
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as store
+
+class Origin:
+    """A local stand-in for a third-party image server: path -> (status, headers, body), and the paths it was asked for."""
+
+    def __init__(self):
+        self.routes = {}
+        self.hits = []
+        origin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                origin.hits.append(self.path)
+                status, headers, body = origin.routes.get(self.path, (404, {}, b'not found'))
+                if callable(body):
+                    body = body()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value.format(port=origin.port))
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def url(self, path, host='127.0.0.1'):
+        return f'http://{host}:{self.port}{path}'
+
+@pytest.fixture
+def origin():
+    server = Origin()
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
+
+@pytest.fixture
+def client(tmp_path):
+    # the app on an empty database of its own; its pool and writer are rebuilt for that database
+    store.DB_PATH = tmp_path / 'electronics.db'
+    store._pool = None
+    store._writer = None
+    store.app.config.update(THUMBNAIL_DIR=str(tmp_path / 'thumbnails'), PAGE_CACHE_ENABLED=False)
+    store.init_db()
+    yield store.app.test_client()
+    store.get_pool().close()
+    store._pool = None
@@ -0,0 +1,22 @@
+import sqlite3
+
+import pytest
+
+import app as store
+from benchmarks.load import unavailable_cause
+
+@pytest.mark.parametrize('message, cause', [
+    ('database is locked', 'database_locked'),
+    ('database table is locked: orders', 'database_locked'),
+    ('write queue busy', 'write_queue_busy'),
+    ('connection pool exhausted', 'pool_exhausted'),
+])
+def test_load_report_names_the_cause_of_a_503(message, cause):
+    with store.app.test_request_context():
+        body, status, headers = store.database_busy(sqlite3.OperationalError(message))
+    assert status == 503 and headers == {'Retry-After': '1'}
+    assert unavailable_cause(body.encode('utf-8')) == cause
+
+def test_other_operational_errors_are_not_503():
+    with store.app.test_request_context(), pytest.raises(sqlite3.OperationalError):
+        store.database_busy(sqlite3.OperationalError('no such table: nope'))
@@ -0,0 +1,48 @@
+import sqlite3
+
+import app as store
+from app import PRODUCT_SORTS, decode_cursor, keyset_page
+
+RATINGS = [4.5, None, 3.0, 4.5, None, 0, 2.0]
+
+def products_db():
+    con = sqlite3.connect(store.DB_PATH)
+    con.row_factory = sqlite3.Row
+    with con:
+        con.executemany(
+            "INSERT INTO products(name, brand, price, stock, rating, category_id) VALUES (?, 'B', 10, 1, ?, 1)",
+            [(f'Item {i}', rating) for i, rating in enumerate(RATINGS)]
+        )
+    return con
+
+def rating_pages(con, descending, **cursor):
+    keys = [PRODUCT_SORTS['rating'], ('p.id', 'id')]
+    sql = 'SELECT p.*, COALESCE(p.rating, 0) AS rating_key FROM products p'
+    return keyset_page(con, sql, [], [], keys, 2, descending=descending, **cursor)
+
+def test_rating_sort_pages_through_unrated_products(client):
+    con = products_db()
+    names = sorted(row['name'] for row in con.execute('SELECT name FROM products'))
+    for descending in (False, True):
+        page = rating_pages(con, descending)
+        seen = [row['name'] for row in page.rows]
+        while page.next_cursor:
+            page = rating_pages(con, descending, after=decode_cursor(page.next_cursor))
+            seen += [row['name'] for row in page.rows]
+        assert sorted(seen) == names
+        # and back again from the last page
+        back = [row['name'] for row in page.rows]
+        while page.prev_cursor:
+            page = rating_pages(con, descending, before=decode_cursor(page.prev_cursor))
+            back = [row['name'] for row in page.rows] + back
+        assert back == seen
+    con.close()
+
+def test_rating_cursor_seeks_the_index(client):
+    con = products_db()
+    traced = []
+    con.set_trace_callback(traced.append)
+    rating_pages(con, True, after=[3.0, 3])
+    plan = ' '.join(row[3] for row in con.execute(f'EXPLAIN QUERY PLAN {traced[-1]}'))
+    assert 'SEARCH p USING INDEX idx_products_rating_key' in plan
+    con.close()
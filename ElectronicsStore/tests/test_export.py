@@ -0,0 +1,16 @@
+import pytest
+
+import app as store
+
+@pytest.mark.parametrize('option', [['--status', 'Новый'], ['--date-from', '2024-01-01'], ['--date-to', '2024-01-31']])
+def test_cli_refuses_order_filters_on_other_tables(client, option):
+    result = store.app.test_cli_runner().invoke(args=['export', 'products', *option])
+    assert result.exit_code == 2
+    assert 'apply to orders and order_items only' in result.output
+    # the same combination as the HTTP export, which answers 400
+    assert client.get('/export/products.csv', query_string={option[0][2:].replace('-', '_'): option[1]}).status_code == 400
+
+def test_cli_exports_orders_with_filters(client):
+    result = store.app.test_cli_runner().invoke(args=['export', 'orders', '--status', 'Новый'])
+    assert result.exit_code == 0
+    assert result.output.lstrip('\ufeff').startswith('id,customer_id,')
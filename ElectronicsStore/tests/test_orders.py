@@ -0,0 +1,80 @@
+import sqlite3
+
+import app as store
+from migrations import CANCELED_STATUS
+
+def query(sql, params=()):
+    con = sqlite3.connect(store.DB_PATH)
+    try:
+        with con:
+            return con.execute(sql, params).fetchall()
+    finally:
+        con.close()
+
+def setup_stock(stock):
+    query("INSERT INTO customers(first_name, last_name, phone, email) VALUES ('Ann', 'Lee', '1', 'a@example.com')")
+    query("INSERT INTO products(name, brand, price, stock, category_id) VALUES ('Phone', 'B', 10, ?, 1)", (stock,))
+    return query('SELECT max(id) FROM customers')[0][0], query('SELECT max(id) FROM products')[0][0]
+
+def stock(product_id):
+    return query('SELECT stock FROM products WHERE id = ?', (product_id,))[0][0]
+
+def place(client, customer_id, product_id, quantity, status='Новый'):
+    client.post('/add_order', data={'customer_id': customer_id, 'status': status,
+                                    'product_ids': [product_id], 'quantities': [quantity]})
+    return query('SELECT max(id) FROM orders')[0][0]
+
+def set_status(client, order_id, status):
+    return client.post('/orders/update_status', data={'order_id': order_id, 'status': status})
+
+def test_cancel_and_restore_move_stock(client):
+    customer_id, product_id = setup_stock(5)
+    order_id = place(client, customer_id, product_id, 3)
+    assert stock(product_id) == 2
+    set_status(client, order_id, CANCELED_STATUS)
+    assert stock(product_id) == 5
+    set_status(client, order_id, 'Отправлен')
+    assert stock(product_id) == 2
+
+def test_restore_is_refused_without_stock(client):
+    customer_id, product_id = setup_stock(5)
+    order_id = place(client, customer_id, product_id, 3)
+    set_status(client, order_id, CANCELED_STATUS)
+    place(client, customer_id, product_id, 4)
+    assert stock(product_id) == 1
+    assert set_status(client, order_id, 'Новый').status_code == 409
+    assert query('SELECT status FROM orders WHERE id = ?', (order_id,))[0][0] == CANCELED_STATUS
+    response = client.post('/orders/bulk_status', json={'order_ids': [order_id], 'status': 'Новый'})
+    assert response.status_code == 409
+    assert stock(product_id) == 1
+
+def test_delete_returns_stock_once(client):
+    customer_id, product_id = setup_stock(5)
+    live = place(client, customer_id, product_id, 2)
+    canceled = place(client, customer_id, product_id, 1)
+    client.post('/orders/bulk_status', json={'order_ids': [canceled], 'status': CANCELED_STATUS})
+    assert stock(product_id) == 3
+    client.get(f'/delete_order/{live}')
+    client.get(f'/delete_order/{canceled}')
+    assert stock(product_id) == 5
+
+def test_order_created_canceled_holds_no_stock(client):
+    customer_id, product_id = setup_stock(5)
+    order_id = place(client, customer_id, product_id, 2, CANCELED_STATUS)
+    assert stock(product_id) == 5
+    set_status(client, order_id, 'Новый')
+    assert stock(product_id) == 3
+
+def test_order_sorts_read_pages_off_an_index(client):
+    con = sqlite3.connect(store.DB_PATH)
+    con.row_factory = sqlite3.Row
+    traced = []
+    con.set_trace_callback(traced.append)
+    for column, descending in store.ORDER_SORTS.values():
+        for status in ('', 'Новый'):
+            where, params = store.order_filters(status, '', '')
+            store.keyset_page(con, 'SELECT o.* FROM orders o', where, params, [(f'o.{column}', column), ('o.id', 'id')],
+                              50, after=['Новый' if column == 'status' else 0, 1], descending=descending)
+            plan = ' '.join(row[3] for row in con.execute(f'EXPLAIN QUERY PLAN {traced[-1]}'))
+            assert 'TEMP B-TREE' not in plan, (column, status, plan)
+    con.close()
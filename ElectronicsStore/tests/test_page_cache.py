@@ -0,0 +1,66 @@
+import sqlite3
+
+import app as store
+
+def add_products(count):
+    con = sqlite3.connect(store.DB_PATH)
+    with con:
+        con.executemany(
+            "INSERT INTO products(name, brand, price, stock, category_id) VALUES (?, 'B', 10, 1, 1)",
+            [(f'Item {i}',) for i in range(count)]
+        )
+    con.close()
+
+def test_compressed_copies_count_towards_the_size(client):
+    store.app.config.update(PAGE_CACHE_ENABLED=True, COMPRESS_ENABLED=True)
+    store.page_cache.clear()
+    add_products(50)
+    client.get('/')
+    plain = store.page_cache.size
+    gzipped = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert gzipped.content_encoding == 'gzip'
+    assert store.page_cache.size == plain + len(gzipped.data)
+    # served from the entry, not counted again
+    client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert store.page_cache.size == plain + len(gzipped.data)
+
+def test_grown_entry_is_evicted_over_the_limit():
+    cache = store.LRUCache(10, max_bytes=100)
+    first, second = {}, {}
+    cache.set('a', first, 40)
+    cache.set('b', second, 40)
+    cache.grow('b', second, 30)
+    assert cache.get('a') is None
+    assert cache.get('b') is second and cache.size == 70
+    # a replaced entry is not charged for its predecessor's data
+    cache.set('b', {}, 10)
+    cache.grow('b', second, 30)
+    assert cache.size == 10
+
+def test_new_build_invalidates_pages_and_etags(client, monkeypatch):
+    store.app.config['PAGE_CACHE_ENABLED'] = True
+    first = client.get('/')
+    etag = first.get_etag()[0]
+    assert client.get('/', headers={'If-None-Match': f'"{etag}"'}).status_code == 304
+    # a deploy with another stylesheet: the old page names an asset the new build no longer serves
+    monkeypatch.setattr(store, 'BUILD_FINGERPRINT', 'another build')
+    response = client.get('/', headers={'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 200
+    assert response.get_etag()[0] != etag
+
+def test_reports_default_window_follows_the_date(client, monkeypatch):
+    store.app.config['PAGE_CACHE_ENABLED'] = True
+    today = store.date(2026, 3, 10)
+    class Clock(store.date):
+        @classmethod
+        def today(cls):
+            return today
+    monkeypatch.setattr(store, 'date', Clock)
+    first = client.get('/reports')
+    assert b'2026-03-10' in first.data
+    etag = first.get_etag()[0]
+    # nothing was written overnight, yet the next day's page is a new one
+    today = store.date(2026, 3, 11)
+    response = client.get('/reports', headers={'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 200
+    assert b'2026-03-11' in response.data
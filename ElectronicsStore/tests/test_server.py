@@ -0,0 +1,33 @@
+import subprocess
+import sys
+from pathlib import Path
+
+# serve() installs signal handlers and forks, so it runs in a process of its own
+SUPERVISE = '''
+import os, signal, sys, threading
+import server
+def run_worker(sock, threads):
+    handlers = signal.getsignal(signal.SIGTERM) == signal.SIG_DFL, signal.getsignal(signal.SIGINT) == signal.SIG_DFL
+    # one write() per line: parent and worker share the pipe
+    os.write(1, f'worker handlers {handlers[0]} {handlers[1]}\\n'.encode())
+    raise RuntimeError('broken at startup')
+server.run_worker = run_worker
+threading.Timer(float(sys.argv[1]), os.kill, (os.getpid(), signal.SIGTERM)).start()
+server.serve(server.listen('127.0.0.1', 0), 1, 1, log=lambda line: os.write(1, f'{line}\\n'.encode()))
+'''
+
+def supervise(seconds):
+    result = subprocess.run([sys.executable, '-c', SUPERVISE, str(seconds)], capture_output=True, text=True,
+                            cwd=Path(__file__).resolve().parent.parent, timeout=30)
+    return result.stdout.splitlines()
+
+def test_workers_start_with_default_signal_handlers():
+    lines = supervise(0.3)
+    assert 'worker handlers True True' in lines
+
+def test_worker_crashing_at_startup_is_respawned_with_backoff():
+    lines = supervise(2.5)
+    exits = [line for line in lines if ' exited with status 1' in line]
+    # 0.5s, 1s, 2s between attempts instead of a fork loop
+    assert 2 <= len(exits) <= 4
+    assert exits[0].endswith('in 0.5s') and exits[1].endswith('in 1s')
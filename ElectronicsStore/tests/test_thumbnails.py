@@ -0,0 +1,158 @@
+import io
+import logging
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+
+import pytest
+from PIL import Image
+
+import app as store
+import thumbnails
+from thumbnails import PLACEHOLDER_NAME, FetchError, fetch, shrink
+
+def png():
+    # a 1x1 red PNG, built by hand so fetch() can be checked byte for byte
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', 1, 1, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(b'\x00\xff\x00\x00')) + chunk(b'IEND', b''))
+
+def photo(size=(400, 300), mode='RGB'):
+    out = io.BytesIO()
+    Image.new(mode, size, 'red').save(out, 'PNG')
+    return out.getvalue()
+
+LOCAL = frozenset({'127.0.0.1'})
+
+def test_fetch_returns_image(origin):
+    origin.routes['/a.png'] = (200, {'Content-Type': 'image/png'}, png())
+    assert fetch(origin.url('/a.png'), 5, 1 << 20, LOCAL) == (png(), 'png')
+
+@pytest.mark.parametrize('route, message', [
+    ((200, {'Content-Type': 'text/html'}, b'<html>'), 'unsupported content type text/html'),
+    ((404, {}, b'not found'), 'Not Found'),
+    ((200, {'Content-Type': 'image/png'}, b''), 'empty response'),
+    ((200, {'Content-Type': 'image/png'}, b'x' * 101), 'larger than 100 bytes'),
+])
+def test_fetch_refuses_unusable_responses(origin, route, message):
+    origin.routes['/a.png'] = route
+    with pytest.raises(FetchError, match=message):
+        fetch(origin.url('/a.png'), 5, 100, LOCAL)
+
+@pytest.mark.parametrize('host', ['127.0.0.1', 'localhost'])
+def test_fetch_refuses_private_addresses(origin, host):
+    origin.routes['/a.png'] = (200, {'Content-Type': 'image/png'}, png())
+    with pytest.raises(FetchError, match='non-public address'):
+        fetch(origin.url('/a.png', host), 5, 1 << 20)
+    assert origin.hits == []
+
+def test_fetch_checks_every_redirect(origin):
+    # the first hop is trusted, the host it redirects to is not
+    origin.routes['/moved'] = (302, {'Location': 'http://127.0.0.1:{port}/a.png'}, b'')
+    origin.routes['/a.png'] = (200, {'Content-Type': 'image/png'}, png())
+    with pytest.raises(FetchError, match='non-public address'):
+        fetch(origin.url('/moved', 'localhost'), 5, 1 << 20, frozenset({'localhost'}))
+    assert origin.hits == ['/moved']
+
+def test_fetch_refuses_redirect_to_other_schemes(origin):
+    origin.routes['/moved'] = (302, {'Location': 'ftp://127.0.0.1/a.png'}, b'')
+    with pytest.raises(FetchError, match='non-http'):
+        fetch(origin.url('/moved'), 5, 1 << 20, LOCAL)
+
+def test_shrink_fits_the_box():
+    data, ext = shrink(photo((400, 300)), 'png', 192)
+    assert ext == 'jpg'
+    with Image.open(io.BytesIO(data)) as image:
+        assert image.size == (192, 144)
+    # transparency needs PNG
+    data, ext = shrink(photo((100, 300), 'RGBA'), 'png', 192)
+    assert ext == 'png'
+    with Image.open(io.BytesIO(data)) as image:
+        assert image.size == (64, 192)
+
+def test_shrink_refuses_unreadable_images():
+    with pytest.raises(FetchError, match='not a readable image'):
+        shrink(b'GIF89a garbage', 'gif', 192)
+
+def test_shrink_without_pillow_logs_and_keeps_the_original(monkeypatch, caplog):
+    monkeypatch.setattr(thumbnails, 'Image', None)
+    with caplog.at_level(logging.WARNING, logger='thumbnails'):
+        assert shrink(png(), 'png', 192) == (png(), 'png')
+    assert 'Pillow is not installed' in caplog.text
+
+def add_product(image):
+    con = sqlite3.connect(store.DB_PATH)
+    with con:
+        product_id = con.execute(
+            "INSERT INTO products(name, brand, price, stock, category_id, image) VALUES ('Phone', 'B', 10, 1, 1, ?)",
+            (image,)
+        ).lastrowid
+    con.close()
+    return product_id
+
+def fetched(url, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        con = sqlite3.connect(store.DB_PATH)
+        row = con.execute('SELECT file, error FROM product_images WHERE url = ?', (url,)).fetchone()
+        con.close()
+        if row:
+            return row
+        time.sleep(0.02)
+    raise AssertionError(f'{url} was not fetched')
+
+@pytest.fixture
+def trusted_origin(origin):
+    store.app.config['THUMBNAIL_TRUSTED_HOSTS'] = LOCAL
+    yield origin
+    store.app.config['THUMBNAIL_TRUSTED_HOSTS'] = frozenset()
+
+def test_product_thumbnail_fetches_in_background(client, trusted_origin):
+    release = threading.Event()
+    def slow_png():
+        release.wait(5)
+        return photo()
+    trusted_origin.routes['/a.png'] = (200, {'Content-Type': 'image/png'}, slow_png)
+    url = trusted_origin.url('/a.png')
+    product_id = add_product(url)
+
+    # answered while the origin is still holding the image back
+    response = client.get(f'/products/{product_id}/thumbnail')
+    assert response.status_code == 302
+    assert response.location == f'/thumbs/{PLACEHOLDER_NAME}'
+    assert response.cache_control.max_age == 10
+    release.set()
+
+    name, error = fetched(url)
+    assert error is None
+    response = client.get(f'/products/{product_id}/thumbnail')
+    assert response.location == f'/thumbs/{name}'
+    image = client.get(response.location)
+    assert image.status_code == 200
+    assert image.mimetype == 'image/jpeg'
+    with Image.open(io.BytesIO(image.data)) as stored:
+        assert stored.size == (192, 144)
+    assert trusted_origin.hits == ['/a.png']
+
+def test_product_thumbnail_keeps_placeholder_after_failure(client, trusted_origin):
+    url = trusted_origin.url('/missing.png')
+    product_id = add_product(url)
+    assert client.get(f'/products/{product_id}/thumbnail').location == f'/thumbs/{PLACEHOLDER_NAME}'
+    name, error = fetched(url)
+    assert name is None and 'Not Found' in error
+    # not asked for again within THUMBNAIL_RETRY_SECONDS
+    assert client.get(f'/products/{product_id}/thumbnail').location == f'/thumbs/{PLACEHOLDER_NAME}'
+    time.sleep(0.2)
+    assert trusted_origin.hits == ['/missing.png']
+
+def test_product_thumbnail_does_not_fetch_private_urls(client, origin):
+    url = origin.url('/a.png')
+    origin.routes['/a.png'] = (200, {'Content-Type': 'image/png'}, png())
+    product_id = add_product(url)
+    assert client.get(f'/products/{product_id}/thumbnail').location == f'/thumbs/{PLACEHOLDER_NAME}'
+    name, error = fetched(url)
+    assert name is None and 'non-public address' in error
+    assert origin.hits == []
@@ -0,0 +1,152 @@
+# Product image pipeline: fetch a remote image once, shrink it, and keep it on local disk under a
+# name derived from its content, so the file behind a name never changes and can be cached forever.
+# Resizing needs Pillow (in requirements.txt); without it the original image is stored as is, with a
+# warning in the log.
+# Downloads connect only to public addresses, checked after DNS resolution on every hop of a redirect,
+# so a product's image URL cannot be used to reach the store's own network.
+import hashlib
+import http.client
+import io
+import ipaddress
+import logging
+import os
+import socket
+import threading
+import urllib.request
+from pathlib import Path
+
+try:
+    from PIL import Image
+except ImportError:  # listed in requirements.txt; tolerated so a missing install degrades, not breaks
+    Image = None
+
+log = logging.getLogger(__name__)
+
+# raster types only: an SVG from a third party served from our origin could run script
+IMAGE_TYPES = {'image/jpeg': 'jpg', 'image/png': 'png', 'image/gif': 'gif', 'image/webp': 'webp'}
+CONTENT_TYPES = {ext: content_type for content_type, ext in IMAGE_TYPES.items()} | {'svg': 'image/svg+xml'}
+
+PLACEHOLDER_SVG = b'''<svg xmlns="http://www.w3.org/2000/svg" width="150" height="150" viewBox="0 0 150 150">
+<rect width="150" height="150" fill="#eee"/>
+<path d="M45 100l22-28 16 19 11-13 21 22z" fill="#ccc"/><circle cx="95" cy="58" r="9" fill="#ccc"/>
+</svg>
+'''
+
+PLACEHOLDER_NAME = f'{hashlib.sha256(PLACEHOLDER_SVG).hexdigest()}.svg'
+
+class FetchError(Exception):
+    pass
+
+def public_address(host, port):
+    """Resolve host; returns the address to connect to. Raises FetchError unless every address is public."""
+    try:
+        addresses = [info[4][0] for info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)]
+    except (OSError, UnicodeError) as e:
+        raise FetchError(f'cannot resolve {host}: {e}') from e
+    for address in addresses:
+        ip = ipaddress.ip_address(address)
+        if not ip.is_global or ip.is_multicast:
+            raise FetchError(f'{host} resolves to non-public address {ip}')
+    return addresses[0]
+
+class GuardedHTTPConnection(http.client.HTTPConnection):
+    # hosts in trusted_hosts skip the address check (an image server on the local network, tests)
+    def __init__(self, *args, trusted_hosts=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.trusted_hosts = trusted_hosts
+
+    def connect(self):
+        host = self.host if self.host in self.trusted_hosts else public_address(self.host, self.port)
+        self.sock = socket.create_connection((host, self.port), self.timeout, self.source_address)
+
+class GuardedHTTPSConnection(http.client.HTTPSConnection, GuardedHTTPConnection):
+    # HTTPSConnection.connect() wraps the socket made by GuardedHTTPConnection.connect()
+    def __init__(self, *args, trusted_hosts=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.trusted_hosts = trusted_hosts
+
+class GuardedHTTPHandler(urllib.request.HTTPHandler):
+    def __init__(self, trusted_hosts):
+        super().__init__()
+        self.trusted_hosts = trusted_hosts
+
+    def http_open(self, req):
+        return self.do_open(GuardedHTTPConnection, req, trusted_hosts=self.trusted_hosts)
+
+class GuardedHTTPSHandler(urllib.request.HTTPSHandler):
+    def __init__(self, trusted_hosts):
+        super().__init__()
+        self.trusted_hosts = trusted_hosts
+
+    def https_open(self, req):
+        return self.do_open(GuardedHTTPSConnection, req, trusted_hosts=self.trusted_hosts)
+
+class GuardedRedirectHandler(urllib.request.HTTPRedirectHandler):
+    max_redirections = 5
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        # urllib would also follow a redirect to ftp://, which bypasses the address check
+        if not newurl.startswith(('http://', 'https://')):
+            raise FetchError('redirect to a non-http(s) URL')
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+def fetch(url, timeout, max_bytes, trusted_hosts=()):
+    """Download url; returns (bytes, extension). Raises FetchError for anything that is not a usable image."""
+    if not url.startswith(('http://', 'https://')):
+        raise FetchError('not an http(s) URL')
+    request = urllib.request.Request(url, headers={'User-Agent': 'ElectronicsStore-thumbnailer'})
+    # no proxies from the environment: the address check has to see the image server itself
+    opener = urllib.request.build_opener(
+        urllib.request.ProxyHandler({}), GuardedHTTPHandler(trusted_hosts), GuardedHTTPSHandler(trusted_hosts),
+        GuardedRedirectHandler,
+    )
+    try:
+        with opener.open(request, timeout=timeout) as response:
+            content_type = response.headers.get_content_type()
+            if content_type not in IMAGE_TYPES:
+                raise FetchError(f'unsupported content type {content_type}')
+            data = response.read(max_bytes + 1)
+    except (OSError, ValueError, http.client.HTTPException) as e:
+        raise FetchError(str(e) or type(e).__name__) from e
+    if len(data) > max_bytes:
+        raise FetchError(f'larger than {max_bytes} bytes')
+    if not data:
+        raise FetchError('empty response')
+    return data, IMAGE_TYPES[content_type]
+
+def shrink(data, ext, size):
+    """Fit the image into size x size pixels; returns (bytes, extension)."""
+    if Image is None:
+        log.warning('Pillow is not installed; storing a %d-byte %s image without resizing it', len(data), ext)
+        return data, ext
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.thumbnail((size, size))
+            out = io.BytesIO()
+            if image.mode in ('RGBA', 'LA', 'P'):
+                image.save(out, 'PNG', optimize=True)
+                return out.getvalue(), 'png'
+            image.convert('RGB').save(out, 'JPEG', quality=82, optimize=True, progressive=True)
+            return out.getvalue(), 'jpg'
+    except (OSError, ValueError) as e:
+        raise FetchError(f'not a readable image: {e}') from e
+
+class ThumbnailStore:
+    """Files named <sha256 of content>.<ext> under directory/<first two hex digits>/."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def path(self, name):
+        return self.directory / name[:2] / name
+
+    def save(self, data, ext):
+        name = f'{hashlib.sha256(data).hexdigest()}.{ext}'
+        path = self.path(name)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # several workers may store the same image at once; each renames a complete file into place
+            tmp = path.with_name(f'.{name}.{os.getpid()}.{threading.get_ident()}.tmp')
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        return name